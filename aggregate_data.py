@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import zipfile
 import os
 from datetime import datetime
@@ -6,125 +7,235 @@ import shutil
 import re
 from pathlib import Path
 
+import columnar_store
+import compact_dtypes
+import csv_tail
+import csv_writer
+import sensor_loader
+import sorted_runs
+
+# Интервал времени (по часам устройства) для агрегации; пустые строки — вся история.
+# Если интервал задан, читаются только пересекающиеся с ним секции или байты (sensor_loader.py)
+START_TIME = ''
+END_TIME = ''
+
+
+def sum_over_intervals(df, columns, start_times, end_times):
+    """
+    Суммирует столбцы отсортированного по 'timestamp' DataFrame по интервалам (start_time, end_time].
+    Границы всех интервалов находятся одним бинарным поиском, суммы считаются одним np.add.reduceat.
+    Каждый интервал суммируется отдельно (без накопленных сумм с начала данных), поэтому результат
+    не зависит от того, с какой строки прочитаны данные. От Series.sum() он может отличаться
+    в последних разрядах, что ниже точности записи (OUTPUT_PRECISION).
+    """
+    timestamps = df['timestamp'].to_numpy()
+    starts = np.searchsorted(timestamps, start_times.to_numpy(), side='right')
+    ends = np.searchsorted(timestamps, end_times.to_numpy(), side='right')
+    lengths = np.maximum(ends - starts, 0)
+
+    # Пары индексов (начало, конец) для reduceat: четные элементы результата — суммы отрезков.
+    # Для пустого отрезка reduceat возвращает один элемент, поэтому там ставится 0
+    bounds = np.column_stack([starts, starts + lengths]).ravel()
+    sums = {}
+    for column in columns:
+        # Ноль в конце делает допустимой границу, равную числу строк
+        values = np.append(df[column].to_numpy(dtype=np.float64), 0.0)
+        reduced = np.add.reduceat(values, bounds)[::2] if len(bounds) else np.zeros(0)
+        sums[column] = np.where(lengths > 0, reduced, 0.0)
+    return sums
+
+
+# Имена столбцов итоговых файлов merge_data и столбцы, которые должны быть числами
+LOCATION_COLUMNS = ("timestamp", "latitude", "longitude", "speed", "course")
+MOTION_COLUMNS = ("timestamp", "gyro_x", "gyro_y", "gyro_z")
+ACCELERATION_COLUMNS = ("timestamp", "accel_x", "accel_y", "accel_z")
+LOCATION_VALUES = ['latitude', 'longitude', 'speed']
+MOTION_VALUES = ['gyro_x', 'gyro_y', 'gyro_z']
+ACCELERATION_VALUES = ['accel_x', 'accel_y', 'accel_z']
+
+COLUMN_NAMES = [
+    'временной_промежуток_сек',
+    'изменение_широты',
+    'изменение_долготы',
+    'изменение_скорости',
+    'сумма_gyro_x',
+    'сумма_gyro_y',
+    'сумма_accel_x',
+    'сумма_accel_y',
+    'сумма_accel_z',
+]
+# Число знаков после запятой в итоговом файле (см. csv_writer.write_csv): время — до 0,1 мс,
+# координаты — до 1e-9 градуса (около 0,1 мм), остальное — до 1e-6
+OUTPUT_PRECISION = {
+    'временной_промежуток_сек': 4,
+    'изменение_широты': 9,
+    'изменение_долготы': 9,
+    'изменение_скорости': 6,
+    'сумма_gyro_x': 6,
+    'сумма_gyro_y': 6,
+    'сумма_accel_x': 6,
+    'сумма_accel_y': 6,
+    'сумма_accel_z': 6,
+}
+
+
+def parse_timestamp(ts_series):
+    return columnar_store.parse_timestamps(ts_series)
+
+
+def clean_sensor_frame(df, value_columns, runs=None):
+    """
+    Разбирает временные метки и числовые столбцы, удаляет неполные строки и сортирует по времени.
+    runs — отсортированные участки файла (sorted_runs.recorded_runs), если файл прочитан целиком.
+    """
+    df['timestamp'] = parse_timestamp(df['timestamp'])
+    for column in value_columns:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    # Строка заголовка читается как первая строка данных (names=...), поэтому сдвиг на 1
+    return drop_and_sort(df, value_columns, runs, shift=1)
+
+
+def drop_and_sort(df, value_columns, runs=None, shift=0):
+    """
+    Удаляет строки без времени или значений и сортирует по времени.
+    Подходит и для DataFrame из колоночного хранилища: типы столбцов там уже нужные.
+    В компактном режиме (compact_dtypes.COMPACT) значения приводятся к float32 до копирования строк.
+    """
+    df = compact_dtypes.compact_columns(df, value_columns)
+    df = df.dropna(subset=['timestamp'] + value_columns)
+    df = sorted_runs.sort_frame(df, 'timestamp', sorted_runs.runs_after_filter(runs, df.index, shift=shift))
+    df.index = pd.RangeIndex(len(df))
+    return df
+
+
+def load_sensor_data(output_dir, start=None, end=None, runs=None):
+    """
+    Итоговые данные merge_data со временем в [start, end] (None — без ограничения) через
+    sensor_loader.load_window: интервал читается из секций или по индексу времени, вся история —
+    из колоночного хранилища, а без него — из CSV. Разбираются только нужные для агрегации столбцы.
+    runs — отсортированные участки файлов (sorted_runs.recorded_runs) для чтения всей истории.
+    Возвращает (locations_df, motions_df, accelerations_df) или None, если данные не найдены.
+    """
+    runs = (runs or {}) if start is None and end is None else {}
+    frames = []
+    for file_type, columns, values in (('location', LOCATION_COLUMNS, LOCATION_VALUES),
+                                       ('motion', MOTION_COLUMNS, MOTION_VALUES),
+                                       ('acceleration', ACCELERATION_COLUMNS, ACCELERATION_VALUES)):
+        df = sensor_loader.load_window(file_type, start, end, values, list(columns), output_dir)
+        if df is None:
+            return None
+        # Индекс при чтении всей истории — номер строки данных, поэтому сдвиг участков не нужен
+        frames.append(drop_and_sort(df, values, runs.get(file_type)))
+    return tuple(frames)
+
+
+def aggregate_intervals(locations_df, motions_df, accelerations_df):
+    """
+    Строит по одной строке на каждый интервал (start_time, end_time] между соседними GPS-фиксациями:
+    изменения координат и скорости и суммы показаний датчиков внутри интервала.
+    """
+    print("Начинается обработка данных...")
+
+    # Интервалы (start_time, end_time] между соседними GPS-фиксациями
+    start_times = locations_df['timestamp'].iloc[:-1]
+    end_times = locations_df['timestamp'].iloc[1:]
+
+    results = {
+        'временной_промежуток_сек': locations_df['timestamp'].diff().dt.total_seconds().iloc[1:].to_numpy(),
+        'изменение_широты': locations_df['latitude'].diff().iloc[1:].to_numpy(),
+        'изменение_долготы': locations_df['longitude'].diff().iloc[1:].to_numpy(),
+        'изменение_скорости': locations_df['speed'].diff().iloc[1:].to_numpy(),
+    }
+    interval_sums = {
+        **sum_over_intervals(motions_df, ['gyro_x', 'gyro_y'], start_times, end_times),
+        **sum_over_intervals(accelerations_df, ['accel_x', 'accel_y', 'accel_z'], start_times, end_times),
+    }
+    for column, sums in interval_sums.items():
+        results[f'сумма_{column}'] = sums
+
+    result_df = pd.DataFrame(results, columns=COLUMN_NAMES)
+    print("Обработка успешно завершена.")
+
+    return result_df
+
 
-def merge_sensor_data(location_file, motion_file, acceleration_file):
+def merge_sensor_data(location_file, motion_file, acceleration_file, runs=None):
     try:
-        locations_df = pd.read_csv(location_file, names=("timestamp", "latitude", "longitude", "speed", "course"))
-        motions_df = pd.read_csv(motion_file, names=("timestamp", "gyro_x", "gyro_y", "gyro_z"), low_memory=False)
-        accelerations_df = pd.read_csv(acceleration_file, names=("timestamp", "accel_x", "accel_y", "accel_z"), low_memory=False)
+        locations_df = pd.read_csv(location_file, names=LOCATION_COLUMNS)
+        motions_df = pd.read_csv(motion_file, names=MOTION_COLUMNS, low_memory=False)
+        accelerations_df = pd.read_csv(acceleration_file, names=ACCELERATION_COLUMNS, low_memory=False)
         print("Файлы 'location.csv', 'motion.csv' и 'acceleration.csv' успешно загружены.")
     except FileNotFoundError as e:
         print(f"Ошибка: файл не найден. Убедитесь, что {e.filename} находится в правильной директории.")
         return None
 
     try:
-        def parse_timestamp(ts_series):
-            ts_series = ts_series.astype(str).str.replace(r'[+-]\d{4}$', '', regex=True)
-            ts_series = ts_series.apply(
-                lambda x: x + '0' * (6 - len(x.split('.')[-1])) if '.' in x and len(x.split('.')[-1]) < 6 else x)
-            return pd.to_datetime(ts_series, format="%Y-%m-%dT%H:%M:%S.%f", errors='coerce')
-
-        locations_df['timestamp'] = parse_timestamp(locations_df['timestamp'])
-        motions_df['timestamp'] = parse_timestamp(motions_df['timestamp'])
-        accelerations_df['timestamp'] = parse_timestamp(accelerations_df['timestamp'])
-
-        locations_df['latitude'] = pd.to_numeric(locations_df['latitude'], errors='coerce')
-        locations_df['longitude'] = pd.to_numeric(locations_df['longitude'], errors='coerce')
-        locations_df['speed'] = pd.to_numeric(locations_df['speed'], errors='coerce')
-        motions_df['gyro_x'] = pd.to_numeric(motions_df['gyro_x'], errors='coerce')
-        motions_df['gyro_y'] = pd.to_numeric(motions_df['gyro_y'], errors='coerce')
-        motions_df['gyro_z'] = pd.to_numeric(motions_df['gyro_z'], errors='coerce')
-        accelerations_df['accel_x'] = pd.to_numeric(accelerations_df['accel_x'], errors='coerce')
-        accelerations_df['accel_y'] = pd.to_numeric(accelerations_df['accel_y'], errors='coerce')
-        accelerations_df['accel_z'] = pd.to_numeric(accelerations_df['accel_z'], errors='coerce')
-
-        locations_df.dropna(subset=['timestamp', 'latitude', 'longitude', 'speed'], inplace=True)
-        motions_df.dropna(subset=['timestamp', 'gyro_x', 'gyro_y', 'gyro_z'], inplace=True)
-        accelerations_df.dropna(subset=['timestamp', 'accel_x', 'accel_y', 'accel_z'], inplace=True)
-
+        runs = runs or {}
+        locations_df = clean_sensor_frame(locations_df, LOCATION_VALUES, runs.get('location'))
+        motions_df = clean_sensor_frame(motions_df, MOTION_VALUES, runs.get('motion'))
+        accelerations_df = clean_sensor_frame(accelerations_df, ACCELERATION_VALUES, runs.get('acceleration'))
     except Exception as e:
         print(f"Ошибка при преобразовании времени или числовых данных: {e}")
         print(
             "Пожалуйста, убедитесь, что формат времени в файлах соответствует стандарту ISO 8601 (например, 'гггг-ММ-ддTЧЧ:мм:сс.ffffff' или 'гггг-ММ-ддTЧЧ:мм:сс.ffffff+ЧЧММ'), а числовые столбцы содержат только числа.")
         return None
 
-    locations_df = locations_df.sort_values(by='timestamp').reset_index(drop=True)
-    motions_df = motions_df.sort_values(by='timestamp').reset_index(drop=True)
-    accelerations_df = accelerations_df.sort_values(by='timestamp').reset_index(drop=True)
+    return aggregate_intervals(locations_df, motions_df, accelerations_df)
 
-    results = []
 
-    column_names = [
-        'временной_промежуток_сек',
-        'изменение_широты',
-        'изменение_долготы',
-        'изменение_скорости',
-        'сумма_gyro_x',
-        'сумма_gyro_y',
-        'сумма_accel_x',
-        'сумма_accel_y',
-        'сумма_accel_z',
-    ]
+def update_merged_data(output_path, location_file, load_imu, since):
+    """
+    Обновляет итоговый файл после появления новых данных с временными метками не раньше since.
 
-    print("Начинается обработка данных...")
+    Интервалы, закончившиеся до since, не меняются и остаются в файле. Остальные считаются заново
+    начиная с последней GPS-фиксации перед since; load_imu(start) должен вернуть источники данных
+    гироскопа и акселерометра, содержащие как минимум все строки позже start.
+    Результат совпадает с полным пересчетом merge_sensor_data.
+    """
+    locations_df = clean_sensor_frame(pd.read_csv(location_file, names=LOCATION_COLUMNS), LOCATION_VALUES)
+    if locations_df.empty:
+        return None
 
-    for i in range(1, len(locations_df)):
-        start_time = locations_df.loc[i - 1, 'timestamp']
-        end_time = locations_df.loc[i, 'timestamp']
-
-        time_delta = (end_time - start_time).total_seconds()
-        lat_change = locations_df.loc[i, 'latitude'] - locations_df.loc[i - 1, 'latitude']
-        lon_change = locations_df.loc[i, 'longitude'] - locations_df.loc[i - 1, 'longitude']
-        speed_change = locations_df.loc[i, 'speed'] - locations_df.loc[i - 1, 'speed']
-
-        motions_in_interval = motions_df[
-            (motions_df['timestamp'] > start_time) & (motions_df['timestamp'] <= end_time)
-            ]
-        gyro_x_sum = motions_in_interval['gyro_x'].sum()
-        gyro_y_sum = motions_in_interval['gyro_y'].sum()
-
-        accels_in_interval = accelerations_df[
-            (accelerations_df['timestamp'] > start_time) & (accelerations_df['timestamp'] <= end_time)
-            ]
-        accel_x_sum = accels_in_interval['accel_x'].sum()
-        accel_y_sum = accels_in_interval['accel_y'].sum()
-        accel_z_sum = accels_in_interval['accel_z'].sum()
-
-        results.append([
-            time_delta,
-            lat_change,
-            lon_change,
-            speed_change,
-            gyro_x_sum,
-            gyro_y_sum,
-            accel_x_sum,
-            accel_y_sum,
-            accel_z_sum,
-        ])
-
-    result_df = pd.DataFrame(results, columns=column_names)
-    print("Обработка успешно завершена.")
+    # Строка i итогового файла — интервал между фиксациями i и i + 1
+    kept_rows = max(int(locations_df['timestamp'].searchsorted(since, side='left')) - 1, 0)
+    locations_df = locations_df.iloc[kept_rows:].reset_index(drop=True)
 
-    return result_df
+    motion_source, acceleration_source = load_imu(locations_df['timestamp'].iloc[0])
+    motions_df = clean_sensor_frame(
+        pd.read_csv(motion_source, names=MOTION_COLUMNS, low_memory=False), MOTION_VALUES)
+    accelerations_df = clean_sensor_frame(
+        pd.read_csv(acceleration_source, names=ACCELERATION_COLUMNS, low_memory=False), ACCELERATION_VALUES)
 
+    tail_df = aggregate_intervals(locations_df, motions_df, accelerations_df)
+    offset = csv_tail.line_offset(output_path, 1 + kept_rows)
+    csv_tail.truncate_and_append(output_path, offset, tail_df, OUTPUT_PRECISION)
+    print(f"Пересчитано интервалов: {len(tail_df)} (без изменений осталось {kept_rows}).")
+    return tail_df
 
-if __name__ == '__main__':
+
+def main():
     output_base_dir = Path("extracted_data")
     consolidated_csv_path = Path('output')
     output_base_dir.mkdir(exist_ok=True)
 
-    merged_df = merge_sensor_data(
-        consolidated_csv_path / "all_location.csv",
-        consolidated_csv_path / 'all_motion.csv',
-        consolidated_csv_path / 'all_acceleration.csv'
-    )
+    runs = {file_type: sorted_runs.recorded_runs(file_type) for file_type in ('location', 'motion', 'acceleration')}
+    frames = load_sensor_data(consolidated_csv_path, START_TIME or None, END_TIME or None, runs)
+    merged_df = None
+    if frames is not None:
+        if START_TIME or END_TIME:
+            print(f"Загружены данные за интервал {START_TIME or 'начало'} - {END_TIME or 'конец'}.")
+        merged_df = aggregate_intervals(*frames)
 
     if merged_df is not None:
         final_output_path = os.path.join(output_base_dir, "final_merged_data.csv")
         try:
-            merged_df.to_csv(final_output_path, index=False, encoding='utf-8-sig', mode='w')
+            csv_writer.write_csv(merged_df, final_output_path, OUTPUT_PRECISION, encoding='utf-8-sig')
             print(f"\nИтоговые объединенные данные сохранены в: {final_output_path}")
         except Exception as e:
             print(f"Не удалось сохранить итоговый объединенный файл: {e}")
     else:
         print("\nНе удалось выполнить окончательное объединение данных.")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,17 +4,28 @@ import os
 import pywt
 import matplotlib.pyplot as plt
 
+import sensor_loader
+
 # --- 1. НАСТРОЙКА ---
 INPUT_DIR = 'output'
 CLEANED_OUTPUT_DIR = 'output_cleaned'
-ACCELERATION_FILE = 'all_acceleration.csv'
-LOCATION_FILE = 'all_location.csv'
-MOTION_FILE = 'all_motion.csv'
+
+# Интервал времени (по часам устройства); пустые строки — вся история (см. sensor_loader.load_window)
+START_TIME = ''
+END_TIME = ''
 
 TIMESTAMP_COLUMN = 'timestamp'
 ACC_COLUMN_NAMES = ['timestamp', 'ax', 'ay', 'az']
 COLUMNS_TO_FILTER = ['ax', 'ay', 'az']
 
+# Выравнивание данных: к каждому отсчету акселерометра присоединяется ближайший по времени отсчет
+# движения и GPS-фиксация ('nearest') или последние не позже него ('backward'), не дальше допуска.
+# 'outer' — прежнее внешнее объединение по точному совпадению времени (строк в разы больше, почти все с пропусками)
+ALIGN_MODE = 'nearest'
+# Допуски в миллисекундах: датчики движения пишутся с частотой 100 Гц, GPS — раз в секунду
+MOTION_TOLERANCE_MS = 10
+LOCATION_TOLERANCE_MS = 1000
+
 # <<< НОВЫЕ ПАРАМЕТРЫ: ОГРАНИЧЕНИЕ ВЫБРОСОВ (КЛИППИНГ) ---
 # Установите в True, чтобы активировать шаг ограничения выбросов
 ENABLE_CLIPPING = True
@@ -45,17 +56,19 @@ def main():
 
     # --- 3. ЗАГРУЗКА И ОБЪЕДИНЕНИЕ ДАННЫХ (без изменений) ---
     try:
-        # ... (код загрузки и объединения без изменений)
-        acc_path = os.path.join(INPUT_DIR, ACCELERATION_FILE)
-        loc_path = os.path.join(INPUT_DIR, LOCATION_FILE)
-        mot_path = os.path.join(INPUT_DIR, MOTION_FILE)
-
-        df_loc = pd.read_csv(loc_path)
-        df_mot = pd.read_csv(mot_path)
-        df_acc = pd.read_csv(acc_path, header=None)
-        df_acc.columns = ACC_COLUMN_NAMES
-
-        if TIMESTAMP_COLUMN in df_acc.columns and TIMESTAMP_COLUMN in df_loc.columns and TIMESTAMP_COLUMN in df_mot.columns:
+        # Время уже разобрано в datetime64, значения — числа (в компактном режиме float32)
+        start, end = START_TIME or None, END_TIME or None
+        df_loc = sensor_loader.load_window('location', start, end, output_dir=INPUT_DIR)
+        df_mot = sensor_loader.load_window('motion', start, end, output_dir=INPUT_DIR)
+        df_acc = sensor_loader.load_window('acceleration', start, end, names=ACC_COLUMN_NAMES, output_dir=INPUT_DIR)
+        if df_loc is None or df_mot is None or df_acc is None:
+            return
+
+        if ALIGN_MODE != 'outer':
+            # Одна строка на отсчет акселерометра, без пропусков от несовпадающих меток времени
+            df_merged = sensor_loader.align(df_acc, df_mot, f'{MOTION_TOLERANCE_MS}ms', ALIGN_MODE)
+            df_merged = sensor_loader.align(df_merged, df_loc, f'{LOCATION_TOLERANCE_MS}ms', ALIGN_MODE)
+        elif TIMESTAMP_COLUMN in df_acc.columns and TIMESTAMP_COLUMN in df_loc.columns and TIMESTAMP_COLUMN in df_mot.columns:
             df_merged = pd.merge(df_loc, df_mot, on=TIMESTAMP_COLUMN, how='outer')
             df_merged = pd.merge(df_merged, df_acc, on=TIMESTAMP_COLUMN, how='outer')
             df_merged = df_merged.sort_values(by=TIMESTAMP_COLUMN).reset_index(drop=True)
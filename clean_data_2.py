@@ -4,22 +4,30 @@ import os
 import pywt
 import matplotlib.pyplot as plt
 
+import sensor_loader
+
 # --- 1. НАСТРОЙКА ---
 INPUT_DIR = 'output'
 CLEANED_OUTPUT_DIR = 'output_cleaned'
-ACCELERATION_FILE = 'all_acceleration.csv'
-LOCATION_FILE = 'all_location.csv'
-MOTION_FILE = 'all_motion.csv'
+
+# Интервал времени (по часам устройства); пустые строки — вся история (см. sensor_loader.load_window)
+START_TIME = ''
+END_TIME = ''
 
 # Имя колонки для объединения. Должно совпадать с именем в ACC_COLUMN_NAMES
 TIMESTAMP_COLUMN = 'timestamp'
 
-# <<< ИЗМЕНЕНИЕ: Задаем имена столбцов для файла all_acceleration.csv
-# !!! ВАЖНО: Проверьте и при необходимости измените этот список в соответствии
-# с реальным порядком столбцов в вашем файле.
-# Например, если у вас нет временной метки, используйте: ['ax', 'ay', 'az']
+# Имена столбцов файла all_acceleration.csv по порядку (заголовок файла заменяется ими)
 ACC_COLUMN_NAMES = ['timestamp', 'ax', 'ay', 'az']
 
+# Выравнивание данных: к каждому отсчету акселерометра присоединяется ближайший по времени отсчет
+# движения и GPS-фиксация ('nearest') или последние не позже него ('backward'), не дальше допуска.
+# 'outer' — прежнее внешнее объединение по точному совпадению времени (строк в разы больше, почти все с пропусками)
+ALIGN_MODE = 'nearest'
+# Допуски в миллисекундах: датчики движения пишутся с частотой 100 Гц, GPS — раз в секунду
+MOTION_TOLERANCE_MS = 10
+LOCATION_TOLERANCE_MS = 1000
+
 # Имена столбцов, которые мы будем фильтровать
 COLUMNS_TO_FILTER = ['ax', 'ay', 'az']
 
@@ -50,32 +58,24 @@ def main():
 
     # --- 3. ЗАГРУЗКА И ОБЪЕДИНЕНИЕ ДАННЫХ ---
     try:
-        acc_path = os.path.join(INPUT_DIR, ACCELERATION_FILE)
-        loc_path = os.path.join(INPUT_DIR, LOCATION_FILE)
-        mot_path = os.path.join(INPUT_DIR, MOTION_FILE)
-
-        # Предполагаем, что в этих файлах заголовки есть
-        df_loc = pd.read_csv(loc_path)
-        df_mot = pd.read_csv(mot_path)
-
-        # <<< ИЗМЕНЕНИЕ: Читаем файл акселерометра без заголовка
-        print(f"Чтение файла '{ACCELERATION_FILE}' без заголовков...")
-        df_acc = pd.read_csv(acc_path, header=None)
-
-        # <<< ИЗМЕНЕНИЕ: Присваиваем имена столбцов
-        print(f"Присвоение имен столбцов: {ACC_COLUMN_NAMES}")
-        df_acc.columns = ACC_COLUMN_NAMES
-
-    except FileNotFoundError as e:
-        print(f"Ошибка: Не найден файл - {e.filename}")
-        print("Пожалуйста, убедитесь, что файлы из предыдущего шага находятся в папке 'output'.")
-        return
+        # Время уже разобрано в datetime64, значения — числа (в компактном режиме float32)
+        start, end = START_TIME or None, END_TIME or None
+        df_loc = sensor_loader.load_window('location', start, end, output_dir=INPUT_DIR)
+        df_mot = sensor_loader.load_window('motion', start, end, output_dir=INPUT_DIR)
+        df_acc = sensor_loader.load_window('acceleration', start, end, names=ACC_COLUMN_NAMES, output_dir=INPUT_DIR)
+        if df_loc is None or df_mot is None or df_acc is None:
+            print("Пожалуйста, убедитесь, что файлы из предыдущего шага находятся в папке 'output'.")
+            return
     except Exception as e:
         print(f"Произошла ошибка при загрузке данных: {e}")
         return
 
     # Объединение данных
-    if TIMESTAMP_COLUMN in df_acc.columns and TIMESTAMP_COLUMN in df_loc.columns and TIMESTAMP_COLUMN in df_mot.columns:
+    if ALIGN_MODE != 'outer':
+        print(f"Выравнивание данных по отсчетам акселерометра ({ALIGN_MODE})...")
+        df_merged = sensor_loader.align(df_acc, df_mot, f'{MOTION_TOLERANCE_MS}ms', ALIGN_MODE)
+        df_merged = sensor_loader.align(df_merged, df_loc, f'{LOCATION_TOLERANCE_MS}ms', ALIGN_MODE)
+    elif TIMESTAMP_COLUMN in df_acc.columns and TIMESTAMP_COLUMN in df_loc.columns and TIMESTAMP_COLUMN in df_mot.columns:
         print(f"Объединение данных по колонке '{TIMESTAMP_COLUMN}'...")
         df_merged = pd.merge(df_loc, df_mot, on=TIMESTAMP_COLUMN, how='outer')
         df_merged = pd.merge(df_merged, df_acc, on=TIMESTAMP_COLUMN, how='outer')
@@ -3,11 +3,27 @@
 Script to clean speed_interpolated_improved.csv by removing rows where ax, ay, az or speed are null/empty
 """
 
+import io
 import pandas as pd
 import os
 
+import compact_dtypes
+import csv_tail
+import csv_writer
+import interpolate_improved
+
+INPUT_FILE = 'output_cleaned/speed_interpolated_improved.csv'
+OUTPUT_FILE = 'output/final_merged_data.csv'
+REQUIRED_COLUMNS = ['x_accel', 'y_accel', 'z_accel', 'speed']
+# Decimal places per column: the input file's own precision, so rows are written back unchanged
+OUTPUT_PRECISION = interpolate_improved.OUTPUT_PRECISION
+# Numeric value and 0/1 flag columns of the input: read as float32/int8 in compact mode
+# (see compact_dtypes.read_csv_dtypes), otherwise with pandas defaults
+VALUE_COLUMNS = REQUIRED_COLUMNS + ['speed_change']
+FLAG_COLUMNS = ['speed_source']
+
 def clean_null_values():
-    input_file = 'output_cleaned/speed_interpolated_improved.csv'
+    input_file = INPUT_FILE
     
     # Check if file exists
     if not os.path.exists(input_file):
@@ -16,26 +32,40 @@ def clean_null_values():
     
     # Read the CSV file
     print(f"Reading {input_file}...")
-    df = pd.read_csv(input_file)
+    df = pd.read_csv(input_file, dtype=compact_dtypes.read_csv_dtypes(VALUE_COLUMNS, FLAG_COLUMNS))
     
     print(f"Original number of rows: {len(df)}")
     
     # Count rows with null values in the specified columns
-    null_mask = df[['x_accel', 'y_accel', 'z_accel', 'speed']].isnull().any(axis=1)
+    null_mask = df[REQUIRED_COLUMNS].isnull().any(axis=1)
     null_count = null_mask.sum()
     
     print(f"Rows with null values in x_accel, y_accel, z_accel, or speed: {null_count}")
     
     # Remove rows where x_accel, y_accel, z_accel, or speed are null
-    df_cleaned = df.dropna(subset=['x_accel', 'y_accel', 'z_accel', 'speed'])
+    df_cleaned = df.dropna(subset=REQUIRED_COLUMNS)
     
     print(f"Number of rows after cleaning: {len(df_cleaned)}")
     print(f"Removed {len(df) - len(df_cleaned)} rows")
     
     # Save the cleaned data to output/final_merged_data.csv
-    output_file = 'output/final_merged_data.csv'
-    df_cleaned.to_csv(output_file, index=False)
+    output_file = OUTPUT_FILE
+    csv_writer.write_csv(df_cleaned, output_file, OUTPUT_PRECISION)
     print(f"Cleaned data saved to {output_file}")
 
+def update_cleaned_values(since):
+    """
+    Re-clean only the rows of the input file starting at `since` (the input must be sorted by time)
+    and replace the corresponding tail of the output file. Rows before `since` are kept as is.
+    """
+    input_offset = csv_tail.find_time_offset(INPUT_FILE, since)
+    df = pd.read_csv(io.BytesIO(csv_tail.read_tail(INPUT_FILE, input_offset)),
+                     dtype=compact_dtypes.read_csv_dtypes(VALUE_COLUMNS, FLAG_COLUMNS))
+    df_cleaned = df.dropna(subset=REQUIRED_COLUMNS)
+
+    output_offset = csv_tail.find_time_offset(OUTPUT_FILE, since)
+    csv_tail.truncate_and_append(OUTPUT_FILE, output_offset, df_cleaned, OUTPUT_PRECISION)
+    print(f"Updated {OUTPUT_FILE}: {len(df_cleaned)} rows rewritten from {since}")
+
 if __name__ == "__main__":
     clean_null_values()
\ No newline at end of file
@@ -0,0 +1,262 @@
+"""
+Колоночное хранилище итоговых файлов merge_data: время разбирается один раз при загрузке
+в int64 (наносекунды от эпохи), дальше загрузчики берут его без разбора строк.
+
+Время хранится по часам устройства, а не в UTC: так хранилище совпадает с текстом all_*.csv
+строка в строку, и интервалы по местному времени выбираются без пересчета. Смещение от UTC
+записывается отдельно для каждой сессии (schema['sessions'][i]['utc_offset'], см. row_utc_offsets);
+время UTC — время устройства минус смещение (load_columns(utc=True), sensor_loader.load_window).
+"""
+import io
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import timestamp_parser
+
+# Папка хранилища внутри выходной папки merge_data: store/<тип файла>/<столбец>.bin + schema.json
+STORE_DIRNAME = 'store'
+SCHEMA_FILENAME = 'schema.json'
+STORE_VERSION = 1
+
+TIMESTAMP_COLUMN = 'timestamp'
+# Типы столбцов: время — int64 (наносекунды от эпохи по часам устройства), значения — float64
+TIMESTAMP_DTYPE = 'int64'
+VALUE_DTYPE = 'float64'
+
+
+def store_path(output_dir: str, file_type: str) -> str:
+    return os.path.join(output_dir, STORE_DIRNAME, file_type)
+
+
+def load_schema(output_dir: str, file_type: str) -> dict | None:
+    """
+    Схема хранилища одного типа файла или None, если хранилища нет или оно другой версии.
+    """
+    try:
+        with open(os.path.join(store_path(output_dir, file_type), SCHEMA_FILENAME), 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return schema if schema.get('version') == STORE_VERSION else None
+
+
+def _source_signature(csv_path: str) -> dict | None:
+    try:
+        stat = os.stat(csv_path)
+    except FileNotFoundError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_current(output_dir: str, csv_filename: str, file_type: str, schema: dict | None = None) -> bool:
+    """
+    Хранилище соответствует текущему итоговому CSV-файлу (он не менялся после записи хранилища).
+    """
+    schema = schema or load_schema(output_dir, file_type)
+    return schema is not None and schema['source'] == _source_signature(os.path.join(output_dir, csv_filename))
+
+
+def parse_timestamps(values) -> pd.Series:
+    """
+    Единственное место, где временные метки разбираются из текста. Суффикс часового пояса
+    отбрасывается: время остается локальным по часам устройства, как во всех итоговых файлах
+    (смещение от UTC хранится отдельно, см. load_columns). Дробная часть — не меньше одного знака.
+    Некорректные значения дают NaT. Разбор векторный, см. timestamp_parser.py.
+    """
+    values = pd.Series(values, copy=False)
+    parsed = timestamp_parser.parse_iso_timestamps(values.to_numpy(dtype=object)).view('datetime64[ns]')
+    return pd.Series(parsed, index=values.index, name=values.name)
+
+
+def parse_stream(data: bytes, columns: list[str], usecols: list[str] | None = None) -> dict[str, np.ndarray]:
+    """
+    Разбирает отрезок итогового CSV-файла (без заголовка) в массивы столбцов.
+    Каждой строке отрезка соответствует ровно одна строка хранилища: пустые и некорректные строки
+    дают NaT/NaN, которые загрузчики отбрасывают так же, как при чтении CSV.
+    usecols — столбцы значений, которые нужно разобрать (по умолчанию все); время разбирается всегда.
+    """
+    usecols = columns[1:] if usecols is None else [column for column in columns[1:] if column in usecols]
+    # Время разбирается прямо из байтов, без строк Python; read_csv читает только значения
+    arrays = {TIMESTAMP_COLUMN: timestamp_parser.parse_csv_timestamps(data)}
+    if not usecols:
+        return arrays
+    df = pd.read_csv(io.BytesIO(data), header=None, names=columns, usecols=usecols,
+                     skip_blank_lines=False, low_memory=False)
+    if len(df) != len(arrays[TIMESTAMP_COLUMN]):
+        raise ValueError("число строк значений не совпадает с числом временных меток")
+    for column in usecols:
+        arrays[column] = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=VALUE_DTYPE)
+    return arrays
+
+
+def empty_frame(columns: list[str], usecols: list[str] | None = None) -> pd.DataFrame:
+    """
+    Пустой DataFrame со столбцами, которые вернул бы parse_stream (время — int64 наносекунд).
+    """
+    names = [column for column in columns if column == TIMESTAMP_COLUMN or usecols is None or column in usecols]
+    return pd.DataFrame({column: np.zeros(0, dtype=TIMESTAMP_DTYPE if column == TIMESTAMP_COLUMN else VALUE_DTYPE)
+                         for column in names})
+
+
+def _open_columns(path: str, schema: dict) -> dict[str, np.ndarray]:
+    arrays = {}
+    for column in schema['columns']:
+        if schema['rows'] == 0:
+            arrays[column['name']] = np.zeros(0, dtype=column['dtype'])
+        else:
+            arrays[column['name']] = np.memmap(os.path.join(path, column['name'] + '.bin'),
+                                               dtype=column['dtype'], mode='r', shape=(schema['rows'],))
+    return arrays
+
+
+def update_store(output_dir: str, file_types: dict, file_headers: dict, archives: list[dict]) -> None:
+    """
+    Записывает рядом с итоговыми CSV-файлами колоночное хранилище: по одному двоичному файлу
+    фиксированного типа на столбец и schema.json. Строки идут в том же порядке, что и в CSV.
+
+    Данные сессий, которые уже есть в текущем хранилище, копируются из него без разбора текста;
+    разбираются только отрезки CSV новых сессий. Новое хранилище пишется во временную папку
+    и заменяет старое целиком.
+    """
+    for file_type, csv_filename in file_types.items():
+        columns = file_headers[file_type].split(',')
+        path = store_path(output_dir, file_type)
+        csv_path = os.path.join(output_dir, csv_filename)
+
+        old_schema = load_schema(output_dir, file_type)
+        if old_schema is not None and old_schema['columns'] != _schema_columns(columns):
+            old_schema = None
+        old_arrays = _open_columns(path, old_schema) if old_schema else {}
+        old_sessions = {session['session']: session for session in old_schema['sessions']} if old_schema else {}
+
+        streams = sorted((archive['streams'][file_type], archive['session'], session_utc_offset(archive))
+                         for archive in archives if file_type in archive['streams'])
+        sessions = []
+        start = 0
+        for (_, _, lines), session, utc_offset in streams:
+            sessions.append({'session': session, 'start': start, 'rows': lines, 'utc_offset': utc_offset})
+            start += lines
+        if old_schema and old_schema['sessions'] == sessions and is_current(output_dir, csv_filename, file_type,
+                                                                            old_schema):
+            continue
+
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        outputs = {column: open(os.path.join(tmp_path, column + '.bin'), 'wb') for column in columns}
+        try:
+            with open(csv_path, 'rb') as csv_file:
+                for ((offset, length, lines), session, _), entry in zip(streams, sessions):
+                    old = old_sessions.get(session)
+                    if old is not None and old['rows'] == lines:
+                        arrays = {column: old_arrays[column][old['start']:old['start'] + lines] for column in columns}
+                    else:
+                        csv_file.seek(offset)
+                        arrays = parse_stream(csv_file.read(length), columns)
+                        if len(arrays[TIMESTAMP_COLUMN]) != lines:
+                            raise ValueError(f"число строк сессии {session} не совпадает с CSV")
+                    for column in columns:
+                        outputs[column].write(np.ascontiguousarray(arrays[column]).tobytes())
+        except Exception as e:
+            print(f"Не удалось записать колоночное хранилище для {csv_filename}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            continue
+        finally:
+            for output in outputs.values():
+                output.close()
+            old_arrays.clear()
+
+        with open(os.path.join(tmp_path, SCHEMA_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': STORE_VERSION,
+                'rows': start,
+                'columns': _schema_columns(columns),
+                'sessions': sessions,
+                'source': _source_signature(csv_path),
+            }, f, ensure_ascii=False, indent=1)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        print(f"      -> Обновлено колоночное хранилище {os.path.join(STORE_DIRNAME, file_type)} ({start} строк)")
+
+
+def session_utc_offset(archive: dict) -> int | None:
+    """
+    Смещение часов сессии от UTC в секундах, записанное при загрузке (см. merge_data.parse_utc_offset).
+    Суффикс часового пояса есть не во всех CSV-файлах сессии, но все они пишутся по одним часам,
+    поэтому смещение одно на сессию. None — смещение неизвестно.
+    """
+    return next((offset for offset in archive.get('utc_offsets', {}).values() if offset is not None), None)
+
+
+def _schema_columns(columns: list[str]) -> list[dict]:
+    return [{'name': column, 'dtype': TIMESTAMP_DTYPE if column == TIMESTAMP_COLUMN else VALUE_DTYPE}
+            for column in columns]
+
+
+def row_utc_offsets(schema: dict) -> np.ndarray:
+    """
+    Смещение от UTC в секундах для каждой строки хранилища (по сессиям из схемы).
+    Сессии с неизвестным смещением считаются записанными в UTC.
+    """
+    return np.repeat(np.array([session.get('utc_offset') or 0 for session in schema['sessions']], dtype=np.int64),
+                     [session['rows'] for session in schema['sessions']])
+
+
+def _utc_timestamps(timestamps: np.ndarray, schema: dict) -> pd.DatetimeIndex:
+    utc = timestamps.view('datetime64[ns]') - row_utc_offsets(schema).astype('timedelta64[s]')
+    return pd.DatetimeIndex(utc).tz_localize('UTC')
+
+
+def load_columns(output_dir: str, csv_filename: str, file_type: str,
+                 columns: list[str] | None = None, utc: bool = False) -> pd.DataFrame | None:
+    """
+    Открывает хранилище одного типа файла как DataFrame, не копируя данные (столбцы — np.memmap
+    только для чтения). Время возвращается как datetime64[ns] по часам устройства, как в CSV;
+    при utc=True — как время UTC с учетом смещения каждой сессии (столбец времени при этом копируется).
+    Пустые строки CSV отбрасываются.
+    Возвращает None, если хранилища нет или оно не соответствует текущему CSV-файлу.
+    """
+    schema = load_schema(output_dir, file_type)
+    if schema is None or not is_current(output_dir, csv_filename, file_type, schema):
+        return None
+
+    arrays = _open_columns(store_path(output_dir, file_type), schema)
+    names = [column['name'] for column in schema['columns']
+             if columns is None or column['name'] == TIMESTAMP_COLUMN or column['name'] in columns]
+    data = {name: arrays[name].view('datetime64[ns]') if name == TIMESTAMP_COLUMN else arrays[name]
+            for name in names}
+    if utc:
+        data[TIMESTAMP_COLUMN] = _utc_timestamps(arrays[TIMESTAMP_COLUMN], schema)
+    df = pd.DataFrame(data, copy=False)
+
+    # Пустые строки CSV (read_csv их пропускает) — строки без времени и без значений
+    blank = df[TIMESTAMP_COLUMN].isna()
+    if blank.any():
+        values = [name for name in names if name != TIMESTAMP_COLUMN]
+        blank &= df[values].isna().all(axis=1) if values else blank
+        if blank.any():
+            df = df[~blank]
+    return df
+
+
+def session_columns(output_dir: str, csv_filename: str,
+                    file_type: str) -> dict[str, dict[str, np.ndarray]] | None:
+    """
+    Столбцы хранилища по сессиям: {сессия: {столбец: массив}} (срезы np.memmap, без копирования).
+    Время — int64 по часам устройства, NaT — строки без корректного времени.
+    Возвращает None, если хранилища нет или оно не соответствует текущему CSV-файлу.
+    """
+    schema = load_schema(output_dir, file_type)
+    if schema is None or not is_current(output_dir, csv_filename, file_type, schema):
+        return None
+
+    arrays = _open_columns(store_path(output_dir, file_type), schema)
+    return {session['session']: {name: values[session['start']:session['start'] + session['rows']]
+                                 for name, values in arrays.items()}
+            for session in schema['sessions']}
@@ -0,0 +1,99 @@
+import os
+
+import pandas as pd
+
+import csv_writer
+
+# Размер блока при поиске границ строк в файле
+SEARCH_CHUNK_SIZE = 64 * 1024
+
+
+def _next_line_start(f, pos: int) -> int:
+    """
+    Начало первой строки, которая начинается не раньше позиции pos.
+    """
+    if pos == 0:
+        return 0
+    f.seek(pos - 1)
+    while chunk := f.read(SEARCH_CHUNK_SIZE):
+        newline = chunk.find(b'\n')
+        if newline >= 0:
+            return pos + newline
+        pos += len(chunk)
+    return pos
+
+
+def data_start(path: str) -> int:
+    """
+    Смещение первой строки данных (после строки заголовка).
+    """
+    with open(path, 'rb') as f:
+        f.readline()
+        return f.tell()
+
+
+def find_time_offset(path: str, timestamp) -> int:
+    """
+    Смещение первой строки данных, у которой временная метка (первый столбец) не меньше timestamp.
+    Файл должен быть отсортирован по времени; поиск двоичный, читается лишь несколько строк.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    with open(path, 'rb') as f:
+        f.readline()
+        lo = f.tell()
+        hi = f.seek(0, os.SEEK_END)
+
+        def line_at(start):
+            f.seek(start)
+            line = f.readline()
+            return pd.Timestamp(line.split(b',', 1)[0].decode('utf-8')), start + len(line)
+
+        while lo < hi:
+            start = _next_line_start(f, (lo + hi) // 2)
+            if start >= hi:
+                start = lo
+            value, end = line_at(start)
+            if value < timestamp:
+                lo = end
+            else:
+                hi = start
+        return lo
+
+
+def line_offset(path: str, count: int) -> int:
+    """
+    Смещение сразу после первых count строк файла (или размер файла, если строк меньше).
+    """
+    offset = 0
+    with open(path, 'rb') as f:
+        while count > 0 and (chunk := f.read(SEARCH_CHUNK_SIZE)):
+            lines = chunk.count(b'\n')
+            if lines < count:
+                count -= lines
+                offset += len(chunk)
+                continue
+            position = -1
+            for _ in range(count):
+                position = chunk.find(b'\n', position + 1)
+            return offset + position + 1
+    return offset
+
+
+def read_tail(path: str, offset: int) -> bytes:
+    """
+    Строка заголовка и все данные файла начиная с offset.
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(offset)
+        return header + f.read()
+
+
+def truncate_and_append(path: str, offset: int, df: pd.DataFrame, precision: dict | None = None) -> None:
+    """
+    Обрезает файл по смещению offset и дописывает строки df без заголовка
+    (числа — с точностью precision, см. csv_writer.write_csv).
+    """
+    with open(path, 'r+b') as f:
+        f.truncate(offset)
+    csv_writer.write_csv(df, path, precision, header=False, mode='a')
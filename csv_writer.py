@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+
+# Сколько строк форматируется и пишется за один раз
+WRITE_BLOCK_ROWS = 1 << 16
+# Наибольшее число знаков после запятой, при котором число форматируется целочисленной арифметикой
+MAX_FAST_PRECISION = 9
+# Точность времени по умолчанию, как у DataFrame.to_csv: наименьшая из секунд, мс, мкс и нс,
+# при которой все метки столбца записываются без потерь
+TIME_PRECISIONS = [0, 3, 6, 9]
+
+DIGITS = np.uint8(ord('0'))
+
+
+def _digit_count(values: np.ndarray) -> np.ndarray:
+    count = np.ones(len(values), dtype=np.int64)
+    power = 10
+    for _ in range(18):
+        count += values >= power
+        power *= 10
+    return count
+
+
+def _put_number(matrix: np.ndarray, column: int, values: np.ndarray, width: int) -> None:
+    """
+    Записывает неотрицательные целые числа цифрами, выровненными по правому краю в width позициях
+    матрицы байтов, начиная со столбца column. Ведущие нули не пишутся (остаются нулевыми байтами).
+    """
+    count = _digit_count(values)
+    remaining = values.copy()
+    for position in range(column + width - 1, column - 1, -1):
+        digit = remaining % 10
+        remaining //= 10
+        matrix[:, position] = np.where(column + width - position <= count, digit + DIGITS, 0)
+
+
+def _put_fixed(matrix: np.ndarray, column: int, values: np.ndarray, width: int) -> None:
+    """
+    Записывает неотрицательные целые числа ровно в width позициях, с ведущими нулями.
+    """
+    remaining = values.copy()
+    for position in range(column + width - 1, column - 1, -1):
+        matrix[:, position] = remaining % 10 + DIGITS
+        remaining //= 10
+
+
+def _format_scaled(scaled: np.ndarray, negative: np.ndarray, precision: int) -> np.ndarray:
+    """
+    Матрица байтов чисел scaled / 10 ** precision (scaled — модули, неотрицательные int64).
+    """
+    whole, fraction = np.divmod(scaled, 10 ** precision)
+    whole_width = int(_digit_count(whole).max()) if len(whole) else 1
+    width = 1 + whole_width + (1 + precision if precision else 0)
+    matrix = np.zeros((len(scaled), width), dtype=np.uint8)
+    _put_number(matrix, 1, whole, whole_width)
+    if precision:
+        matrix[:, 1 + whole_width] = ord('.')
+        _put_fixed(matrix, 2 + whole_width, fraction, precision)
+    # Знак — непосредственно перед первой цифрой; ноль пишется без знака
+    rows = np.flatnonzero(negative & (scaled > 0))
+    matrix[rows, np.argmax(matrix[rows, 1:] != 0, axis=1)] = ord('-')
+    return matrix
+
+
+def format_integers(values: np.ndarray) -> np.ndarray:
+    """
+    Целые числа как матрица байтов (строка, позиция); неиспользуемые позиции — нулевые байты.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    # Модуль наименьшего int64 не представим; такие значения пишутся как ближайшее большее
+    return _format_scaled(np.abs(np.maximum(values, -np.iinfo(np.int64).max)), values < 0, 0)
+
+
+def format_numbers(values: np.ndarray, precision: int) -> np.ndarray | None:
+    """
+    Числа с фиксированным числом знаков после запятой (precision=0 — целые без точки)
+    как матрица байтов (строка, позиция); неиспользуемые позиции — нулевые байты.
+    Пропуски дают пустое поле. Возвращает None, если числа не помещаются в int64 после масштабирования.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = ~np.isfinite(values)
+    scaled = np.abs(np.round(values * 10.0 ** precision))
+    scaled[missing] = 0
+    if len(scaled) and scaled.max() >= 2.0 ** 62:
+        return None
+    matrix = _format_scaled(scaled.astype(np.int64), values < 0, precision)
+    matrix[missing] = 0
+    return matrix
+
+
+def time_precision(values) -> int:
+    """
+    Число знаков дробной части секунд, с которым DataFrame.to_csv записал бы столбец времени.
+    """
+    nanoseconds = np.asarray(values).astype('datetime64[ns]').view(np.int64)
+    nanoseconds = nanoseconds[nanoseconds != np.iinfo(np.int64).min]
+    return next(p for p in TIME_PRECISIONS if not np.any(nanoseconds % 10 ** (9 - p)))
+
+
+def format_timestamps(values: np.ndarray, precision: int | None = None) -> np.ndarray:
+    """
+    Время (datetime64) в виде YYYY-MM-DD HH:MM:SS[.fff] как матрица байтов; NaT — пустое поле.
+    precision — число знаков дробной части (0, 3, 6 или 9); по умолчанию — как у DataFrame.to_csv.
+    """
+    nanoseconds = np.asarray(values).astype('datetime64[ns]').view(np.int64)
+    missing = nanoseconds == np.iinfo(np.int64).min
+    nanoseconds = np.where(missing, 0, nanoseconds)
+    if precision is None:
+        precision = time_precision(values)
+
+    seconds, fraction = np.divmod(nanoseconds, 10 ** 9)
+    days, seconds = np.divmod(seconds, 86400)
+    # Обратное преобразование к timestamp_parser._days_from_civil (алгоритм Хиннанта)
+    days = days + 719468
+    era = np.floor_divide(days, 146097)
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    month = np.where(month_index < 10, month_index + 3, month_index - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+
+    matrix = np.zeros((len(nanoseconds), 19 + (1 + precision if precision else 0)), dtype=np.uint8)
+    for column, number, width in [(0, year, 4), (5, month, 2), (8, day, 2), (11, seconds // 3600, 2),
+                                  (14, seconds // 60 % 60, 2), (17, seconds % 60, 2)]:
+        _put_fixed(matrix, column, number, width)
+    matrix[:, [4, 7]] = ord('-')
+    matrix[:, 10] = ord(' ')
+    matrix[:, [13, 16]] = ord(':')
+    if precision:
+        matrix[:, 19] = ord('.')
+        _put_fixed(matrix, 20, fraction // 10 ** (9 - precision), precision)
+    matrix[missing] = 0
+    return matrix
+
+
+def format_column(values: pd.Series, precision: int | None = None) -> np.ndarray:
+    """
+    Значения столбца как матрица байтов (строка, позиция), нулевые байты не записываются.
+    Числа с заданной точностью и целые форматируются векторно; остальные значения — как строки.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return format_timestamps(values.dt.tz_localize(None) if values.dt.tz is not None else values, precision)
+    if pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype(np.int64)
+    if pd.api.types.is_integer_dtype(values.dtype) and not values.hasnans and not precision:
+        return format_integers(values.to_numpy(dtype=np.int64))
+    if precision is not None and pd.api.types.is_numeric_dtype(values.dtype) and precision <= MAX_FAST_PRECISION:
+        matrix = format_numbers(values.to_numpy(dtype=np.float64, na_value=np.nan), precision)
+        if matrix is not None:
+            return matrix
+        strings = np.char.mod(f'%.{precision}f', values.to_numpy(dtype=np.float64, na_value=np.nan))
+        strings[values.isna().to_numpy()] = ''
+    else:
+        strings = values.astype(str).to_numpy(dtype=str)
+        strings[values.isna().to_numpy()] = ''
+    encoded = np.char.encode(strings, 'utf-8')
+    return encoded.view(np.uint8).reshape(len(encoded), -1) if len(encoded) else np.zeros((0, 1), dtype=np.uint8)
+
+
+def format_block(df: pd.DataFrame, precision: dict) -> bytes:
+    """
+    Строки DataFrame в формате CSV (без заголовка и индекса).
+    """
+    separator = np.full((len(df), 1), ord(','), dtype=np.uint8)
+    parts = []
+    for name in df.columns:
+        parts.extend([format_column(df[name], precision.get(name)), separator])
+    parts[-1] = np.full((len(df), 1), ord('\n'), dtype=np.uint8)
+    matrix = np.hstack(parts)
+    return matrix[matrix != 0].tobytes()
+
+
+def write_csv(df: pd.DataFrame, path: str, precision: dict | None = None, header: bool = True,
+              mode: str = 'w', encoding: str = 'utf-8') -> None:
+    """
+    Замена DataFrame.to_csv(path, index=False) для больших итоговых файлов: столбцы форматируются
+    векторно, числа — с фиксированным числом знаков из precision ({столбец: знаков после запятой},
+    0 — целое), строки пишутся блоками по WRITE_BLOCK_ROWS. Столбцы без точности пишутся как
+    у to_csv: целые — целыми, время — с нужной точностью, вещественные — в кратчайшем представлении.
+    Пропуски дают пустые поля.
+    """
+    precision = dict(precision or {})
+    # Точность времени выбирается по всему столбцу, чтобы она не менялась от блока к блоку
+    for name in df.columns:
+        if name not in precision and pd.api.types.is_datetime64_any_dtype(df[name].dtype):
+            values = df[name].dt.tz_localize(None) if df[name].dt.tz is not None else df[name]
+            precision[name] = time_precision(values)
+    with open(path, mode + 'b') as f:
+        if header:
+            # Метка порядка байтов (utf-8-sig) пишется только в начале файла
+            f.write((','.join(map(str, df.columns)) + '\n').encode(encoding if f.tell() == 0 else 'utf-8'))
+        for start in range(0, len(df), WRITE_BLOCK_ROWS):
+            f.write(format_block(df.iloc[start:start + WRITE_BLOCK_ROWS], precision))
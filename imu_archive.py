@@ -0,0 +1,302 @@
+import os
+import json
+import lzma
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import timestamp_parser
+
+# Архив потоков IMU в выходной папке merge_data: archive/<тип файла>.imu
+ARCHIVE_DIRNAME = 'archive'
+ARCHIVE_SUFFIX = '.imu'
+ARCHIVE_MAGIC = b'IMUA'
+ARCHIVE_VERSION = 1
+
+# Какие итоговые файлы архивируются и с каким шагом квантования значений
+# (ускорение — в g, движение — в единицах датчика). Значения восстанавливаются с точностью до шага / 2.
+VALUE_RESOLUTION = {
+    'motion': 1e-4,
+    'acceleration': 1e-4,
+}
+# Номинальный период записи датчиков; во времени хранятся только отклонения интервалов от него
+SAMPLE_PERIOD_NS = 10_000_000
+# Шаг времени: устройство пишет четыре знака дробной части секунды. Если метки сессии
+# на эту сетку не ложатся, время сессии хранится с точностью до наносекунды
+TIME_RESOLUTION_NS = 100_000
+# Сжатие блоков: 'zlib' (быстрее распаковка) или 'lzma' (меньше размер)
+COMPRESSION = 'zlib'
+
+NAT = timestamp_parser.NAT
+INTEGER_DTYPES = [np.dtype(dtype) for dtype in ('int8', 'int16', 'int32', 'int64')]
+# Значение-пропуск (NaN) в квантованных столбцах
+MISSING = np.iinfo(np.int64).min
+
+_COMPRESSORS = {
+    'zlib': (lambda data: zlib.compress(data, 9), zlib.decompress),
+    'lzma': (lambda data: lzma.compress(data, preset=9), lzma.decompress),
+}
+
+
+def archive_path(output_dir: str, file_type: str) -> str:
+    return os.path.join(output_dir, ARCHIVE_DIRNAME, file_type + ARCHIVE_SUFFIX)
+
+
+def _narrowest(values: np.ndarray) -> np.dtype:
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    return next(dtype for dtype in INTEGER_DTYPES
+                if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max)
+
+
+def _pack(values: np.ndarray, compression: str) -> tuple[str, bytes]:
+    """
+    Целые числа самого узкого подходящего типа, байты переставлены по разрядам
+    (сначала младшие байты всех значений, потом следующие) — так сжатие лучше находит повторы.
+    """
+    dtype = _narrowest(values)
+    planes = values.astype(dtype).view(np.uint8).reshape(-1, dtype.itemsize).T
+    return dtype.name, _COMPRESSORS[compression][0](np.ascontiguousarray(planes).tobytes())
+
+
+def _unpack(blob: bytes, dtype: str, rows: int, compression: str) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    planes = np.frombuffer(_COMPRESSORS[compression][1](blob), dtype=np.uint8).reshape(dtype.itemsize, rows)
+    return np.ascontiguousarray(planes.T).view(dtype).reshape(rows)
+
+
+def encode_timestamps(timestamps: np.ndarray) -> tuple[dict, np.ndarray]:
+    """
+    Время сессии без потерь: первая метка и отклонения интервалов от SAMPLE_PERIOD_NS
+    в единицах шага времени. Возвращает (параметры, отклонения).
+    """
+    resolution = TIME_RESOLUTION_NS if not np.any(timestamps % TIME_RESOLUTION_NS) else 1
+    ticks = timestamps // resolution
+    residuals = np.diff(ticks) - SAMPLE_PERIOD_NS // resolution if len(ticks) else ticks
+    return {'first': int(ticks[0]) if len(ticks) else 0, 'resolution': resolution}, residuals
+
+
+def decode_timestamps(params: dict, residuals: np.ndarray) -> np.ndarray:
+    ticks = np.empty(len(residuals) + 1, dtype=np.int64)
+    ticks[0] = params['first']
+    np.cumsum(residuals.astype(np.int64) + SAMPLE_PERIOD_NS // params['resolution'], out=ticks[1:])
+    ticks[1:] += params['first']
+    return ticks * params['resolution']
+
+
+def encode_values(values: np.ndarray, resolution: float) -> np.ndarray:
+    """
+    Квантование значений с шагом resolution и разности соседних квантованных значений
+    (первая разность — от нуля). Пропуски сохраняются как MISSING.
+    """
+    quantized = np.round(values / resolution)
+    missing = np.isnan(quantized)
+    quantized = np.where(missing, 0, quantized).astype(np.int64)
+    # На месте пропуска повторяется предыдущее значение: его разность равна нулю и заменяется на MISSING
+    previous = np.maximum.accumulate(np.where(missing, 0, np.arange(len(quantized))))
+    deltas = np.diff(quantized[previous], prepend=0)
+    deltas[missing] = MISSING
+    return deltas
+
+
+def decode_values(deltas: np.ndarray, resolution: float) -> np.ndarray:
+    missing = deltas == MISSING
+    quantized = np.cumsum(np.where(missing, 0, deltas))
+    values = quantized * resolution
+    values[missing] = np.nan
+    return values
+
+
+def encode_session(arrays: dict[str, np.ndarray], resolution: float, compression: str) -> tuple[dict, list[bytes]]:
+    """
+    Кодирует данные одной сессии. Строки без корректного времени в архив не попадают
+    (загрузчики итоговых файлов их все равно отбрасывают).
+    Возвращает (описание блоков без смещений, сжатые блоки: время, затем значения по столбцам).
+    """
+    timestamps = np.asarray(arrays[columnar_store.TIMESTAMP_COLUMN])
+    valid = timestamps != NAT
+    params, residuals = encode_timestamps(timestamps[valid])
+    dtype, blob = _pack(residuals, compression)
+    entry = {'rows': int(valid.sum()), 'time': dict(params, dtype=dtype), 'columns': []}
+    blobs = [blob]
+    for name, values in arrays.items():
+        if name == columnar_store.TIMESTAMP_COLUMN:
+            continue
+        dtype, blob = _pack(encode_values(np.asarray(values)[valid], resolution), compression)
+        entry['columns'].append({'name': name, 'dtype': dtype})
+        blobs.append(blob)
+    return entry, blobs
+
+
+def _read_header(f) -> dict | None:
+    if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+        return None
+    header = json.loads(f.read(int(np.frombuffer(f.read(8), dtype='<u8')[0])))
+    return header if header.get('version') == ARCHIVE_VERSION else None
+
+
+def load_header(output_dir: str, file_type: str) -> tuple[dict, int] | None:
+    """
+    Заголовок архива и смещение начала блоков или None, если архива нет или он другой версии.
+    """
+    try:
+        with open(archive_path(output_dir, file_type), 'rb') as f:
+            header = _read_header(f)
+            return (header, f.tell()) if header is not None else None
+    except (FileNotFoundError, ValueError, IndexError):
+        return None
+
+
+def update_archive(output_dir: str, file_types: dict, file_headers: dict, archives: list[dict]) -> None:
+    """
+    Записывает архив потоков IMU (типы из VALUE_RESOLUTION): по сессиям, в порядке итоговых файлов,
+    время — без потерь (encode_timestamps), значения — квантованные разности (encode_values);
+    каждый столбец сессии — отдельный сжатый блок.
+    Блоки сессий, которые уже есть в архиве с теми же параметрами, копируются без перекодирования.
+    """
+    os.makedirs(os.path.join(output_dir, ARCHIVE_DIRNAME), exist_ok=True)
+    for file_type, resolution in VALUE_RESOLUTION.items():
+        if file_type not in file_types:
+            continue
+        path = archive_path(output_dir, file_type)
+        loaded = load_header(output_dir, file_type)
+        old_header, old_base = loaded if loaded else (None, 0)
+        if old_header is not None and (old_header['resolution'] != resolution or
+                                       old_header['compression'] != COMPRESSION or
+                                       old_header['period'] != SAMPLE_PERIOD_NS):
+            old_header = None
+        old_sessions = {entry['session']: entry for entry in old_header['sessions']} if old_header else {}
+
+        streams = sorted((archive['streams'][file_type], archive['session'])
+                         for archive in archives if file_type in archive['streams'])
+        if old_header and [(entry['session'], entry['lines']) for entry in old_header['sessions']] == \
+                [(session, lines) for (_, _, lines), session in streams]:
+            continue
+
+        stored = None
+        sessions, blobs = [], []
+        try:
+            with open(os.path.join(output_dir, file_types[file_type]), 'rb') as csv_file, \
+                    open(path, 'rb') if old_header else open(os.devnull, 'rb') as old_file:
+                for (offset, length, lines), session in streams:
+                    old = old_sessions.get(session)
+                    if old is not None and old['lines'] == lines:
+                        old_file.seek(old_base + old['offset'])
+                        blob = old_file.read(old['length'])
+                        entry = {key: value for key, value in old.items() if key not in ('offset', 'length')}
+                        session_blobs = [blob[start:stop] for start, stop in
+                                         zip(old['bounds'][:-1], old['bounds'][1:])]
+                    else:
+                        if stored is None:
+                            stored = columnar_store.session_columns(output_dir, file_types[file_type],
+                                                                    file_type) or {}
+                        if session in stored:
+                            arrays = stored[session]
+                        else:
+                            csv_file.seek(offset)
+                            arrays = columnar_store.parse_stream(csv_file.read(length),
+                                                                 file_headers[file_type].split(','))
+                        entry, session_blobs = encode_session(arrays, resolution, COMPRESSION)
+                        entry['session'] = session
+                        entry['lines'] = lines
+                    entry['bounds'] = np.cumsum([0] + [len(blob) for blob in session_blobs]).tolist()
+                    sessions.append(entry)
+                    blobs.append(b''.join(session_blobs))
+        except Exception as e:
+            print(f"Не удалось записать архив {file_type}: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+
+        offset = 0
+        for entry, blob in zip(sessions, blobs):
+            entry['offset'], entry['length'] = offset, len(blob)
+            offset += len(blob)
+        header = json.dumps({
+            'version': ARCHIVE_VERSION,
+            'resolution': resolution,
+            'period': SAMPLE_PERIOD_NS,
+            'compression': COMPRESSION,
+            'columns': file_headers[file_type].split(','),
+            'sessions': sessions,
+        }, ensure_ascii=False).encode('utf-8')
+        with open(path + '.tmp', 'wb') as f:
+            f.write(ARCHIVE_MAGIC)
+            f.write(np.array([len(header)], dtype='<u8').tobytes())
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(path + '.tmp', path)
+        print(f"      -> Обновлен архив {os.path.join(ARCHIVE_DIRNAME, file_type + ARCHIVE_SUFFIX)} "
+              f"({os.path.getsize(path) / 1024:.0f} КБ)")
+
+
+def load_archive(output_dir: str, file_type: str) -> pd.DataFrame | None:
+    """
+    Восстанавливает данные из архива в DataFrame: время (datetime64[ns], по часам устройства) — точно,
+    значения — с точностью до половины шага квантования. Строки идут в порядке итогового файла,
+    строки без корректного времени отсутствуют. Возвращает None, если архива нет.
+    """
+    try:
+        with open(archive_path(output_dir, file_type), 'rb') as f:
+            header = _read_header(f)
+            data = f.read() if header is not None else None
+    except (FileNotFoundError, ValueError, IndexError):
+        return None
+    if header is None:
+        return None
+
+    rows = sum(entry['rows'] for entry in header['sessions'])
+    columns = header['columns']
+    result = {columns[0]: np.empty(rows, dtype=np.int64)}
+    result.update({name: np.empty(rows, dtype=columnar_store.VALUE_DTYPE) for name in columns[1:]})
+    start = 0
+    for entry in header['sessions']:
+        count = entry['rows']
+        blobs = [data[entry['offset'] + low:entry['offset'] + high]
+                 for low, high in zip(entry['bounds'][:-1], entry['bounds'][1:])]
+        if count:
+            residuals = _unpack(blobs[0], entry['time']['dtype'], count - 1, header['compression'])
+            result[columns[0]][start:start + count] = decode_timestamps(entry['time'], residuals)
+            for column, blob in zip(entry['columns'], blobs[1:]):
+                deltas = _unpack(blob, column['dtype'], count, header['compression']).astype(np.int64)
+                result[column['name']][start:start + count] = decode_values(deltas, header['resolution'])
+        start += count
+
+    result[columns[0]] = result[columns[0]].view('datetime64[ns]')
+    return pd.DataFrame(result, copy=False)
+
+
+def main():
+    """
+    Сравнивает архив с итоговыми CSV-файлами: размер на диске, время загрузки и точность.
+    """
+    import merge_data
+
+    for file_type in VALUE_RESOLUTION:
+        csv_path = os.path.join(merge_data.OUTPUT_DIR, merge_data.FILE_TYPES[file_type])
+        path = archive_path(merge_data.OUTPUT_DIR, file_type)
+        if not os.path.exists(path) or not os.path.exists(csv_path):
+            print(f"{file_type}: архив или итоговый файл не найден. Запустите merge_data.py.")
+            continue
+
+        started = time.perf_counter()
+        df = load_archive(merge_data.OUTPUT_DIR, file_type)
+        archive_time = time.perf_counter() - started
+        started = time.perf_counter()
+        df_csv = pd.read_csv(csv_path)
+        df_csv['timestamp'] = columnar_store.parse_timestamps(df_csv['timestamp'])
+        csv_time = time.perf_counter() - started
+
+        df_csv = df_csv.dropna(subset=['timestamp']).reset_index(drop=True)
+        error = (df.iloc[:, 1:] - df_csv.iloc[:, 1:]).abs().max().max() if len(df) == len(df_csv) else None
+        print(f"{file_type}: {os.path.getsize(csv_path) / 1024:.0f} КБ CSV -> {os.path.getsize(path) / 1024:.0f} КБ "
+              f"(в {os.path.getsize(csv_path) / os.path.getsize(path):.1f} раза меньше); "
+              f"загрузка {archive_time:.3f} с против {csv_time:.3f} с; "
+              f"время совпадает: {df['timestamp'].equals(df_csv['timestamp'])}; наибольшая ошибка значений: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import os
+import asyncio
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import nested_archive
+
+# Размер блока сжатых данных, читаемого с диска
+PIPELINE_CHUNK_SIZE = 256 * 1024
+# Емкость очередей между стадиями (в блоках). Ограничивает память конвейера
+# примерно величиной 3 * PIPELINE_QUEUE_SIZE * PIPELINE_CHUNK_SIZE (плюс степень сжатия).
+PIPELINE_QUEUE_SIZE = 8
+# Число потоков для распаковки и перезаписи строк
+PIPELINE_WORKERS = 2
+
+
+class PipelineStopped(Exception):
+    """Конвейер остановлен из-за ошибки в одной из стадий."""
+
+
+def _read_stage(plan, input_dir, csv_file_type, put, chunk_size):
+    """
+    Стадия чтения (выполняется в отдельном потоке): проходит по плану и отправляет дальше
+    сжатые данные CSV-файлов блоками вместе со служебными сообщениями о границах архивов и файлов.
+    Элементы, которые нельзя разжать потоково (шифрование, другие методы сжатия),
+    распаковываются здесь же средствами zipfile.
+    """
+    for top_zip_filename, nested_archives in plan:
+        top_zip_path = os.path.join(input_dir, top_zip_filename)
+        try:
+            with zipfile.ZipFile(top_zip_path, 'r') as top_zip:
+                for entry in nested_archives:
+                    put(('archive', entry))
+                    with nested_archive.open_nested_archive(top_zip, top_zip_path, entry['name']) as nested_zip:
+                        csv_files = sorted([name for name in nested_zip.namelist() if name.endswith('.csv')])
+                        for csv_filename in csv_files:
+                            put(('csv', csv_filename))
+                            file_type = csv_file_type(csv_filename)
+                            if file_type:
+                                _read_member(nested_zip, nested_zip.getinfo(csv_filename), file_type, put,
+                                             chunk_size)
+                    put(('end_archive', entry))
+        except PipelineStopped:
+            raise
+        except Exception as e:
+            put(('failed', top_zip_filename, e))
+    put(None)
+
+
+def _read_member(nested_zip, info, file_type, put, chunk_size):
+    if info.flag_bits & 0x1 or info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        put(('member', info.filename, file_type, 'plain', info.CRC))
+        with nested_zip.open(info) as member:
+            while chunk := member.read(chunk_size):
+                put(('chunk', chunk))
+        put(('end_member',))
+        return
+
+    method = 'deflate' if info.compress_type == zipfile.ZIP_DEFLATED else 'stored'
+    put(('member', info.filename, file_type, method, info.CRC))
+    source = nested_zip.fp
+    offset = nested_archive.member_data_offset(source, info)
+    remaining = info.compress_size
+    while remaining > 0:
+        source.seek(offset)
+        chunk = source.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Неожиданный конец данных у '{info.filename}'")
+        offset += len(chunk)
+        remaining -= len(chunk)
+        put(('chunk', chunk))
+    put(('end_member',))
+
+
+async def _decompress_stage(loop, executor, source, sink):
+    """
+    Стадия распаковки: разжимает deflate-блоки и проверяет CRC каждого файла.
+    """
+    failed = set()
+    export = None
+    decompressor = None
+    crc = expected_crc = 0
+    method = csv_filename = None
+
+    while (message := await source.get()) is not None:
+        kind = message[0]
+        if kind == 'archive':
+            export = message[1]['export']
+        if kind == 'failed':
+            failed.add(message[1])
+        elif export in failed:
+            continue
+
+        try:
+            if kind == 'member':
+                _, csv_filename, _, method, expected_crc = message
+                decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == 'deflate' else None
+                crc = 0
+            elif kind == 'chunk' and method != 'plain':
+                data = message[1]
+                if decompressor is not None:
+                    data = await loop.run_in_executor(executor, decompressor.decompress, data)
+                crc = zlib.crc32(data, crc)
+                message = ('chunk', data)
+            elif kind == 'end_member' and method != 'plain':
+                if decompressor is not None:
+                    tail = decompressor.flush()
+                    if tail:
+                        crc = zlib.crc32(tail, crc)
+                        await sink.put(('chunk', tail))
+                if crc != expected_crc:
+                    raise zipfile.BadZipFile(f"Неверная контрольная сумма CRC-32 у '{csv_filename}'")
+        except Exception as e:
+            failed.add(export)
+            await sink.put(('failed', export, e))
+            continue
+
+        await sink.put(message)
+    await sink.put(None)
+
+
+async def _rewrite_stage(loop, executor, source, sink, rewrite_lines, parse_utc_offset):
+    """
+    Стадия перезаписи строк: собирает из блоков целые строки и убирает суффикс часового пояса.
+    Результат совпадает с merge_data.stream_prepared_data. Смещение от UTC из первого суффикса
+    файла отправляется дальше отдельным сообщением.
+    """
+    tail = b''
+    empty = True
+    utc_offset = None
+
+    async def rewrite(data):
+        nonlocal utc_offset
+        if utc_offset is None and (utc_offset := parse_utc_offset(data)) is not None:
+            await sink.put(('utc_offset', utc_offset))
+        return await loop.run_in_executor(executor, rewrite_lines, data)
+
+    while (message := await source.get()) is not None:
+        kind = message[0]
+        if kind == 'member':
+            tail = b''
+            empty = True
+            utc_offset = None
+        elif kind == 'chunk':
+            empty = False
+            data = tail + message[1]
+            cut = data.rfind(b'\n') + 1
+            tail = data[cut:]
+            if cut:
+                await sink.put(('chunk', await rewrite(data[:cut])))
+            continue
+        elif kind == 'end_member':
+            if tail or empty:
+                await sink.put(('chunk', await rewrite(tail) + b'\n'))
+            tail = b''
+        await sink.put(message)
+    await sink.put(None)
+
+
+async def _write_stage(loop, executor, source, output_file_handlers, headers_written, archives, write_output):
+    """
+    Стадия записи: пишет данные в итоговые файлы в порядке плана и учитывает их положение.
+    """
+    failed = set()
+    current_archive = None
+    entry = None
+    streams = {}
+    utc_offsets = {}
+    file_type = None
+
+    while (message := await source.get()) is not None:
+        kind = message[0]
+        if kind == 'failed':
+            _, top_zip_filename, e = message
+            if top_zip_filename not in failed:
+                if isinstance(e, zipfile.BadZipFile):
+                    print(f"Ошибка: Архив '{top_zip_filename}' поврежден или не является ZIP-архивом. Пропускаем.")
+                else:
+                    print(f"Произошла непредвиденная ошибка при обработке {top_zip_filename}: {e}")
+            failed.add(top_zip_filename)
+            continue
+        if kind == 'archive':
+            entry = message[1]
+            if entry['export'] != current_archive:
+                current_archive = entry['export']
+                print(f"\n[1] Обработка внешнего архива: {current_archive}")
+        if entry is not None and entry['export'] in failed:
+            continue
+
+        if kind == 'archive':
+            print(f"  [2] Обработка вложенного архива: {entry['name']}")
+            streams = {}
+            utc_offsets = {}
+        elif kind == 'csv':
+            print("Обработка csv файла ", message[1])
+        elif kind == 'member':
+            _, csv_filename, file_type, _, _ = message
+            print(f"    [3] Найден файл: {csv_filename}, тип: {file_type}")
+            # Заголовок (если нужен) и начало данных в итоговом файле; сами данные придут блоками
+            write_output(file_type, lambda handler: None, output_file_handlers, headers_written, streams)
+        elif kind == 'chunk':
+            await loop.run_in_executor(executor, output_file_handlers[file_type].write, message[1])
+            streams[file_type][1] += len(message[1])
+            streams[file_type][2] += message[1].count(b'\n')
+        elif kind == 'utc_offset':
+            utc_offsets.setdefault(file_type, message[1])
+        elif kind == 'end_archive':
+            archives.append(dict(entry, streams=streams, utc_offsets=utc_offsets))
+
+
+async def _run_pipeline(plan, input_dir, output_file_handlers, headers_written, archives, csv_file_type,
+                        rewrite_lines, parse_utc_offset, write_output):
+    loop = asyncio.get_running_loop()
+    raw_queue, inflated_queue, rewritten_queue = (asyncio.Queue(PIPELINE_QUEUE_SIZE) for _ in range(3))
+    stopped = asyncio.Event()
+
+    def put(item):
+        # Вызывается из потока чтения: ждет места в очереди (обратное давление)
+        future = asyncio.run_coroutine_threadsafe(raw_queue.put(item), loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                if stopped.is_set():
+                    future.cancel()
+                    raise PipelineStopped()
+
+    with ThreadPoolExecutor(max_workers=1) as read_executor, \
+            ThreadPoolExecutor(max_workers=1) as write_executor, \
+            ThreadPoolExecutor(max_workers=PIPELINE_WORKERS) as cpu_executor:
+        reader = loop.run_in_executor(read_executor, _read_stage, plan, input_dir, csv_file_type, put,
+                                      PIPELINE_CHUNK_SIZE)
+        stages = [
+            asyncio.ensure_future(_decompress_stage(loop, cpu_executor, raw_queue, inflated_queue)),
+            asyncio.ensure_future(_rewrite_stage(loop, cpu_executor, inflated_queue, rewritten_queue,
+                                                 rewrite_lines, parse_utc_offset)),
+            asyncio.ensure_future(_write_stage(loop, write_executor, rewritten_queue, output_file_handlers,
+                                               headers_written, archives, write_output)),
+        ]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            stopped.set()
+            for stage in stages:
+                stage.cancel()
+            raise
+        finally:
+            stopped.set()
+            await asyncio.gather(reader, return_exceptions=True)
+        await reader
+
+
+def ingest_pipeline(plan, input_dir, output_file_handlers, headers_written, archives, csv_file_type,
+                    rewrite_lines, parse_utc_offset, write_output):
+    """
+    Конвейерная обработка архивов: чтение с диска, распаковка, перезапись строк и запись в файлы
+    выполняются одновременно разными стадиями, связанными ограниченными очередями asyncio.
+    Ввод-вывод перекрывается с распаковкой, а объем данных в памяти ограничен емкостью очередей.
+    Порядок записи и содержимое итоговых файлов совпадают с последовательным режимом.
+    """
+    asyncio.run(_run_pipeline(plan, input_dir, output_file_handlers, headers_written, archives, csv_file_type,
+                              rewrite_lines, parse_utc_offset, write_output))
@@ -2,26 +2,44 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 
-consolidated_csv_path = Path('output')
-
+import compact_dtypes
+import csv_writer
+import local_interpolation
+import sensor_loader
+import sorted_runs
 
-location_file = consolidated_csv_path / "all_location.csv"
-acceleration_file = consolidated_csv_path / 'all_acceleration.csv'
+consolidated_csv_path = Path('output')
 
+LOCATION_COLUMNS = ("timestamp", "latitude", "longitude", "speed", "course")
+# Значение -1 означает отсутствие данных (нет GPS-скорости или курса); такие фиксации не используются
+MISSING_VALUES = {'speed': -1.0, 'course': -1.0}
+# Курс — угол в градусах, интерполируется по кратчайшей дуге
+CIRCULAR_COLUMNS = ('course',)
+# Промежутки между фиксациями длиннее этого, в секундах (например, между поездками), не интерполируются
+MAX_GAP_SEC = 60
+# Число знаков после запятой в итоговом файле (см. csv_writer.write_csv)
+OUTPUT_PRECISION = {'latitude': 9, 'longitude': 9, 'speed': 3, 'course': 3}
 
-locations_df = pd.read_csv(location_file, names=("timestamp", "latitude", "longitude", "speed", "course"), parse_dates=['timestamp'])
-accelerations_df = pd.read_csv(acceleration_file, names=("timestamp", "accel_x", "accel_y", "accel_z"), parse_dates=['timestamp'])
 
-locations_df.set_index('timestamp', inplace=True)
-accelerations_df.set_index('timestamp', inplace=True)
+locations_df = sensor_loader.load_window('location', names=LOCATION_COLUMNS, output_dir=consolidated_csv_path)
+# Из данных акселерометра нужны только временные метки
+accelerations_df = sensor_loader.load_window('acceleration', columns=[], output_dir=consolidated_csv_path)
 
+locations_df = sorted_runs.sort_frame(locations_df.set_index('timestamp'))
 locations_df = locations_df[~locations_df.index.duplicated(keep='first')]
 
-# Переиндексировать df_low на временные точки из df_high
-df_interp = locations_df.reindex(accelerations_df.index, method=None)  # создаст NaN между точками
+# Все столбцы местоположения переносятся на временные точки акселерометра за один проход:
+# соседние фиксации и веса находятся один раз для каждой точки
+fixes = locations_df.index.to_numpy().astype('datetime64[ns]').view(np.int64)
+samples = accelerations_df['timestamp'].to_numpy().astype('datetime64[ns]').view(np.int64)
+origin = fixes[0] if len(fixes) else 0
+interpolated = local_interpolation.interpolate_columns(
+    (fixes - origin) / 1e9, {column: locations_df[column].to_numpy() for column in LOCATION_COLUMNS[1:]},
+    (samples - origin) / 1e9, CIRCULAR_COLUMNS, MISSING_VALUES, MAX_GAP_SEC)
 
-df_interp = df_interp.interpolate(method='time')
+df_interp = pd.DataFrame(interpolated, index=pd.Index(accelerations_df['timestamp'], name='timestamp'))
+df_interp = compact_dtypes.compact_columns(df_interp, df_interp.columns)
 
 final_output_path = consolidated_csv_path / "speed_interpolated.csv"
 
-df_interp.to_csv(final_output_path, index=True, encoding='utf-8-sig', mode='w')
+csv_writer.write_csv(df_interp.reset_index(), final_output_path, OUTPUT_PRECISION, encoding='utf-8-sig')
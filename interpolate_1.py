@@ -1,13 +1,17 @@
 import pandas as pd
 import os
 
+import sensor_loader
+
 # --- 1. НАСТРОЙКА ---
 INPUT_DIR = 'output'
 OUTPUT_DIR = 'output_cleaned'
-LOCATION_FILE = 'all_location.csv'
-ACCELERATION_FILE = 'all_acceleration.csv'
 OUTPUT_FILENAME = 'speed_interpolated_1.csv'
 
+# Интервал времени (по часам устройства); пустые строки — вся история (см. sensor_loader.load_window)
+START_TIME = ''
+END_TIME = ''
+
 # --- КОНФИГУРАЦИЯ КОЛОНОК ---
 # Убедитесь, что порядок здесь соответствует вашим файлам
 LOC_COLUMN_NAMES = ['timestamp', 'latitude', 'longitude', 'speed', 'accuracy']
@@ -15,7 +19,6 @@ ACC_COLUMN_NAMES = ['timestamp', 'ax', 'ay', 'az']
 
 TIMESTAMP_COLUMN = 'timestamp'
 SPEED_COLUMN = 'speed'
-DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
 
 
 def main():
@@ -27,15 +30,14 @@ def main():
 
     # --- 2. ЗАГРУЗКА ДАННЫХ И ПРЕОБРАЗОВАНИЕ ВРЕМЕНИ ---
     try:
-        loc_path = os.path.join(INPUT_DIR, LOCATION_FILE)
-        acc_path = os.path.join(INPUT_DIR, ACCELERATION_FILE)
+        start, end = START_TIME or None, END_TIME or None
 
         # --- Обработка файла локации (редкие данные) ---
-        print(f"Загрузка и обработка '{LOCATION_FILE}'...")
-        df_location = pd.read_csv(loc_path, header=None, names=LOC_COLUMN_NAMES)
-
-        # <<< КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: Преобразуем текст в настоящую дату и время
-        df_location[TIMESTAMP_COLUMN] = pd.to_datetime(df_location[TIMESTAMP_COLUMN], format=DATETIME_FORMAT)
+        # Читается только столбец скорости; время уже разобрано в datetime64
+        print("Загрузка и обработка данных локации...")
+        df_location = sensor_loader.load_window('location', start, end, [SPEED_COLUMN], LOC_COLUMN_NAMES, INPUT_DIR)
+        if df_location is None:
+            return
 
         # <<< КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: Делаем время индексом
         df_location = df_location.set_index(TIMESTAMP_COLUMN)
@@ -43,11 +45,10 @@ def main():
         df_location = df_location[[SPEED_COLUMN]].loc[~df_location.index.duplicated(keep='first')]
 
         # --- Обработка файла акселерометра (плотная временная сетка) ---
-        print(f"Загрузка и обработка '{ACCELERATION_FILE}'...")
-        df_acc = pd.read_csv(acc_path, header=None, names=ACC_COLUMN_NAMES)
-
-        # <<< КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: Здесь тоже преобразуем текст во время
-        df_acc[TIMESTAMP_COLUMN] = pd.to_datetime(df_acc[TIMESTAMP_COLUMN], format=DATETIME_FORMAT)
+        print("Загрузка и обработка данных акселерометра...")
+        df_acc = sensor_loader.load_window('acceleration', start, end, names=ACC_COLUMN_NAMES, output_dir=INPUT_DIR)
+        if df_acc is None:
+            return
 
         # <<< КЛЮЧЕВОЕ ИЗМЕНЕНИЕ: И тоже делаем время индексом
         df_acc = df_acc.set_index(TIMESTAMP_COLUMN)
@@ -1,8 +1,18 @@
 import pandas as pd
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import columnar_store
+import compact_dtypes
+import csv_tail
+import csv_writer
+import local_interpolation
+import sensor_loader
+import session_catalog
+import sorted_runs
+
 # --- НАСТРОЙКИ ---
 INPUT_DIR = 'output'
 OUTPUT_DIR = 'output_cleaned'
@@ -10,8 +20,31 @@ LOCATION_FILE = 'all_location.csv'
 ACCELERATION_FILE = 'all_acceleration.csv'
 OUTPUT_FILENAME = 'speed_interpolated_improved.csv'
 
+# Интервал времени (по часам устройства); пустые строки — вся история.
+# Если интервал задан, читаются только пересекающиеся с ним секции или байты (sensor_loader.py)
+START_TIME = ''
+END_TIME = ''
+
 # --- НАСТРОЙКИ ИНТЕРПОЛЯЦИИ ---
-INTERPOLATE_ORDER = 1  # Порядок сплайна для интерполяции (1=линейная, 2=квадратичная, 3=кубическая)
+INTERPOLATE_ORDER = 1  # Порядок интерполяции (1=линейная, 2=квадратичная, 3=кубическая), см. local_interpolation.py
+# Кубическая интерполяция: 'bessel' — наклоны по соседним фиксациям, 'akima' — без выбросов у резких изменений.
+# Оба метода локальные, это не естественный сплайн (см. local_interpolation.py)
+CUBIC_METHOD = 'bessel'
+# Промежутки между GPS-фиксациями длиннее этого (в секундах) внутри сессии интерполируются линейно
+MAX_INTERPOLATION_GAP_SEC = 60
+# Разбиение на сессии: промежуток между соседними отсчетами (GPS или акселерометра) длиннее этого,
+# в секундах, начинает новую сессию. Сессии интерполируются независимо, значения скорости
+# не переносятся между поездками (0 — вся временная шкала одна сессия)
+SESSION_GAP_SEC = 300
+# Число процессов для интерполяции сессий (1 — последовательно в текущем процессе)
+INTERPOLATE_WORKERS = min(4, os.cpu_count() or 1)
+# Обработка по частям (см. interpolate_chunked): данные акселерометра читаются интервалами
+# по CHUNK_SECONDS секунд, результат дописывается в файл, поэтому память ограничена размером интервала
+CHUNKED = False
+CHUNK_SECONDS = 3600
+# Сколько GPS-фиксаций перед новыми данными пересчитывается при обновлении (см. update_interpolation).
+# Не меньше local_interpolation.SUPPORT_POINTS: новые фиксации меняют участки на столько фиксаций назад
+UPDATE_CONTEXT_FIXES = 3
 
 # --- КОНФИГУРАЦИЯ КОЛОНОК ---
 LOC_COLUMN_NAMES = ['timestamp', 'latitude', 'longitude', 'speed', 'course']
@@ -19,23 +52,76 @@ ACC_COLUMN_NAMES = ['timestamp', 'x_accel', 'y_accel', 'z_accel']
 
 TIMESTAMP_COLUMN = 'timestamp'
 SPEED_COLUMN = 'speed'
-DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# Число знаков после запятой в итоговом файле (см. csv_writer.write_csv)
+OUTPUT_PRECISION = {
+    'x_accel': 6,
+    'y_accel': 6,
+    'z_accel': 6,
+    SPEED_COLUMN: 3,
+    'speed_change': 6,
+    'speed_source': 0,
+}
+
+
+def read_output_file(file_path, file_type, start=None, end=None, columns=None):
+    """
+    Читает итоговый файл merge_data через sensor_loader.load_window: за интервал [start, end]
+    читаются только секции или байты интервала, а всю историю — из колоночного хранилища, если оно есть.
+    columns — нужные столбцы значений (по умолчанию все). Источники в памяти (см. update_interpolation)
+    читаются как CSV. Временные метки возвращаются как datetime64; строки без корректного времени
+    отбрасываются. Тип значений — compact_dtypes.value_dtype() (кроме координат).
+    """
+    if isinstance(file_path, (str, os.PathLike)):
+        names = LOC_COLUMN_NAMES if file_type == 'location' else ACC_COLUMN_NAMES
+        df = sensor_loader.load_window(file_type, start, end, columns, names, output_dir=os.path.dirname(file_path))
+        if df is None:
+            raise FileNotFoundError(file_path)
+        return df
+
+    usecols = None if columns is None else [TIMESTAMP_COLUMN] + list(columns)
+    df = pd.read_csv(file_path, header=0, usecols=usecols)
+    df[TIMESTAMP_COLUMN] = columnar_store.parse_timestamps(df[TIMESTAMP_COLUMN])
+    df = df[df[TIMESTAMP_COLUMN].notna()]
+    if start is not None or end is not None:
+        timestamps = df[TIMESTAMP_COLUMN]
+        df = df[(timestamps >= pd.Timestamp(start or timestamps.min())) &
+                (timestamps <= pd.Timestamp(end or timestamps.max()))]
+    return compact_dtypes.compact_columns(df, df.columns)
+
+
+def time_span(index) -> tuple:
+    """
+    Первая и последняя временные метки упорядоченного индекса без прохода по данным.
+    """
+    return (index[0], index[-1]) if len(index) else (pd.NaT, pd.NaT)
+
+
+def print_catalog_summary(output_dir):
+    """
+    Печатает сводку по сессиям итоговых файлов из каталога merge_data (см. session_catalog.py),
+    не загружая данные. Ничего не печатает, если актуального каталога нет.
+    """
+    catalog = session_catalog.load_catalog(output_dir, {'location': LOCATION_FILE, 'acceleration': ACCELERATION_FILE})
+    if catalog is None:
+        return
+    for file_type, title in [('location', 'GPS'), ('acceleration', 'акселерометра')]:
+        sessions, rows, start, end = session_catalog.summarize(catalog, file_type)
+        print(f"Каталог: данные {title} — {sessions} сессий, {rows} строк, {start} - {end}")
 
 
-def load_and_clean_location_data(file_path):
+def load_and_clean_location_data(file_path, start=None, end=None):
     """
     Загружает и очищает данные о местоположении, фильтруя некорректные значения скорости.
+    start, end — интервал времени (None — без ограничения), см. read_output_file.
     """
-    print(f"Загрузка данных местоположения из {file_path}...")
+    print(f"Загрузка данных местоположения из {getattr(file_path, 'name', file_path)}...")
     
     # Загружаем данные
-    df_location = pd.read_csv(file_path, header=0)
+    df_location = read_output_file(file_path, 'location', start, end, [SPEED_COLUMN])
     
     print(f"Загружено {len(df_location)} записей местоположения")
     
-    # Преобразуем временные метки
-    df_location[TIMESTAMP_COLUMN] = pd.to_datetime(df_location[TIMESTAMP_COLUMN], format=DATETIME_FORMAT)
-    
     # Фильтруем некорректные значения скорости (отрицательные и NaN)
     print("Фильтрация некорректных значений скорости...")
     initial_count = len(df_location)
@@ -56,38 +142,97 @@ def load_and_clean_location_data(file_path):
     # Удаляем дубликаты по времени, оставляя первое значение
     df_location = df_location.loc[~df_location.index.duplicated(keep='first')]
     
-    # Сортируем по времени
-    df_location = df_location.sort_index()
+    # Сортируем по времени (уже упорядоченные данные не переставляются)
+    df_location = sorted_runs.sort_frame(df_location)
     
     return df_location[[SPEED_COLUMN]]
 
 
-def load_acceleration_data(file_path):
+def load_acceleration_data(file_path, runs=None, start=None, end=None):
     """
     Загружает данные акселерометра.
+    runs — отсортированные участки файла (sorted_runs.recorded_runs), если известны и файл читается целиком.
+    start, end — интервал времени (None — без ограничения), см. read_output_file.
     """
-    print(f"Загрузка данных акселерометра из {file_path}...")
+    print(f"Загрузка данных акселерометра из {getattr(file_path, 'name', file_path)}...")
     
     # Загружаем данные
-    df_acc = pd.read_csv(file_path, header=0)
+    df_acc = read_output_file(file_path, 'acceleration', start, end)
     
     print(f"Загружено {len(df_acc)} записей акселерометра")
     
-    # Преобразуем временные метки
-    df_acc[TIMESTAMP_COLUMN] = pd.to_datetime(df_acc[TIMESTAMP_COLUMN], format=DATETIME_FORMAT)
-    
     # Устанавливаем временную метку как индекс
     df_acc = df_acc.set_index(TIMESTAMP_COLUMN)
     
-    # Сортируем по времени
-    df_acc = df_acc.sort_index()
+    # Сортируем по времени: сливаются только неупорядоченные участки
+    df_acc = sorted_runs.sort_frame(df_acc, runs=runs)
     
     return df_acc
 
 
+def interpolation_method():
+    """
+    Метод local_interpolation по INTERPOLATE_ORDER и CUBIC_METHOD.
+    """
+    return CUBIC_METHOD if INTERPOLATE_ORDER == 3 else local_interpolation.ORDER_METHODS[INTERPOLATE_ORDER]
+
+
+def session_bounds(index, gap_sec):
+    """
+    Границы сессий упорядоченной временной шкалы: сессия k — строки bounds[k]..bounds[k + 1] - 1.
+    Новая сессия начинается там, где промежуток между соседними метками длиннее gap_sec секунд.
+    """
+    nanoseconds = index.to_numpy().astype('datetime64[ns]').view(np.int64)
+    breaks = np.flatnonzero(np.diff(nanoseconds) > gap_sec * 10 ** 9) + 1 if gap_sec else []
+    return np.concatenate([[0], breaks, [len(nanoseconds)]]).astype(np.int64)
+
+
+def interpolate_session(nanoseconds, speed, method, max_gap):
+    """
+    Интерполирует скорость одной сессии в строках без GPS-фиксации (время — наносекунды по возрастанию)
+    и заполняет края сессии ближайшими фиксациями. Без фиксаций скорость остается NaN.
+    Выполняется в рабочих процессах, поэтому принимает и возвращает только массивы.
+    """
+    speed = speed.copy()
+    known = ~np.isnan(speed)
+    if not known.any():
+        return speed
+    # Время — в секундах от начала сессии; повторяющиеся метки сетки дают одинаковые фиксации,
+    # а опорные точки должны строго возрастать
+    seconds = (nanoseconds - nanoseconds[0]) / 1e9
+    fixes, first = np.unique(seconds[known], return_index=True)
+    speed[~known] = local_interpolation.interpolate(fixes, speed[known][first], seconds[~known], method, max_gap)
+    # До первой и после последней фиксации сессии — значения этих фиксаций
+    positions = np.flatnonzero(known)
+    speed[:positions[0]] = speed[positions[0]]
+    speed[positions[-1] + 1:] = speed[positions[-1]]
+    return speed
+
+
+def interpolate_sessions(index, speed, bounds):
+    """
+    Интерполирует скорость по сессиям (см. session_bounds) независимо друг от друга:
+    при INTERPOLATE_WORKERS > 1 — в пуле процессов. Результаты склеиваются в порядке сессий.
+    """
+    nanoseconds = index.to_numpy().astype('datetime64[ns]').view(np.int64)
+    speed = speed.to_numpy(dtype=np.float64, na_value=np.nan)
+    parts = [(nanoseconds[start:stop], speed[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:])]
+    method = interpolation_method()
+    arguments = ([part[0] for part in parts], [part[1] for part in parts],
+                 [method] * len(parts), [MAX_INTERPOLATION_GAP_SEC] * len(parts))
+    if INTERPOLATE_WORKERS > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=min(INTERPOLATE_WORKERS, len(parts))) as executor:
+            results = list(executor.map(interpolate_session, *arguments))
+    else:
+        results = list(map(interpolate_session, *arguments))
+    result = np.concatenate(results) if results else speed
+    return result.astype(compact_dtypes.value_dtype())
+
+
 def interpolate_speed_data(df_acc, df_location):
     """
-    Выполняет сплайн-интерполяцию данных скорости на объединенную временную сетку.
+    Интерполирует скорость на объединенную временную сетку локально между соседними
+    GPS-фиксациями (см. local_interpolation.py), отдельно в каждой сессии (см. SESSION_GAP_SEC).
     """
     print("Начало интерполяции данных скорости...")
     
@@ -97,9 +242,9 @@ def interpolate_speed_data(df_acc, df_location):
     # Получаем все уникальные временные метки из обоих источников
     all_timestamps = pd.Index(df_acc.index.union(df_location.index)).sort_values()
     
-    print(f"Временной диапазон GPS данных: {df_location.index.min()} - {df_location.index.max()}")
-    print(f"Временной диапазон акселерометра: {df_acc.index.min()} - {df_acc.index.max()}")
-    print(f"Объединенный временной диапазон: {all_timestamps.min()} - {all_timestamps.max()}")
+    print("Временной диапазон GPS данных: %s - %s" % time_span(df_location.index))
+    print("Временной диапазон акселерометра: %s - %s" % time_span(df_acc.index))
+    print("Объединенный временной диапазон: %s - %s" % time_span(all_timestamps))
     
     # Создаем DataFrame с объединенной временной сеткой
     df_merged = pd.DataFrame(index=all_timestamps)
@@ -113,7 +258,7 @@ def interpolate_speed_data(df_acc, df_location):
     # Создаем индикатор источника данных скорости СРАЗУ после объединения
     # 1 = оригинальные GPS данные, 0 = требуют интерполяции
     print("Создание индикатора источника данных скорости...")
-    df_merged['speed_source'] = df_merged[SPEED_COLUMN].notna().astype(int)
+    df_merged['speed_source'] = df_merged[SPEED_COLUMN].notna().astype(compact_dtypes.flag_dtype())
     
     print(f"Объединено {len(df_merged)} записей")
     print(f"Записей с валидными данными скорости: {df_merged[SPEED_COLUMN].notna().sum()}")
@@ -126,23 +271,14 @@ def interpolate_speed_data(df_acc, df_location):
         print("ОШИБКА: Недостаточно валидных данных скорости для интерполяции!")
         return None
     
-    # Выполняем сплайн-интерполяцию для скорости
-    print(f"Выполнение сплайн-интерполяции скорости (порядок сплайна: {INTERPOLATE_ORDER})...")
-    df_merged[SPEED_COLUMN] = df_merged[SPEED_COLUMN].interpolate(method='spline', order=INTERPOLATE_ORDER)
-
-    # Обрабатываем граничные случаи с использованием современного синтаксиса
-    print("Обработка граничных значений...")
-
-    # Заполняем значения в начале (backward fill)
-    df_merged[SPEED_COLUMN] = df_merged[SPEED_COLUMN].bfill()
-
-    # Заполняем значения в конце (forward fill)
-    df_merged[SPEED_COLUMN] = df_merged[SPEED_COLUMN].ffill()
+    bounds = session_bounds(df_merged.index, SESSION_GAP_SEC)
+    print(f"Выполнение интерполяции скорости (метод: {interpolation_method()}, сессий: {len(bounds) - 1})...")
+    df_merged[SPEED_COLUMN] = interpolate_sessions(df_merged.index, df_merged[SPEED_COLUMN], bounds)
 
     # Проверяем результат
     remaining_na = df_merged[SPEED_COLUMN].isna().sum()
     if remaining_na > 0:
-        print(f"ВНИМАНИЕ: Осталось {remaining_na} неинтерполированных значений")
+        print(f"ВНИМАНИЕ: Осталось {remaining_na} неинтерполированных значений (сессии без GPS-фиксаций)")
         # Заполняем оставшиеся NaN нулями
         df_merged[SPEED_COLUMN] = df_merged[SPEED_COLUMN].fillna(0)
     
@@ -160,8 +296,9 @@ def calculate_speed_change(df_merged):
     # Вычисляем разность скоростей между соседними точками
     df_merged['speed_change'] = df_merged[SPEED_COLUMN].diff()
     
-    # Для первой записи устанавливаем изменение скорости равным 0
-    df_merged.loc[df_merged.index[0], 'speed_change'] = 0.0
+    # Для первой записи каждой сессии устанавливаем изменение скорости равным 0
+    starts = session_bounds(df_merged.index, SESSION_GAP_SEC)[:-1]
+    df_merged.iloc[starts, df_merged.columns.get_loc('speed_change')] = 0.0
     
     # Статистика по изменению скорости
     print(f"Статистика изменения скорости:")
@@ -195,9 +332,204 @@ def analyze_interpolation_quality(df_merged, df_location):
     
     # Временной диапазон
     print(f"\nВременной диапазон:")
-    print(f"  Начало: {df_merged.index.min()}")
-    print(f"  Конец: {df_merged.index.max()}")
-    print(f"  Продолжительность: {df_merged.index.max() - df_merged.index.min()}")
+    start, end = time_span(df_merged.index)
+    print(f"  Начало: {start}")
+    print(f"  Конец: {end}")
+    print(f"  Продолжительность: {end - start}")
+
+
+def update_interpolation(output_path, loc_path, load_acc, since):
+    """
+    Обновляет результат интерполяции после появления новых данных с временными метками не раньше since.
+
+    Пересчитывается только окно, начинающееся за UPDATE_CONTEXT_FIXES GPS-фиксаций до since:
+    строки раньше окна остаются в файле, строки окна переписываются заново.
+    load_acc(start) должен вернуть источник данных акселерометра (CSV с заголовком),
+    содержащий как минимум все строки не раньше start; start=None означает все данные.
+    Возвращает начало пересчитанного окна (None — файл пересчитан целиком) или False при ошибке.
+    """
+    df_location = load_and_clean_location_data(loc_path)
+    if df_location.empty:
+        print("ОШИБКА: Нет валидных данных скорости для интерполяции!")
+        return False
+
+    position = df_location.index.searchsorted(pd.Timestamp(since))
+    start = df_location.index[position - UPDATE_CONTEXT_FIXES] if position > UPDATE_CONTEXT_FIXES else None
+    # Строка перед окном (не раньше предыдущей фиксации) тоже пересчитывается: от нее считается
+    # изменение скорости в первой строке окна
+    previous_fix = df_location.index[position - UPDATE_CONTEXT_FIXES - 1] if start is not None else None
+
+    df_acc = load_acceleration_data(load_acc(previous_fix))
+    if start is not None:
+        df_acc = df_acc[df_acc.index >= previous_fix]
+        # Фиксации перед окном нужны как опорные точки: от них зависят наклоны первых участков окна
+        context = max(position - UPDATE_CONTEXT_FIXES - local_interpolation.SUPPORT_POINTS, 0)
+        df_location = df_location.iloc[context:]
+
+    df_merged = interpolate_speed_data(df_acc, df_location)
+    if df_merged is None:
+        print("ОШИБКА: Интерполяция не удалась!")
+        return False
+    if start is not None:
+        # Изменение скорости считается по неокругленной скорости, как при полном пересчете,
+        # затем строка перед окном отбрасывается
+        df_merged = df_merged.iloc[max(df_merged.index.searchsorted(start) - 1, 0):]
+    df_merged = calculate_speed_change(df_merged)
+    if start is not None:
+        df_merged = df_merged[df_merged.index >= start]
+
+    offset = csv_tail.data_start(output_path) if start is None else csv_tail.find_time_offset(output_path, start)
+
+    columns_to_save = ['x_accel', 'y_accel', 'z_accel', SPEED_COLUMN, 'speed_change', 'speed_source']
+    result_df = df_merged[columns_to_save].reset_index()
+    csv_tail.truncate_and_append(output_path, offset, result_df, OUTPUT_PRECISION)
+    print(f"Пересчитано записей: {len(result_df)} (начиная с {result_df[result_df.columns[0]].iloc[0]})")
+    return start
+
+
+def chunk_starts(output_dir, start=None, end=None):
+    """
+    Начала интервалов по CHUNK_SECONDS секунд, покрывающих данные GPS и акселерометра в [start, end].
+    Интервалы без данных (между сессиями) пропускаются. Диапазоны сессий берутся из каталога
+    без чтения файлов; None — актуального каталога нет.
+    """
+    catalog = session_catalog.load_catalog(output_dir, {'location': LOCATION_FILE, 'acceleration': ACCELERATION_FILE})
+    if catalog is None:
+        return None
+    ranges = [(pd.Timestamp(first), pd.Timestamp(last)) for file_type in ('location', 'acceleration')
+              for first, last in filter(None, session_catalog.time_ranges(catalog, file_type).values())]
+    if start:
+        ranges = [(max(first, pd.Timestamp(start)), last) for first, last in ranges]
+    if end:
+        ranges = [(first, min(last, pd.Timestamp(end))) for first, last in ranges]
+    ranges = [(first, last) for first, last in ranges if first <= last]
+    if not ranges:
+        return []
+    origin = min(first for first, _ in ranges)
+    step = pd.Timedelta(seconds=CHUNK_SECONDS)
+    chunks = sorted({k for first, last in ranges for k in range((first - origin) // step, (last - origin) // step + 1)})
+    return [origin + k * step for k in chunks]
+
+
+def load_acceleration_chunk(acc_path, start, end, columns=None, limit=None):
+    """
+    Данные акселерометра со временем в [start, end) и не позже limit (конец всего интервала обработки,
+    None — без ограничения), упорядоченные по времени (время — индекс).
+    """
+    df_acc = sensor_loader.load_window('acceleration', start, min(end, limit) if limit is not None else end,
+                                       columns, ACC_COLUMN_NAMES, output_dir=os.path.dirname(acc_path))
+    df_acc = df_acc[df_acc[TIMESTAMP_COLUMN] < end].set_index(TIMESTAMP_COLUMN)
+    return sorted_runs.sort_frame(df_acc)
+
+
+def scan_chunks(acc_path, fixes, starts, limit=None):
+    """
+    Первый проход по частям, только по временным меткам: начала сессий (см. SESSION_GAP_SEC),
+    кроме первой, и точность времени для итогового файла, как при записи всего файла сразу.
+    fixes — наносекунды GPS-фиксаций по возрастанию.
+    """
+    step = pd.Timedelta(seconds=CHUNK_SECONDS)
+    breaks = []
+    previous = None
+    precision = 0
+    for start in starts:
+        end = start + step
+        times = load_acceleration_chunk(acc_path, start, end, [], limit).index
+        chunk_fixes = fixes[np.searchsorted(fixes, start.value):np.searchsorted(fixes, end.value)]
+        grid = np.union1d(times.to_numpy().astype('datetime64[ns]').view(np.int64), chunk_fixes)
+        if len(grid) == 0:
+            continue
+        if SESSION_GAP_SEC:
+            # Промежуток перед каждой меткой, в том числе перед первой — от последней метки прошлой части
+            edges = np.concatenate([[grid[0] if previous is None else previous], grid])
+            breaks.extend(grid[np.diff(edges) > SESSION_GAP_SEC * 10 ** 9])
+        previous = grid[-1]
+        precision = max(precision, csv_writer.time_precision(grid.view('datetime64[ns]')))
+    return np.array(breaks, dtype=np.int64), precision
+
+
+def interpolate_chunk(df_merged, fixes, fix_speeds, breaks):
+    """
+    Интерполирует скорость строк одной части (df_merged, время — индекс) так же, как при обработке
+    всего файла: для каждой сессии части берутся GPS-фиксации этой сессии в пределах части
+    и еще local_interpolation.SUPPORT_POINTS + 1 с каждой стороны (или до края сессии).
+    Возвращает скорость строк и номера их сессий.
+    """
+    nanoseconds = df_merged.index.to_numpy().astype('datetime64[ns]').view(np.int64)
+    speed = df_merged[SPEED_COLUMN].to_numpy(dtype=np.float64, na_value=np.nan)
+    sessions = np.searchsorted(breaks, nanoseconds, side='right')
+    result = np.empty(len(speed))
+    bounds = np.concatenate([[0], np.flatnonzero(np.diff(sessions)) + 1, [len(sessions)]])
+    for first_row, stop_row in zip(bounds[:-1], bounds[1:]):
+        session = sessions[first_row]
+        rows = slice(first_row, stop_row)
+        low = np.searchsorted(fixes, breaks[session - 1]) if session > 0 else 0
+        high = np.searchsorted(fixes, breaks[session]) if session < len(breaks) else len(fixes)
+        support = local_interpolation.SUPPORT_POINTS + 1
+        before = slice(max(np.searchsorted(fixes, nanoseconds[first_row]) - support, low),
+                       np.searchsorted(fixes, nanoseconds[first_row]))
+        after = slice(np.searchsorted(fixes, nanoseconds[stop_row - 1], side='right'),
+                      min(np.searchsorted(fixes, nanoseconds[stop_row - 1], side='right') + support, high))
+        part = interpolate_session(np.concatenate([fixes[before], nanoseconds[rows], fixes[after]]),
+                                   np.concatenate([fix_speeds[before], speed[rows], fix_speeds[after]]),
+                                   interpolation_method(), MAX_INTERPOLATION_GAP_SEC)
+        result[rows] = part[len(fixes[before]):len(part) - len(fixes[after])]
+    return result, sessions
+
+
+def interpolate_chunked(df_location, acc_path, output_path, start=None, end=None):
+    """
+    Интерполяция по частям для данных, не помещающихся в память. Данные акселерометра читаются
+    интервалами по CHUNK_SECONDS секунд (sensor_loader.load_window: по индексу времени или секциям),
+    для каждого интервала строится своя объединенная сетка, результат дописывается в output_path.
+    В памяти одновременно — только один интервал и GPS-фиксации (только время и скорость).
+    Результат совпадает с обработкой всего файла сразу: границы сессий и точность времени находятся
+    первым проходом по временным меткам, изменение скорости непрерывно на границах интервалов.
+    Возвращает число записанных строк или None, если нет каталога сессий.
+    """
+    starts = chunk_starts(os.path.dirname(acc_path), start, end)
+    if starts is None:
+        return None
+    step = pd.Timedelta(seconds=CHUNK_SECONDS)
+    fixes = df_location.index.to_numpy().astype('datetime64[ns]').view(np.int64)
+    fix_speeds = df_location[SPEED_COLUMN].to_numpy(dtype=np.float64)
+    print(f"Обработка по частям: {len(starts)} интервалов по {CHUNK_SECONDS} с...")
+    limit = pd.Timestamp(end) if end else None
+    breaks, time_precision = scan_chunks(acc_path, fixes, starts, limit)
+    precision = dict(OUTPUT_PRECISION, **{TIMESTAMP_COLUMN: time_precision})
+
+    columns_to_save = ['x_accel', 'y_accel', 'z_accel', SPEED_COLUMN, 'speed_change', 'speed_source']
+    written = 0
+    missing = 0
+    previous = None  # (сессия, скорость) последней записанной строки
+    for chunk_start in starts:
+        chunk_end = chunk_start + step
+        df_acc = load_acceleration_chunk(acc_path, chunk_start, chunk_end, limit=limit)
+        df_chunk = df_location[(df_location.index >= chunk_start) & (df_location.index < chunk_end)]
+        all_timestamps = pd.Index(df_acc.index.union(df_chunk.index)).sort_values()
+        if len(all_timestamps) == 0:
+            continue
+        df_merged = pd.DataFrame(index=all_timestamps).join(df_acc, how='left').join(df_chunk, how='left')
+        df_merged['speed_source'] = df_merged[SPEED_COLUMN].notna().astype(compact_dtypes.flag_dtype())
+
+        speed, sessions = interpolate_chunk(df_merged, fixes, fix_speeds, breaks)
+        missing += int(np.isnan(speed).sum())
+        speed = np.nan_to_num(speed, nan=0.0).astype(compact_dtypes.value_dtype())
+        df_merged[SPEED_COLUMN] = speed
+        # Изменение скорости: от предыдущей строки той же сессии, с учетом последней строки прошлой части
+        change = np.diff(speed.astype(np.float64), prepend=previous[1] if previous else np.nan)
+        change[np.diff(sessions, prepend=previous[0] if previous else -1) != 0] = 0.0
+        df_merged['speed_change'] = change
+        previous = (sessions[-1], float(speed[-1]))
+
+        csv_writer.write_csv(df_merged[columns_to_save].reset_index(), output_path, precision,
+                             header=written == 0, mode='w' if written == 0 else 'a')
+        written += len(df_merged)
+
+    if missing:
+        print(f"ВНИМАНИЕ: Осталось {missing} неинтерполированных значений (сессии без GPS-фиксаций)")
+    print(f"Сессий: {len(breaks) + 1}, записано {written} записей")
+    return written
 
 
 def main():
@@ -206,7 +538,7 @@ def main():
     """
     print("=== СПЛАЙН-ИНТЕРПОЛЯЦИЯ ДАННЫХ СКОРОСТИ ===")
     print(f"Время запуска: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Порядок сплайна: {INTERPOLATE_ORDER}")
+    print(f"Метод интерполяции: {interpolation_method()}")
     
     # Создаем выходную директорию
     os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -225,15 +557,29 @@ def main():
             print(f"ОШИБКА: Файл {acc_path} не найден!")
             return
         
+        print_catalog_summary(INPUT_DIR)
+
         # Загружаем и очищаем данные местоположения
-        df_location = load_and_clean_location_data(loc_path)
+        start, end = START_TIME or None, END_TIME or None
+        df_location = load_and_clean_location_data(loc_path, start, end)
         
         if df_location.empty:
             print("ОШИБКА: Нет валидных данных скорости для интерполяции!")
             return
-        
+
+        output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILENAME)
+        if CHUNKED:
+            written = interpolate_chunked(df_location, acc_path, output_path, start, end)
+            if written is not None:
+                if written:
+                    print(f"Результат сохранен в {output_path}: {written} записей")
+                print("\n=== ПРОЦЕСС ЗАВЕРШЕН УСПЕШНО! ===")
+                return
+            print("Нет актуального каталога сессий: данные обрабатываются целиком.")
+
         # Загружаем данные акселерометра
-        df_acc = load_acceleration_data(acc_path)
+        runs = sorted_runs.recorded_runs('acceleration', INPUT_DIR) if start is None and end is None else None
+        df_acc = load_acceleration_data(acc_path, runs, start, end)
         
         # Выполняем интерполяцию
         df_merged = interpolate_speed_data(df_acc, df_location)
@@ -249,13 +595,12 @@ def main():
         analyze_interpolation_quality(df_merged, df_location)
         
         # Сохраняем результат
-        output_path = os.path.join(OUTPUT_DIR, OUTPUT_FILENAME)
         print(f"\nСохранение результата в файл: {output_path}")
         
         # Подготавливаем данные для сохранения - включаем timestamp, данные акселерометра, скорость, изменение скорости и источник данных
         columns_to_save = ['x_accel', 'y_accel', 'z_accel', SPEED_COLUMN, 'speed_change', 'speed_source']
         result_df = df_merged[columns_to_save].reset_index()
-        result_df.to_csv(output_path, index=False, mode="w")
+        csv_writer.write_csv(result_df, output_path, OUTPUT_PRECISION)
         
         print(f"Результат сохранен: {len(result_df)} записей")
         print(f"Размер файла: {os.path.getsize(output_path) / (1024*1024):.1f} МБ")
@@ -2,7 +2,14 @@ import pandas as pd
 import zipfile
 import os
 from datetime import datetime
-import shutil
+from contextlib import ExitStack
+
+import columnar_store
+import nested_archive
+import sorted_runs
+
+# Префиксы CSV-файлов, которые нужны для объединения данных одной сессии
+REQUIRED_PREFIXES = ('location_', 'motion_', 'acceleration_')
 
 
 def merge_sensor_data(location_file, motion_file, acceleration_file):
@@ -16,15 +23,9 @@ def merge_sensor_data(location_file, motion_file, acceleration_file):
         return None
 
     try:
-        def parse_timestamp(ts_series):
-            ts_series = ts_series.astype(str).str.replace(r'[+-]\d{4}$', '', regex=True)
-            ts_series = ts_series.apply(
-                lambda x: x + '0' * (6 - len(x.split('.')[-1])) if '.' in x and len(x.split('.')[-1]) < 6 else x)
-            return pd.to_datetime(ts_series, format="%Y-%m-%dT%H:%M:%S.%f", errors='coerce')
-
-        locations_df['timestamp'] = parse_timestamp(locations_df['timestamp'])
-        motions_df['timestamp'] = parse_timestamp(motions_df['timestamp'])
-        accelerations_df['timestamp'] = parse_timestamp(accelerations_df['timestamp'])
+        locations_df['timestamp'] = columnar_store.parse_timestamps(locations_df['timestamp'])
+        motions_df['timestamp'] = columnar_store.parse_timestamps(motions_df['timestamp'])
+        accelerations_df['timestamp'] = columnar_store.parse_timestamps(accelerations_df['timestamp'])
 
         locations_df.dropna(subset=['timestamp'], inplace=True)
         motions_df.dropna(subset=['timestamp'], inplace=True)
@@ -36,9 +37,10 @@ def merge_sensor_data(location_file, motion_file, acceleration_file):
             "Пожалуйста, убедитесь, что формат времени в файлах соответствует стандарту ISO 8601 (например, 'гггг-ММ-ддTЧЧ:мм:сс.ffffff' или 'гггг-ММ-ддTЧЧ:мм:сс.ffffff+ЧЧММ')")
         return None
 
-    locations_df = locations_df.sort_values(by='timestamp').reset_index(drop=True)
-    motions_df = motions_df.sort_values(by='timestamp').reset_index(drop=True)
-    accelerations_df = accelerations_df.sort_values(by='timestamp').reset_index(drop=True)
+    # CSV-файлы сессии уже упорядочены по времени: сортировка переставляет только нарушенные участки
+    locations_df = sorted_runs.sort_frame(locations_df, 'timestamp').reset_index(drop=True)
+    motions_df = sorted_runs.sort_frame(motions_df, 'timestamp').reset_index(drop=True)
+    accelerations_df = sorted_runs.sort_frame(accelerations_df, 'timestamp').reset_index(drop=True)
 
     results = []
 
@@ -96,135 +98,88 @@ def merge_sensor_data(location_file, motion_file, acceleration_file):
     return result_df
 
 
-def _recursive_unzip(zip_path, extract_to_dir):
-    """Распаковывает один ZIP-архив и возвращает путь к распакованной директории."""
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            extract_dir_name = os.path.splitext(os.path.basename(zip_path))[0]
-            extraction_target_path = os.path.join(extract_to_dir, extract_dir_name)
-            os.makedirs(extraction_target_path, exist_ok=True)
-            zip_ref.extractall(extraction_target_path)
-            print(f"Архив '{zip_path}' успешно распакован в '{extraction_target_path}'.")
-            return extraction_target_path
-    except zipfile.BadZipFile:
-        print(f"Ошибка: '{zip_path}' не является действительным ZIP-файлом.")
-    except FileNotFoundError:
-        print(f"Ошибка: Файл '{zip_path}' не найден.")
-    except Exception as e:
-        print(f"Произошла ошибка при распаковке '{zip_path}': {e}")
-    return None
+def _collect_csv_members(zip_file, stack, found):
+    """
+    Ищет CSV-файлы с нужными префиксами в архиве и во всех вложенных в него архивах.
+    Для каждого префикса запоминается первый найденный файл: (архив, имя файла в архиве).
+    Вложенные архивы остаются открытыми до закрытия stack.
+    """
+    names = sorted(zip_file.namelist())
+    for name in names:
+        if name.endswith('.csv'):
+            basename = os.path.basename(name)
+            for prefix in REQUIRED_PREFIXES:
+                if basename.startswith(prefix) and prefix not in found:
+                    found[prefix] = (zip_file, name)
+                    break
+    for name in names:
+        if name.endswith('.zip'):
+            nested_zip = stack.enter_context(nested_archive.open_nested_archive(zip_file, None, name))
+            _collect_csv_members(nested_zip, stack, found)
+
+
+def iter_tracking_sessions(zip_file, zip_path, folder):
+    """
+    Рекурсивно обходит ZIP-архив без распаковки на диск.
+    Для каждого вложенного архива tracking_data_* возвращает (папка сессии, {префикс: (архив, имя файла)});
+    папка сессии совпадает с той, куда архив был бы распакован. Пока обрабатывается сессия, ее архивы открыты.
+    """
+    for name in sorted(n for n in zip_file.namelist() if n.endswith('.zip')):
+        stem = os.path.splitext(os.path.basename(name))[0]
+        nested_folder = os.path.join(folder, os.path.dirname(name), stem)
+        try:
+            with ExitStack() as stack:
+                nested_zip = stack.enter_context(nested_archive.open_nested_archive(zip_file, zip_path, name))
+                if stem.startswith('tracking_data_'):
+                    found = {}
+                    _collect_csv_members(nested_zip, stack, found)
+                    yield nested_folder, found
+                else:
+                    yield from iter_tracking_sessions(nested_zip, None, nested_folder)
+        except zipfile.BadZipFile:
+            print(f"Ошибка: '{name}' не является действительным ZIP-файлом.")
 
 
 def unzip_and_process_all_archives(main_zip_path):
     output_base_dir = "extracted_data"
-
-    if os.path.exists(output_base_dir):
-        shutil.rmtree(output_base_dir)
-        print(f"Удалена предыдущая директория извлечения: {output_base_dir}")
     os.makedirs(output_base_dir, exist_ok=True)
-    print(f"Создана базовая директория для извлечения: {output_base_dir}")
 
-    # --- Этап 1: Рекурсивная распаковка всех ZIP-архивов ---
-    processed_zip_paths = set()
-    queue = [main_zip_path]  # Очередь для обработки ZIP-файлов
-
-    # Распаковываем основной архив в его собственную подпапку
-    extracted_main_path = _recursive_unzip(main_zip_path, output_base_dir)
-    if not extracted_main_path:
-        print("Не удалось распаковать основной архив. Завершение работы.")
-        return
-    processed_zip_paths.add(main_zip_path)  # Добавляем основной архив в обработанные
-
-    # Теперь ищем все ZIP-файлы внутри только что распакованного основного архива
-    # и добавляем их в очередь
-    for root, _, files in os.walk(extracted_main_path):
-        for file in files:
-            if file.endswith('.zip'):
-                zip_path = os.path.join(root, file)
-                if zip_path not in processed_zip_paths:
-                    queue.append(zip_path)
-                    processed_zip_paths.add(zip_path)
-
-    # Обрабатываем очередь ZIP-файлов, включая те, что будут найдены после распаковки
-    idx = 0
-    while idx < len(queue):
-        current_zip_path = queue[idx]
-        idx += 1
-
-        if current_zip_path == main_zip_path:  # Основной архив уже распакован, пропускаем его повторную обработку
-            continue
-
-        # Определяем директорию, куда будет распакован текущий вложенный ZIP
-        # Это будет родительская директория текущего ZIP-файла
-        extract_target_for_nested_zip = os.path.dirname(current_zip_path)
-
-        extracted_path = _recursive_unzip(current_zip_path, extract_target_for_nested_zip)
-        if extracted_path:
-            # Ищем новые ZIP-файлы внутри только что распакованного архива
-            for root_new, _, files_new in os.walk(extracted_path):
-                for file_new in files_new:
-                    if file_new.endswith('.zip'):
-                        new_zip_path = os.path.join(root_new, file_new)
-                        if new_zip_path not in processed_zip_paths:
-                            queue.append(new_zip_path)
-                            processed_zip_paths.add(new_zip_path)
-
-    print("\n--- Все архивы распакованы. Начинается обработка CSV файлов ---")
-
-    # --- Этап 2: Обработка распакованных данных ---
+    main_folder = os.path.join(output_base_dir, os.path.splitext(os.path.basename(main_zip_path))[0])
     all_merged_dfs = []
 
-    # Теперь ищем папки tracking_data_* внутри main_extract_path
-    # Это гарантирует, что мы обрабатываем только те папки, которые были результатом распаковки
-    # tracking_data архивов
-    for root, dirs, _ in os.walk(extracted_main_path):
-        for dir_name in dirs:
-            if dir_name.startswith('tracking_data_'):
-                tracking_data_folder_path = os.path.join(root, dir_name)
-
-                found_files = {}
-                # Изменены требуемые файлы для поиска по префиксу
-                required_prefixes = {
-                    'location_': None,
-                    'motion_': None,
-                    'acceleration_': None
-                }
-
-                # Ищем CSV-файлы рекурсивно внутри этой папки tracking_data_*
-                print(f"Начинаем рекурсивный поиск CSV файлов в: {tracking_data_folder_path}")
-                for sub_root_dir, sub_dirs, sub_files in os.walk(tracking_data_folder_path):
-                    print(f"  Текущая директория: {sub_root_dir}")
-                    print(f"  Поддиректории: {sub_dirs}")
-                    print(f"  Файлы в текущей директории: {sub_files}")
-                    for sub_file in sub_files:
-                        if sub_file.endswith('.csv'):
-                            for prefix in required_prefixes:
-                                if sub_file.startswith(prefix) and required_prefixes[prefix] is None:
-                                    required_prefixes[prefix] = os.path.join(sub_root_dir, sub_file)
-                                    print(f"    НАЙДЕН ТРЕБУЕМЫЙ ФАЙЛ: {sub_file} по пути: {required_prefixes[prefix]}")
-                                    break  # Нашли файл для этого префикса, переходим к следующему
+    try:
+        with zipfile.ZipFile(main_zip_path, 'r') as main_zip:
+            for tracking_data_folder_path, found in iter_tracking_sessions(main_zip, main_zip_path, main_folder):
+                dir_name = os.path.basename(tracking_data_folder_path)
 
                 # Проверяем, все ли требуемые файлы были найдены (по их префиксам)
-                if not all(value is not None for value in required_prefixes.values()):
-                    missing_files = [p for p, path in required_prefixes.items() if path is None]
+                missing_files = [prefix for prefix in REQUIRED_PREFIXES if prefix not in found]
+                if missing_files:
                     print(
-                        f"Ошибка: Не все необходимые CSV файлы найдены в '{tracking_data_folder_path}'. Отсутствуют: {', '.join(missing_files)}. Пропускаем эту папку.")
+                        f"Ошибка: Не все необходимые CSV файлы найдены в '{dir_name}'. Отсутствуют: {', '.join(missing_files)}. Пропускаем эту сессию.")
                     continue
 
-                location_file = required_prefixes['location_']
-                motion_file = required_prefixes['motion_']
-                acceleration_file = required_prefixes['acceleration_']
-
-                merged_df = merge_sensor_data(location_file, motion_file, acceleration_file)
+                # Файлы читаются прямо из архивов, без промежуточных файлов на диске
+                with ExitStack() as streams:
+                    location_file, motion_file, acceleration_file = (
+                        streams.enter_context(found[prefix][0].open(found[prefix][1])) for prefix in REQUIRED_PREFIXES)
+                    merged_df = merge_sensor_data(location_file, motion_file, acceleration_file)
 
                 if merged_df is not None:
                     output_filename = os.path.join(tracking_data_folder_path, 'merged_data.csv')
                     try:
+                        os.makedirs(tracking_data_folder_path, exist_ok=True)
                         merged_df.to_csv(output_filename, index=False, encoding='utf-8-sig')
                         print(f"Результат объединенной таблицы для '{dir_name}' сохранен в файл: {output_filename}")
                         all_merged_dfs.append(merged_df)
                     except Exception as e:
                         print(f"Не удалось сохранить файл '{output_filename}': {e}")
+    except zipfile.BadZipFile:
+        print(f"Ошибка: '{main_zip_path}' не является действительным ZIP-файлом.")
+        return
+    except FileNotFoundError:
+        print(f"Ошибка: Файл '{main_zip_path}' не найден.")
+        return
 
     if all_merged_dfs:
         final_combined_df = pd.concat(all_merged_dfs, ignore_index=True)
@@ -0,0 +1,193 @@
+import numpy as np
+
+# Методы интерполяции между соседними опорными точками (GPS-фиксациями):
+# 'linear' — отрезки прямых; 'quadratic' — парабола через ближайшие три точки;
+# 'bessel' — локальный кубический эрмитов полином с наклонами Бесселя (производная параболы через
+# три соседние точки), на краях — с нулевой второй производной крайнего участка;
+# 'akima' — кубический сплайн Акимы, не дающий выбросов у резких изменений.
+# Глобальной подгонки нет: каждый участок зависит не больше чем от SUPPORT_POINTS точек с каждой стороны.
+# Поэтому это не естественный кубический сплайн (как у прежнего сплайна order=3): вторая производная
+# в опорных точках не непрерывна, зато каждый участок считается независимо.
+SUPPORT_POINTS = 3
+METHODS = ('linear', 'quadratic', 'bessel', 'akima')
+# Метод по порядку полинома (как order у сплайнов)
+ORDER_METHODS = {1: 'linear', 2: 'quadratic', 3: 'bessel'}
+
+
+def _bessel_slopes(h: np.ndarray, delta: np.ndarray) -> np.ndarray:
+    """
+    Наклоны в точках: производная параболы через соседние точки, на краях — такие,
+    чтобы вторая производная крайнего участка на краю была нулевой.
+    """
+    slopes = np.empty(len(h) + 1)
+    slopes[1:-1] = (h[1:] * delta[:-1] + h[:-1] * delta[1:]) / (h[:-1] + h[1:])
+    if len(h) == 1:
+        slopes[:] = delta[0]
+        return slopes
+    slopes[0] = (3 * delta[0] - slopes[1]) / 2
+    slopes[-1] = (3 * delta[-1] - slopes[-2]) / 2
+    return slopes
+
+
+def _akima_slopes(delta: np.ndarray) -> np.ndarray:
+    """
+    Наклоны Акимы: взвешенное среднее соседних наклонов участков с весами по изменению наклонов
+    с другой стороны. За краями наклоны участков продолжаются линейно.
+    """
+    extended = np.empty(len(delta) + 4)
+    extended[2:-2] = delta
+    extended[1] = 2 * extended[2] - extended[3] if len(delta) > 1 else delta[0]
+    extended[0] = 2 * extended[1] - extended[2]
+    extended[-2] = 2 * extended[-3] - extended[-4] if len(delta) > 1 else delta[-1]
+    extended[-1] = 2 * extended[-2] - extended[-3]
+
+    left = np.abs(extended[3:] - extended[2:-1])
+    right = np.abs(extended[1:-2] - extended[:-3])
+    total = left + right
+    average = (extended[1:-2] + extended[2:-1]) / 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weighted = (left * extended[1:-2] + right * extended[2:-1]) / total
+    return np.where(total > 0, weighted, average)
+
+
+def _pieces(h: np.ndarray, max_gap: float | None) -> np.ndarray:
+    """
+    Границы кусков опорных точек, разделенных промежутками длиннее max_gap:
+    кусок k — точки bounds[k]..bounds[k + 1] - 1.
+    """
+    gaps = np.flatnonzero(h > max_gap) if max_gap is not None else np.zeros(0, dtype=np.int64)
+    return np.concatenate([[0], gaps + 1, [len(h) + 1]])
+
+
+def interpolate(x, y, xi, method: str = 'linear', max_gap: float | None = None) -> np.ndarray:
+    """
+    Значения интерполянта по опорным точкам (x, y) в точках xi (x — строго возрастают).
+    Участок каждой точки xi находится бинарным поиском, полином участка вычисляется векторно,
+    поэтому затраты линейны по числу точек xi. В опорных точках результат равен y;
+    за пределами [x[0], x[-1]] — NaN (продолжение за края оставляется вызывающему коду).
+    Промежутки длиннее max_gap (например, между сессиями) интерполируются линейно, и точки
+    по разные стороны от них не влияют друг на друга: иначе полиномы дают там большие выбросы.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Неизвестный метод интерполяции: {method}")
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    xi = np.asarray(xi, dtype=np.float64)
+    result = np.full(len(xi), np.nan)
+    inside = np.flatnonzero((xi >= x[0]) & (xi <= x[-1])) if len(x) else np.zeros(0, dtype=np.int64)
+    if len(x) < 2:
+        result[inside] = y[0] if len(x) else np.nan
+        return result
+
+    points = xi[inside]
+    # Участок [x[i], x[i + 1]], содержащий точку; правый край относится к последнему участку
+    i = np.clip(np.searchsorted(x, points, side='right') - 1, 0, len(x) - 2)
+    h = np.diff(x)
+    t = (points - x[i]) / h[i]
+    values = y[i] + (y[i + 1] - y[i]) * t
+    if method != 'linear':
+        bounds = _pieces(h, max_gap)
+        # Куски участков: у участка через длинный промежуток кусок из двух точек, он остается линейным
+        piece = np.searchsorted(bounds, i, side='right') - 1
+        first, last = bounds[piece], bounds[piece + 1] - 1
+        curved = (last - first >= 2) & (h[i] <= (max_gap if max_gap is not None else np.inf))
+        if method == 'quadratic':
+            values[curved] = _quadratic(x, y, points[curved], i[curved], first[curved], last[curved])
+        else:
+            values[curved] = _hermite(x, y, h, bounds, method, i[curved], t[curved])
+    result[inside] = values
+    return result
+
+
+def _quadratic(x, y, points, i, first, last) -> np.ndarray:
+    """
+    Парабола через точки j, j + 1, j + 2 своего куска (у последнего участка — через три последние).
+    """
+    j = np.minimum(i, last - 2)
+    x0, x1, x2 = x[j], x[j + 1], x[j + 2]
+    return (y[j] * (points - x1) * (points - x2) / ((x0 - x1) * (x0 - x2)) +
+            y[j + 1] * (points - x0) * (points - x2) / ((x1 - x0) * (x1 - x2)) +
+            y[j + 2] * (points - x0) * (points - x1) / ((x2 - x0) * (x2 - x1)))
+
+
+def _hermite(x, y, h, bounds, method, i, t) -> np.ndarray:
+    """
+    Кубический эрмитов полином участка по значениям и наклонам на его концах.
+    Наклоны считаются отдельно для каждого куска (только по опорным точкам).
+    """
+    delta = np.diff(y) / h
+    slopes = np.empty(len(x))
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop - start < 2:
+            continue
+        piece_h, piece_delta = h[start:stop - 1], delta[start:stop - 1]
+        slopes[start:stop] = (_bessel_slopes(piece_h, piece_delta) if method == 'bessel'
+                              else _akima_slopes(piece_delta))
+    t2 = t * t
+    t3 = t2 * t
+    return ((2 * t3 - 3 * t2 + 1) * y[i] + (t3 - 2 * t2 + t) * h[i] * slopes[i] +
+            (3 * t2 - 2 * t3) * y[i + 1] + (t3 - t2) * h[i] * slopes[i + 1])
+
+
+def bracket(x, xi, max_gap: float | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Общие для всех столбцов индексы и веса линейной интерполяции: для каждой точки xi — номер i
+    левой опорной точки и доля t участка [x[i], x[i + 1]] (x — строго возрастают, не меньше двух точек).
+    valid — точки внутри [x[0], x[-1]], не попавшие на участки длиннее max_gap.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    xi = np.asarray(xi, dtype=np.float64)
+    i = np.clip(np.searchsorted(x, xi, side='right') - 1, 0, len(x) - 2)
+    h = x[i + 1] - x[i]
+    t = (xi - x[i]) / h
+    valid = (xi >= x[0]) & (xi <= x[-1])
+    if max_gap is not None:
+        # Точка ровно в опорной точке берет ее значение и на краю длинного участка
+        valid &= (h <= max_gap) | (t == 0) | (t == 1)
+    return i, t, valid
+
+
+def interpolate_columns(x, columns: dict, xi, circular=(), missing_values: dict | None = None,
+                        max_gap: float | None = None, period: float = 360.0) -> dict[str, np.ndarray]:
+    """
+    Линейная интерполяция сразу нескольких столбцов (columns — {имя: значения в точках x}) в точки xi.
+    Индексы и веса (см. bracket) вычисляются один раз и применяются ко всем столбцам, поэтому
+    каждый следующий столбец стоит одну векторную операцию.
+
+    circular — столбцы-углы с периодом period: интерполяция по кратчайшей дуге, результат в [0, period).
+    missing_values — {имя: значение-признак отсутствия} (например, -1 для скорости и курса без GPS):
+    такие точки не используются, значения рядом с ними берутся по соседним точкам с данными.
+    За пределами [x[0], x[-1]] и на участках длиннее max_gap результат — NaN.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    xi = np.asarray(xi, dtype=np.float64)
+    missing_values = missing_values or {}
+    if len(x) < 2:
+        # Одна опорная точка — значение только в ней самой
+        return {name: np.where(xi == x[0], np.asarray(values, dtype=np.float64)[0], np.nan) if len(x)
+                else np.full(len(xi), np.nan) for name, values in columns.items()}
+
+    i, t, valid = bracket(x, xi, max_gap)
+    result = {}
+    for name, values in columns.items():
+        y = np.asarray(values, dtype=np.float64)
+        if name in missing_values:
+            y = np.where(y == missing_values[name], np.nan, y)
+        left, right = y[i], y[i + 1]
+        if name in circular:
+            difference = (right - left + period / 2) % period - period / 2
+            interpolated = (left + difference * t) % period
+        else:
+            interpolated = left + (right - left) * t
+        # В опорной точке — ее значение, даже если соседняя точка без данных
+        interpolated = np.where(t == 0, left, np.where(t == 1, right, interpolated))
+        interpolated[~valid] = np.nan
+
+        # Участки с точкой без данных пересчитываются только по точкам с данными этого столбца
+        redo = valid & np.isnan(interpolated)
+        known = ~np.isnan(y)
+        if redo.any() and known.any() and not known.all():
+            interpolated[redo] = interpolate_columns(x[known], {name: y[known]}, xi[redo], circular,
+                                                     max_gap=max_gap, period=period)[name]
+        result[name] = interpolated
+    return result
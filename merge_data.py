@@ -3,6 +3,19 @@ import zipfile
 from datetime import datetime
 import re
 import io  # Используется для работы с архивами в памяти
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import tempfile
+
+import columnar_store
+import imu_archive
+import ingest_pipeline
+import merge_manifest
+import nested_archive
+import partitioned_output
+import session_catalog
+import time_index
 
 # --- 1. НАСТРОЙКА ---
 INPUT_DIR = 'data'
@@ -22,6 +35,41 @@ FILE_HEADERS = {
     'acceleration': 'timestamp,x_accel,y_accel,z_accel'
 }
 
+# Инкрементальный режим: обрабатываются только новые архивы из INPUT_DIR (см. merge_manifest.py)
+INCREMENTAL = True
+
+# Дополнительная секционированная раскладка итоговых данных (см. partitioned_output.py):
+# загрузчики с заданным интервалом времени открывают только пересекающиеся с ним секции
+PARTITIONED_OUTPUT = False
+# Секция — день начала сессии ('day') или вложенный архив tracking_data_* ('session')
+PARTITION_BY = 'day'
+
+# Режим обработки архивов: 'serial' — последовательный (эталонный), 'parallel' — пул рабочих,
+# 'pipeline' — конвейер asyncio с ограниченными очередями между стадиями (см. ingest_pipeline.py)
+INGEST_MODE = 'parallel'
+# Число параллельных рабочих для распаковки вложенных архивов (1 — последовательная обработка)
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+# Тип пула: 'thread' (zlib освобождает GIL) или 'process'. В пуле потоков распакованный вложенный
+# архив держится в памяти до nested_archive.NESTED_MEMORY_LIMIT, в пуле процессов — всегда
+# во временном файле на диске (см. decode_nested_archive)
+INGEST_EXECUTOR = 'thread'
+
+# Потоковая перезапись CSV блоками байтов (False — построчная обработка через prepare_data)
+STREAMING_REWRITE = True
+# Размер блока, читаемого из архива при потоковой перезаписи
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Знак суффикса часового пояса в первом поле строки: плюс или минус после цифры, за которым
+# смещение ЧЧММ / ЧЧ:ММ до конца поля (так минус не путается с дефисами даты)
+TIMEZONE_SIGN = rb'(?:\+|(?<=\d)-(?=\d{2}:?\d{2}(?:[,\r\n]|$)))'
+# Суффикс часового пояса (+ЧЧММ, -ЧЧММ, ±ЧЧ:ММ) в первом поле строки
+TIMEZONE_SUFFIX_RE = re.compile(rb'^([^,+\n]*?)' + TIMEZONE_SIGN + rb'[^,\n]*', re.MULTILINE)
+# Смещение от UTC в суффиксе часового пояса: знак, часы, минуты
+UTC_OFFSET_RE = re.compile(rb'^[^,+\n]*?(' + TIMEZONE_SIGN + rb')(\d{2}):?(\d{2})', re.MULTILINE)
+# Пробельные символы по краям строки, которые убирает str.strip() в prepare_data
+LINE_EDGE_WHITESPACE_RE = re.compile(rb'^[ \t\r\x0b\x0c]+|[ \t\r\x0b\x0c]+$', re.MULTILINE)
+WHITESPACE_RE = re.compile(rb'[ \t\r\x0b\x0c]')
+
 
 def key_from_filename(filename: str) -> datetime | str:
     if groups := re.search(r"(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})", filename):
@@ -36,10 +84,495 @@ def prepare_data(data: list[str]) -> list[str]:
     for raw_line in data:
         line = raw_line.strip()
         fields = line.split(',')
-        timestamp = fields[0].split("+")[0]
+        timestamp = TIMEZONE_SUFFIX_RE.sub(rb'\1', fields[0].encode('utf-8')).decode('utf-8')
         result.append(",".join([timestamp] + fields[1:]))
     return result
 
+
+def rewrite_lines(block: bytes) -> bytes:
+    """
+    Байтовый аналог prepare_data для блока целых строк: убирает пробелы по краям строк
+    и суффикс часового пояса у временной метки.
+    """
+    if WHITESPACE_RE.search(block):
+        block = LINE_EDGE_WHITESPACE_RE.sub(b'', block)
+    return TIMEZONE_SUFFIX_RE.sub(rb'\1', block)
+
+
+def parse_utc_offset(block: bytes) -> int | None:
+    """
+    Смещение от UTC (в секундах) первой временной метки блока, у которой есть суффикс часового пояса.
+    Суффикс отбрасывается при перезаписи строк, поэтому смещение запоминается отдельно
+    (см. columnar_store.session_utc_offset).
+    """
+    if match := UTC_OFFSET_RE.search(block):
+        offset = int(match.group(2)) * 3600 + int(match.group(3)) * 60
+        return -offset if match.group(1) == b'-' else offset
+    return None
+
+
+def stream_prepared_data(csv_file, output_handler, chunk_size: int = STREAM_CHUNK_SIZE) -> int | None:
+    """
+    Потоково переписывает CSV из архива в выходной файл, не загружая его в память целиком.
+    Результат побайтово совпадает с записью "\n".join(prepare_data(...)) + "\n".
+    Возвращает смещение от UTC из исходных временных меток (None, если суффиксов нет).
+    """
+    tail = b''
+    empty = True
+    utc_offset = None
+    while chunk := csv_file.read(chunk_size):
+        empty = False
+        chunk = tail + chunk
+        # Обрабатываем только целые строки, неполную последнюю строку переносим в следующий блок
+        cut = chunk.rfind(b'\n') + 1
+        tail = chunk[cut:]
+        if cut:
+            if utc_offset is None:
+                utc_offset = parse_utc_offset(chunk[:cut])
+            output_handler.write(rewrite_lines(chunk[:cut]))
+
+    if tail or empty:
+        if utc_offset is None:
+            utc_offset = parse_utc_offset(tail)
+        output_handler.write(rewrite_lines(tail) + b'\n')
+    return utc_offset
+
+
+def write_csv_member(nested_zip: zipfile.ZipFile, csv_filename: str, output_handler) -> int | None:
+    """
+    Записывает данные CSV-файла из вложенного архива в открытый (в двоичном режиме) выходной файл.
+    Возвращает смещение от UTC из исходных временных меток (см. parse_utc_offset).
+    """
+    with nested_zip.open(csv_filename, 'r') as csv_file:
+        if STREAMING_REWRITE:
+            return stream_prepared_data(csv_file, output_handler)
+        else:
+            # Используем TextIOWrapper для корректного чтения текста из бинарного потока
+            csv_reader = io.TextIOWrapper(csv_file, 'utf-8')
+            raw_lines = csv_reader.readlines()
+            _data = "\n".join(prepare_data(raw_lines))
+            output_handler.write((_data + "\n").encode('utf-8'))
+            return parse_utc_offset("".join(raw_lines).encode('utf-8'))
+
+
+def csv_file_type(csv_filename: str) -> str | None:
+    """
+    Определяет тип файла по его имени.
+    """
+    if 'location' in csv_filename:
+        return 'location'
+    elif 'motion' in csv_filename:
+        return 'motion'
+    elif 'acceleration' in csv_filename:
+        return 'acceleration'
+    return None
+
+
+def find_nested_archives(top_zip: zipfile.ZipFile) -> list[str]:
+    """
+    Находит вложенные архивы tracking_data_* и сортирует их в хронологическом порядке.
+    """
+    raw_nested_zips = [name for name in top_zip.namelist() if name.startswith('tracking_data_')]
+    return sorted(raw_nested_zips, key=key_from_filename)
+
+
+def plan_ingestion(top_level_zips: list[str], known_sessions: set[str] | None = None) -> list[tuple[str, list[dict]]]:
+    """
+    Составляет план обработки: внешние архивы по порядку и описания их вложенных архивов
+    (имя, размер и CRC из каталога внешнего архива, ключ сессии).
+
+    Одна и та же сессия tracking_data_* может попасть в несколько выгрузок. Повторы
+    (совпадают имя и CRC CSV-файлов, см. nested_archive.session_key) исключаются из плана,
+    поэтому каждая сессия распаковывается и записывается ровно один раз.
+    known_sessions — ключи сессий, уже записанных в итоговые файлы.
+    """
+    seen_sessions = set(known_sessions or ())
+    plan = []
+    for top_zip_filename in top_level_zips:
+        top_zip_path = os.path.join(INPUT_DIR, top_zip_filename)
+        try:
+            with zipfile.ZipFile(top_zip_path, 'r') as top_zip:
+                nested_archives = []
+                for nested_zip_filename in find_nested_archives(top_zip):
+                    info = top_zip.getinfo(nested_zip_filename)
+                    session = nested_archive.session_key(top_zip, top_zip_path, nested_zip_filename)
+                    if session in seen_sessions:
+                        print(f"  Сессия {nested_zip_filename} из {top_zip_filename} уже загружена. Пропускаем.")
+                        continue
+                    seen_sessions.add(session)
+                    nested_archives.append({
+                        'export': top_zip_filename,
+                        'name': nested_zip_filename,
+                        'size': info.file_size,
+                        'crc': info.CRC,
+                        'session': session,
+                    })
+                plan.append((top_zip_filename, nested_archives))
+        except zipfile.BadZipFile:
+            print(f"Ошибка: Архив '{top_zip_filename}' поврежден или не является ZIP-архивом. Пропускаем.")
+        except Exception as e:
+            print(f"Произошла непредвиденная ошибка при обработке {top_zip_filename}: {e}")
+    return plan
+
+
+def write_output(file_type: str, write_data, output_file_handlers: dict, headers_written: dict,
+                 streams: dict | None = None):
+    """
+    Записывает данные одного CSV в итоговый файл своего типа, предваряя их заголовком при первой записи.
+    write_data — функция, которая пишет данные в переданный ей выходной файл; ее результат возвращается.
+    В streams (если передан) запоминается положение данных в файле: [смещение, длина, число строк].
+    Данные одного CSV упорядочены по времени, поэтому каждый такой отрезок — отсортированный участок
+    итогового файла (см. sorted_runs.py).
+    """
+    output_handler = output_file_handlers[file_type]
+
+    # Если заголовок для этого типа файла еще не был записан
+    if not headers_written[file_type]:
+        # Записываем заголовок CSV
+        output_handler.write((FILE_HEADERS[file_type] + "\n").encode('utf-8'))
+        headers_written[file_type] = True
+        message = f"      -> Записан заголовок и данные в {FILE_TYPES[file_type]}"
+    else:
+        # Записываем только данные (заголовок уже записан)
+        message = f"      -> Добавлены данные в {FILE_TYPES[file_type]}"
+
+    start = output_handler.tell()
+    start_lines = output_handler.lines
+    result = write_data(output_handler)
+    if streams is not None:
+        length, lines = output_handler.tell() - start, output_handler.lines - start_lines
+        if file_type in streams:
+            streams[file_type][1] += length
+            streams[file_type][2] += lines
+        else:
+            streams[file_type] = [start, length, lines]
+    print(message)
+    return result
+
+
+def decode_nested_archive(top_zip_path: str, nested_zip_filename: str,
+                          spool: bool = True) -> tuple[object, list[tuple[str, str, int, int, int | None]]]:
+    """
+    Распаковывает CSV-файлы одного вложенного архива и переписывает их в общий буфер.
+    Возвращает буфер и список (имя CSV, тип файла, смещение, длина, смещение от UTC) в порядке записи.
+
+    При spool=True буфер — временный файл, который остается в памяти до NESTED_MEMORY_LIMIT
+    и дальше переносится на диск. Для пула процессов (spool=False) открытый файл передать нельзя,
+    поэтому данные пишутся в именованный временный файл на диске и возвращается его путь:
+    память рабочего процесса и передача результата не зависят от размера архива.
+    Буфер освобождается через close_decoded.
+    Выполняется в рабочих потоках/процессах параллельного режима, поэтому открывает архив сам.
+    """
+    decoded = []
+    if spool:
+        buffer = tempfile.SpooledTemporaryFile(max_size=nested_archive.NESTED_MEMORY_LIMIT)
+    else:
+        buffer = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+
+    try:
+        with zipfile.ZipFile(top_zip_path, 'r') as top_zip, \
+                nested_archive.open_nested_archive(top_zip, top_zip_path, nested_zip_filename) as nested_zip:
+            csv_files = sorted([name for name in nested_zip.namelist() if name.endswith('.csv')])
+            for csv_filename in csv_files:
+                file_type = csv_file_type(csv_filename)
+                if file_type:
+                    start = buffer.tell()
+                    utc_offset = write_csv_member(nested_zip, csv_filename, buffer)
+                    decoded.append((csv_filename, file_type, start, buffer.tell() - start, utc_offset))
+    except BaseException:
+        buffer.close()
+        close_decoded(None if spool else buffer.name)
+        raise
+
+    if not spool:
+        buffer.close()
+        return buffer.name, decoded
+    buffer.seek(0)
+    return buffer, decoded
+
+
+def close_decoded(buffer) -> None:
+    """
+    Освобождает буфер decode_nested_archive: закрывает временный файл или удаляет его по пути.
+    """
+    if isinstance(buffer, str):
+        try:
+            os.remove(buffer)
+        except FileNotFoundError:
+            pass
+    elif buffer is not None:
+        buffer.close()
+
+
+def copy_decoded(buffer, offset: int, length: int, output_handler) -> None:
+    """
+    Копирует отрезок результата decode_nested_archive (открытого буфера) в выходной файл.
+    """
+    buffer.seek(offset)
+    while length > 0:
+        chunk = buffer.read(min(STREAM_CHUNK_SIZE, length))
+        output_handler.write(chunk)
+        length -= len(chunk)
+
+
+def ingest_serial(plan: list[tuple[str, list[dict]]], output_file_handlers: dict, headers_written: dict,
+                  archives: list[dict]) -> None:
+    """
+    Последовательная обработка архивов (эталонный режим).
+    Записи об успешно обработанных вложенных архивах добавляются в archives.
+    """
+    # Перебираем внешние архивы в хронологическом порядке
+    for top_zip_filename, nested_archives in plan:
+        top_zip_path = os.path.join(INPUT_DIR, top_zip_filename)
+        print(f"\n[1] Обработка внешнего архива: {top_zip_filename}")
+
+        try:
+            # Открываем внешний архив для чтения
+            with zipfile.ZipFile(top_zip_path, 'r') as top_zip:
+                # Перебираем вложенные архивы
+                for entry in nested_archives:
+                    nested_zip_filename = entry['name']
+                    print(f"  [2] Обработка вложенного архива: {nested_zip_filename}")
+                    streams = {}
+                    utc_offsets = {}
+
+                    # Открываем вложенный архив прямо из внешнего, не извлекая его на диск
+                    with nested_archive.open_nested_archive(top_zip, top_zip_path, nested_zip_filename) as nested_zip:
+                        # Находим и сортируем CSV-файлы внутри вложенного архива
+                        csv_files = sorted([name for name in nested_zip.namelist() if name.endswith('.csv')])
+
+                        # --- 4. ОБРАБОТКА И ЗАПИСЬ CSV ---
+                        for csv_filename in csv_files:
+                            print("Обработка csv файла ", csv_filename)
+                            file_type = csv_file_type(csv_filename)
+
+                            if file_type:
+                                print(f"    [3] Найден файл: {csv_filename}, тип: {file_type}")
+                                utc_offset = write_output(
+                                    file_type,
+                                    lambda handler: write_csv_member(nested_zip, csv_filename, handler),
+                                    output_file_handlers,
+                                    headers_written,
+                                    streams,
+                                )
+                                if utc_offset is not None:
+                                    utc_offsets.setdefault(file_type, utc_offset)
+
+                    archives.append(dict(entry, streams=streams, utc_offsets=utc_offsets))
+
+        except zipfile.BadZipFile:
+            print(f"Ошибка: Архив '{top_zip_filename}' поврежден или не является ZIP-архивом. Пропускаем.")
+        except Exception as e:
+            print(f"Произошла непредвиденная ошибка при обработке {top_zip_filename}: {e}")
+
+
+def ingest_parallel(plan: list[tuple[str, list[dict]]], output_file_handlers: dict, headers_written: dict,
+                    archives: list[dict], workers: int) -> None:
+    """
+    Параллельная обработка вложенных архивов пулом потоков или процессов.
+    Результаты записываются строго в порядке плана, поэтому итоговые файлы
+    побайтово совпадают с последовательным режимом.
+    """
+    executor_class = ProcessPoolExecutor if INGEST_EXECUTOR == 'process' else ThreadPoolExecutor
+    failed_archives = set()
+    current_archive = None
+
+    def emit(entry, future):
+        nonlocal current_archive
+        top_zip_filename = entry['export']
+        if top_zip_filename != current_archive:
+            current_archive = top_zip_filename
+            print(f"\n[1] Обработка внешнего архива: {top_zip_filename}")
+        if top_zip_filename in failed_archives:
+            # Уже распакованный результат не нужен, но его временный файл надо удалить
+            if not future.cancel() and future.exception() is None:
+                close_decoded(future.result()[0])
+            return
+        try:
+            result, decoded = future.result()
+        except zipfile.BadZipFile:
+            print(f"Ошибка: Архив '{top_zip_filename}' поврежден или не является ZIP-архивом. Пропускаем.")
+            failed_archives.add(top_zip_filename)
+            return
+        except Exception as e:
+            print(f"Произошла непредвиденная ошибка при обработке {top_zip_filename}: {e}")
+            failed_archives.add(top_zip_filename)
+            return
+
+        print(f"  [2] Обработка вложенного архива: {entry['name']}")
+        streams = {}
+        utc_offsets = {}
+        # Из пула процессов приходит путь к временному файлу
+        buffer = open(result, 'rb') if isinstance(result, str) else result
+        try:
+            for csv_filename, file_type, offset, length, utc_offset in decoded:
+                print(f"    [3] Найден файл: {csv_filename}, тип: {file_type}")
+                write_output(file_type, lambda handler: copy_decoded(buffer, offset, length, handler),
+                             output_file_handlers, headers_written, streams)
+                if utc_offset is not None:
+                    utc_offsets.setdefault(file_type, utc_offset)
+        finally:
+            if buffer is not result:
+                buffer.close()
+            close_decoded(result)
+        archives.append(dict(entry, streams=streams, utc_offsets=utc_offsets))
+
+    with executor_class(max_workers=workers) as executor:
+        # Ограничиваем число архивов «в полете», чтобы не держать в памяти все результаты сразу
+        pending = deque()
+        for top_zip_filename, nested_archives in plan:
+            top_zip_path = os.path.join(INPUT_DIR, top_zip_filename)
+            for entry in nested_archives:
+                future = executor.submit(decode_nested_archive, top_zip_path, entry['name'],
+                                         INGEST_EXECUTOR != 'process')
+                pending.append((entry, future))
+                while len(pending) > 2 * workers:
+                    emit(*pending.popleft())
+        while pending:
+            emit(*pending.popleft())
+
+
+def ingest(plan: list[tuple[str, list[dict]]], output_file_handlers: dict, headers_written: dict) -> list[dict]:
+    """
+    Обрабатывает архивы по плану в настроенном режиме и возвращает записи об обработанных архивах.
+    """
+    archives = []
+    if INGEST_MODE == 'pipeline':
+        print("Конвейерная обработка (asyncio).")
+        ingest_pipeline.ingest_pipeline(plan, INPUT_DIR, output_file_handlers, headers_written, archives,
+                                        csv_file_type, rewrite_lines, parse_utc_offset, write_output)
+    elif INGEST_MODE == 'parallel' and INGEST_WORKERS > 1:
+        print(f"Параллельная обработка: {INGEST_WORKERS} рабочих ({INGEST_EXECUTOR}).")
+        ingest_parallel(plan, output_file_handlers, headers_written, archives, INGEST_WORKERS)
+    else:
+        ingest_serial(plan, output_file_handlers, headers_written, archives)
+    return archives
+
+
+class LineCountingWriter:
+    """
+    Выходной файл, который считает записанные строки.
+    """
+
+    def __init__(self, handler):
+        self._handler = handler
+        self.lines = 0
+
+    def write(self, data) -> int:
+        self.lines += (data if isinstance(data, bytes) else bytes(data)).count(b'\n')
+        return self._handler.write(data)
+
+    def tell(self) -> int:
+        return self._handler.tell()
+
+    def close(self) -> None:
+        self._handler.close()
+
+
+def open_outputs(paths: dict, mode: str) -> dict:
+    """
+    Открывает итоговые (или промежуточные) файлы всех типов в двоичном режиме.
+    """
+    return {file_type: LineCountingWriter(open(path, mode)) for file_type, path in paths.items()}
+
+
+def rebuild_outputs(plan: list[tuple[str, list[dict]]]) -> list[dict]:
+    """
+    Полная пересборка итоговых файлов по плану.
+    """
+    # Словарь для хранения информации о том, был ли уже записан заголовок для каждого типа файла
+    headers_written = {file_type: False for file_type in FILE_TYPES}
+
+    # Открываем итоговые файлы для записи в двоичном режиме: данные пишутся блоками байтов.
+    output_paths = {file_type: os.path.join(OUTPUT_DIR, filename) for file_type, filename in FILE_TYPES.items()}
+    output_file_handlers = open_outputs(output_paths, 'wb')
+    try:
+        return ingest(plan, output_file_handlers, headers_written)
+    finally:
+        for handler in output_file_handlers.values():
+            handler.close()
+
+
+def append_outputs(plan: list[tuple[str, list[dict]]], archives: list[dict]) -> list[dict]:
+    """
+    Инкрементальное обновление: новые архивы обрабатываются в промежуточные файлы,
+    а затем вставляются в итоговые файлы на свое место в хронологическом порядке.
+    """
+    staging_paths = {file_type: os.path.join(OUTPUT_DIR, f'.staging_{filename}')
+                     for file_type, filename in FILE_TYPES.items()}
+    headers_written = {file_type: True for file_type in FILE_TYPES}
+
+    output_file_handlers = open_outputs(staging_paths, 'wb')
+    try:
+        staged_archives = ingest(plan, output_file_handlers, headers_written)
+    finally:
+        for handler in output_file_handlers.values():
+            handler.close()
+
+    try:
+        return merge_manifest.splice_outputs(
+            OUTPUT_DIR, FILE_TYPES, FILE_HEADERS, archives, staged_archives, staging_paths)
+    finally:
+        for path in staging_paths.values():
+            os.remove(path)
+
+
+def update_sidecars(archives: list[dict]) -> None:
+    """
+    Обновляет файлы рядом с итоговыми: колоночное хранилище (columnar_store.py),
+    разреженный индекс времени (time_index.py), каталог сессий (session_catalog.py)
+    и сжатый архив потоков IMU (imu_archive.py), а при PARTITIONED_OUTPUT — секции (partitioned_output.py).
+    """
+    columnar_store.update_store(OUTPUT_DIR, FILE_TYPES, FILE_HEADERS, archives)
+    time_index.update_index(OUTPUT_DIR, FILE_TYPES, archives)
+    session_catalog.update_catalog(OUTPUT_DIR, FILE_TYPES, FILE_HEADERS, archives)
+    imu_archive.update_archive(OUTPUT_DIR, FILE_TYPES, FILE_HEADERS, archives)
+    if PARTITIONED_OUTPUT:
+        partitioned_output.update_partitions(OUTPUT_DIR, FILE_TYPES, FILE_HEADERS, archives, PARTITION_BY)
+
+
+def update_outputs(top_level_zips: list[str]) -> tuple[list[dict], bool]:
+    """
+    Инкрементальное обновление итоговых файлов по манифесту: загружаются только новые архивы,
+    при расхождении с манифестом файлы пересобираются полностью. Сохраняет новый манифест.
+    Возвращает (записи об архивах в итоговых файлах, была ли полная пересборка).
+    """
+    manifest = merge_manifest.load_manifest(OUTPUT_DIR)
+    new_exports, exports = merge_manifest.find_new_exports(
+        manifest, INPUT_DIR, OUTPUT_DIR, FILE_TYPES, top_level_zips)
+
+    if new_exports is None:
+        print("Полная пересборка итоговых файлов.")
+        plan = plan_ingestion(top_level_zips)
+        archives = rebuild_outputs(plan)
+    elif new_exports:
+        print(f"Инкрементальное обновление: новых архивов — {len(new_exports)}.")
+        known_sessions = {archive['session'] for archive in manifest['archives']}
+        plan = plan_ingestion(new_exports, known_sessions)
+        archives = append_outputs(plan, manifest['archives'])
+    else:
+        print("Новых архивов нет, итоговые файлы актуальны.")
+        plan = []
+        archives = manifest['archives']
+
+    # Внешний архив считается загруженным, если записаны все его вложенные архивы из плана.
+    # Остальные не попадают в манифест и будут обработаны повторно (уже записанные сессии пропустятся).
+    written = {(archive['export'], archive['name']) for archive in archives}
+    known_exports = set(manifest['exports']) if new_exports is not None else set()
+    processed_exports = known_exports | {
+        top_zip_filename for top_zip_filename, nested_archives in plan
+        if all((top_zip_filename, entry['name']) in written for entry in nested_archives)
+    }
+    merge_manifest.save_manifest(OUTPUT_DIR, {
+        'version': merge_manifest.MANIFEST_VERSION,
+        'exports': {name: exports[name] for name in top_level_zips if name in processed_exports},
+        'archives': archives,
+        'outputs': merge_manifest.output_sizes(OUTPUT_DIR, FILE_TYPES),
+    })
+    update_sidecars(archives)
+    return archives, new_exports is None
+
+
 def main():
     """
     Главная функция для объединения данных из вложенных архивов.
@@ -50,9 +583,6 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     print(f"Выходная папка '{OUTPUT_DIR}' готова.")
 
-    # Словарь для хранения информации о том, был ли уже записан заголовок для каждого типа файла
-    headers_written = {file_type: False for file_type in FILE_TYPES}
-
     # --- 2. ПОИСК И СОРТИРОВКА ВНЕШНИХ АРХИВОВ ---
     try:
         # Получаем список всех файлов в папке INPUT_DIR
@@ -69,86 +599,11 @@ def main():
         print(f"Ошибка: Папка '{INPUT_DIR}' не найдена. Пожалуйста, создайте ее и поместите туда архивы.")
         return
 
-    # --- 3. ВЛОЖЕННЫЕ ЦИКЛЫ ДЛЯ ОБРАБОТКИ АРХИВОВ ---
-    # Открываем итоговые файлы для записи. 'a' - режим дозаписи (append).
-    with open(os.path.join(OUTPUT_DIR, FILE_TYPES['location']), 'w', encoding='utf-8', newline='') as f_loc, \
-            open(os.path.join(OUTPUT_DIR, FILE_TYPES['motion']), 'w', encoding='utf-8', newline='') as f_mot, \
-            open(os.path.join(OUTPUT_DIR, FILE_TYPES['acceleration']), 'w', encoding='utf-8', newline='') as f_acc:
-
-        output_file_handlers = {
-            'location': f_loc,
-            'motion': f_mot,
-            'acceleration': f_acc
-        }
-
-        # Перебираем внешние архивы в хронологическом порядке
-        for top_zip_filename in top_level_zips:
-            top_zip_path = os.path.join(INPUT_DIR, top_zip_filename)
-            print(f"\n[1] Обработка внешнего архива: {top_zip_filename}")
-
-            try:
-                # Открываем внешний архив для чтения
-                with zipfile.ZipFile(top_zip_path, 'r') as top_zip:
-                    # Находим и сортируем вложенные архивы
-
-                    raw_nested_zips = [name for name in top_zip.namelist() if name.startswith('tracking_data_')]
-                    nested_zips = sorted(raw_nested_zips, key=key_from_filename)
-
-                    # Перебираем вложенные архивы
-                    for nested_zip_filename in nested_zips:
-                        print(f"  [2] Обработка вложенного архива: {nested_zip_filename}")
-
-                        # Читаем вложенный архив в память, чтобы не извлекать его на диск
-                        nested_zip_data = top_zip.read(nested_zip_filename)
-
-                        # Работаем с данными архива в памяти как с файлом
-                        with zipfile.ZipFile(io.BytesIO(nested_zip_data), 'r') as nested_zip:
-                            # Находим и сортируем CSV-файлы внутри вложенного архива
-                            csv_files = sorted([name for name in nested_zip.namelist() if name.endswith('.csv')])
-
-                            # --- 4. ОБРАБОТКА И ЗАПИСЬ CSV ---
-                            for csv_filename in csv_files:
-                                file_type = None
-                                print("Обработка csv файла ", csv_filename)
-
-                                # Определяем тип файла по его имени
-                                if 'location' in csv_filename:
-                                    file_type = 'location'
-                                elif 'motion' in csv_filename:
-                                    file_type = 'motion'
-                                elif 'acceleration' in csv_filename:
-                                    file_type = 'acceleration'
-
-                                if file_type:
-                                    print(f"    [3] Найден файл: {csv_filename}, тип: {file_type}")
-
-                                    # Открываем CSV-файл из архива
-                                    with nested_zip.open(csv_filename, 'r') as csv_file:
-                                        # Используем TextIOWrapper для корректного чтения текста из бинарного потока
-                                        csv_reader = io.TextIOWrapper(csv_file, 'utf-8')
-
-                                        output_handler = output_file_handlers[file_type]
-
-                                        _raw_data = csv_reader.readlines()
-                                        _data = "\n".join(prepare_data(_raw_data))
-
-                                        # Если заголовок для этого типа файла еще не был записан
-                                        if not headers_written[file_type]:
-                                            # Записываем заголовок CSV
-                                            output_handler.write(FILE_HEADERS[file_type] + "\n")
-                                            # Записываем данные
-                                            output_handler.write(_data + "\n")
-                                            headers_written[file_type] = True
-                                            print(f"      -> Записан заголовок и данные в {FILE_TYPES[file_type]}")
-                                        else:
-                                            # Записываем только данные (заголовок уже записан)
-                                            output_handler.write(_data + "\n")
-                                            print(f"      -> Добавлены данные в {FILE_TYPES[file_type]}")
-
-            except zipfile.BadZipFile:
-                print(f"Ошибка: Архив '{top_zip_filename}' поврежден или не является ZIP-архивом. Пропускаем.")
-            except Exception as e:
-                print(f"Произошла непредвиденная ошибка при обработке {top_zip_filename}: {e}")
+    # --- 3. ОБРАБОТКА АРХИВОВ ---
+    if not INCREMENTAL:
+        update_sidecars(rebuild_outputs(plan_ingestion(top_level_zips)))
+    else:
+        update_outputs(top_level_zips)
 
     print("\nПроцесс успешно завершен!")
     print("Итоговые файлы находятся в папке 'output':")
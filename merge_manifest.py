@@ -0,0 +1,163 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# Имя файла манифеста в выходной папке merge_data
+MANIFEST_FILENAME = 'merge_manifest.json'
+MANIFEST_VERSION = 2
+
+# Размер блока при хешировании и копировании файлов
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """
+    Считает SHA-256 содержимого файла, читая его блоками.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def describe_export(path: str, known: dict | None = None) -> dict:
+    """
+    Описание внешнего архива для манифеста: размер, время изменения и хеш содержимого.
+    Если размер и время изменения совпадают с известным описанием, хеш не пересчитывается.
+    """
+    stat = os.stat(path)
+    if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+
+def load_manifest(output_dir: str) -> dict | None:
+    """
+    Загружает манифест из выходной папки. Возвращает None, если его нет или он поврежден.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(output_dir: str, manifest: dict) -> None:
+    """
+    Атомарно сохраняет манифест в выходную папку.
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def output_sizes(output_dir: str, file_types: dict) -> dict:
+    """
+    Текущие размеры итоговых файлов (None для отсутствующих).
+    """
+    sizes = {}
+    for file_type, filename in file_types.items():
+        path = os.path.join(output_dir, filename)
+        sizes[file_type] = os.path.getsize(path) if os.path.exists(path) else None
+    return sizes
+
+
+def find_new_exports(manifest: dict | None, input_dir: str, output_dir: str, file_types: dict,
+                     top_level_zips: list[str]) -> tuple[list[str] | None, dict]:
+    """
+    Сравнивает содержимое папки с манифестом.
+    Возвращает (список новых внешних архивов, описания всех архивов) или (None, ...),
+    если итоговые файлы нужно пересобрать полностью: манифеста нет, итоговые файлы изменены
+    или уже загруженный архив удален либо изменился.
+    """
+    known_exports = manifest['exports'] if manifest else {}
+    exports = {}
+    for top_zip_filename in top_level_zips:
+        exports[top_zip_filename] = describe_export(
+            os.path.join(input_dir, top_zip_filename), known_exports.get(top_zip_filename))
+
+    if manifest is None:
+        return None, exports
+    if output_sizes(output_dir, file_types) != manifest['outputs']:
+        print("Итоговые файлы изменились после последнего запуска.")
+        return None, exports
+    for top_zip_filename, known in known_exports.items():
+        current = exports.get(top_zip_filename)
+        if current is None or current['sha256'] != known['sha256']:
+            print(f"Архив '{top_zip_filename}' удален или изменен после последнего запуска.")
+            return None, exports
+
+    return [name for name in top_level_zips if name not in known_exports], exports
+
+
+def copy_range(src, dst, offset: int, length: int) -> None:
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(COPY_CHUNK_SIZE, length))
+        if not chunk:
+            raise IOError("Неожиданный конец файла при копировании данных")
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def splice_outputs(output_dir: str, file_types: dict, file_headers: dict, archives: list[dict],
+                   staged_archives: list[dict], staging_paths: dict) -> list[dict]:
+    """
+    Вставляет данные новых архивов (уже записанные в промежуточные файлы staging_paths)
+    в итоговые файлы так, чтобы порядок совпадал с полной пересборкой.
+
+    Если новые архивы идут после всех загруженных ранее, данные просто дописываются в конец.
+    Иначе хвост итогового файла, начиная с первого сдвигаемого архива, переписывается заново,
+    поэтому время работы пропорционально объему новых данных и этого хвоста.
+    Возвращает новый список записей об архивах в порядке их расположения в файлах.
+    """
+    # Архивы сортируются по имени внешнего архива, внутри него — в порядке обработки
+    ordered = sorted(
+        [(archive['export'], index, False, archive) for index, archive in enumerate(archives)] +
+        [(archive['export'], index, True, archive) for index, archive in enumerate(staged_archives)],
+        key=lambda item: (item[0], item[1]),
+    )
+    first_new = next((i for i, item in enumerate(ordered) if item[2]), len(ordered))
+    rewritten = ordered[first_new:]
+
+    result = [dict(item[3], streams=dict(item[3]['streams'])) for item in ordered]
+
+    for file_type, filename in file_types.items():
+        path = os.path.join(output_dir, filename)
+        shifted = [item[3]['streams'][file_type] for item in rewritten
+                   if not item[2] and file_type in item[3]['streams']]
+        cut = min((stream[0] for stream in shifted), default=None)
+
+        with tempfile.TemporaryFile(dir=output_dir) as tail, \
+                open(staging_paths[file_type], 'rb') as staged, \
+                open(path, 'r+b' if os.path.exists(path) else 'w+b') as output:
+            # Переносим сдвигаемый хвост во временный файл и обрезаем итоговый файл
+            if cut is not None:
+                output.seek(cut)
+                shutil.copyfileobj(output, tail, COPY_CHUNK_SIZE)
+                output.truncate(cut)
+            output.seek(0, os.SEEK_END)
+            if output.tell() == 0:
+                output.write((file_headers[file_type] + "\n").encode('utf-8'))
+
+            for position, (_, _, is_new, archive) in enumerate(rewritten, start=first_new):
+                if file_type not in archive['streams']:
+                    continue
+                offset, length, lines = archive['streams'][file_type]
+                new_offset = output.tell()
+                if is_new:
+                    copy_range(staged, output, offset, length)
+                else:
+                    copy_range(tail, output, offset - cut, length)
+                result[position]['streams'][file_type] = [new_offset, length, lines]
+
+    return result
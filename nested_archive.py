@@ -0,0 +1,130 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+# Вложенный архив, сжатый внутри внешнего, распаковывается в память только до этого размера (в байтах),
+# больше — во временный файл на диске. Ограничивает пиковую память на один вложенный архив.
+NESTED_MEMORY_LIMIT = 64 * 1024 * 1024
+
+# Размер блока при копировании данных во временный файл
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Локальный заголовок файла в ZIP: сигнатура и фиксированная часть (30 байт)
+LOCAL_HEADER_STRUCT = struct.Struct('<4s2B4HL2L2H')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+class FileWindow(io.RawIOBase):
+    """
+    Файловый объект только для чтения, который видит отрезок [offset, offset + length) другого файла.
+    Позволяет открыть несжатый вложенный архив прямо из внешнего архива без копирования в память.
+    У каждого окна свой дескриптор файла, поэтому окна можно читать из разных потоков.
+    """
+
+    def __init__(self, path: str, offset: int, length: int):
+        super().__init__()
+        self._file = open(path, 'rb')
+        self._offset = offset
+        self._length = length
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            new_pos = pos
+        elif whence == os.SEEK_CUR:
+            new_pos = self._pos + pos
+        elif whence == os.SEEK_END:
+            new_pos = self._length + pos
+        else:
+            raise ValueError(f"Недопустимое значение whence: {whence}")
+        if new_pos < 0:
+            raise ValueError("Отрицательная позиция в файле")
+        self._pos = new_pos
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._length - self._pos)
+        if size <= 0:
+            return 0
+        self._file.seek(self._offset + self._pos)
+        read = self._file.readinto(memoryview(buffer)[:size])
+        self._pos += read
+        return read
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def member_data_offset(fileobj, info: zipfile.ZipInfo) -> int:
+    """
+    Смещение данных элемента архива от начала файла архива (после его локального заголовка).
+    """
+    fileobj.seek(info.header_offset)
+    header = fileobj.read(LOCAL_HEADER_STRUCT.size)
+    fields = LOCAL_HEADER_STRUCT.unpack(header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile(f"Неверный локальный заголовок у '{info.filename}'")
+    filename_length, extra_length = fields[-2], fields[-1]
+    return info.header_offset + LOCAL_HEADER_STRUCT.size + filename_length + extra_length
+
+
+@contextmanager
+def open_nested_archive(top_zip: zipfile.ZipFile, top_zip_path: str | None, nested_zip_filename: str,
+                        memory_limit: int = NESTED_MEMORY_LIMIT):
+    """
+    Открывает вложенный архив, не считывая его целиком в память.
+
+    Несжатый (stored) вложенный архив читается прямо из внешнего архива по смещениям.
+    Сжатый — распаковывается в буфер, который при превышении memory_limit
+    переносится во временный файл на диске. Так же открывается и несжатый архив,
+    если внешний архив сам не лежит в файле (top_zip_path=None, например, на следующем уровне вложенности).
+    """
+    info = top_zip.getinfo(nested_zip_filename)
+    if top_zip_path is not None and info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+        with open(top_zip_path, 'rb') as f:
+            data_offset = member_data_offset(f, info)
+        source = FileWindow(top_zip_path, data_offset, info.compress_size)
+    else:
+        source = tempfile.SpooledTemporaryFile(max_size=memory_limit)
+        with top_zip.open(info) as member:
+            shutil.copyfileobj(member, source, COPY_CHUNK_SIZE)
+        source.seek(0)
+
+    try:
+        with zipfile.ZipFile(source, 'r') as nested_zip:
+            yield nested_zip
+    finally:
+        source.close()
+
+
+def session_key(top_zip: zipfile.ZipFile, top_zip_path: str, nested_zip_filename: str) -> str:
+    """
+    Ключ сессии для устранения повторов: имя вложенного архива и CRC его CSV-файлов
+    из каталога вложенного архива. Каталог несжатого вложенного архива читается на месте;
+    для сжатого, чтобы не распаковывать его лишний раз, используется CRC всего вложенного архива.
+    """
+    info = top_zip.getinfo(nested_zip_filename)
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return f"{nested_zip_filename}:{info.CRC:08x}"
+
+    with open_nested_archive(top_zip, top_zip_path, nested_zip_filename) as nested_zip:
+        members = sorted(
+            f"{member.filename}={member.CRC:08x}/{member.file_size}"
+            for member in nested_zip.infolist() if member.filename.endswith('.csv')
+        )
+    return f"{nested_zip_filename}:{','.join(members)}"
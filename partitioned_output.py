@@ -0,0 +1,200 @@
+import os
+import json
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import merge_manifest
+import session_catalog
+import time_index
+import timestamp_parser
+
+# Секционированная раскладка рядом с итоговыми файлами merge_data:
+# partitions/<секция>/<тип файла>.csv + partitions/partitions.json
+PARTITIONS_DIRNAME = 'partitions'
+PARTITIONS_FILENAME = 'partitions.json'
+PARTITIONS_VERSION = 1
+# Способы разбиения: по дню начала сессии (по часам устройства) или по вложенному архиву tracking_data_*
+PARTITION_MODES = ('day', 'session')
+
+NAT = timestamp_parser.NAT
+
+
+def partitions_dir(output_dir: str) -> str:
+    return os.path.join(output_dir, PARTITIONS_DIRNAME)
+
+
+def _source_sizes(output_dir: str, file_types: dict) -> dict:
+    return {csv_filename: size for csv_filename, size in
+            zip(file_types.values(), merge_manifest.output_sizes(output_dir, file_types).values())}
+
+
+def load_partitions(output_dir: str, check_source: bool = True) -> dict | None:
+    """
+    Описание секций или None, если секционированной раскладки нет, она другой версии
+    или (при check_source) итоговые файлы изменились после ее записи.
+    """
+    try:
+        with open(os.path.join(partitions_dir(output_dir), PARTITIONS_FILENAME), 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if layout.get('version') != PARTITIONS_VERSION:
+        return None
+    if check_source and layout['sources'] != _source_sizes(output_dir, {name: name for name in layout['sources']}):
+        return None
+    return layout
+
+
+def partition_key(entry: dict, partition_by: str) -> str:
+    """
+    Имя секции для сессии из каталога (см. session_catalog.py).
+    """
+    if partition_by == 'day':
+        return entry['start'][:10] if entry['start'] else 'unknown'
+    return os.path.splitext(entry['name'])[0]
+
+
+def update_partitions(output_dir: str, file_types: dict, file_headers: dict, archives: list[dict],
+                      partition_by: str = 'day') -> None:
+    """
+    Раскладывает данные итоговых файлов по секциям: в папке каждой секции — по CSV-файлу
+    с заголовком на каждый тип, сессии в том же порядке, что и в итоговых файлах.
+    Итоговые all_*.csv остаются основными; секции копируются из них по отрезкам сессий.
+
+    Переписываются только секции, состав сессий которых изменился (при инкрементальном
+    обновлении — обычно одна последняя), и удаляются секции, которых больше нет.
+    """
+    if partition_by not in PARTITION_MODES:
+        raise ValueError(f"Неизвестный способ разбиения: {partition_by}")
+    catalog = session_catalog.load_catalog(output_dir, file_types)
+    if catalog is None:
+        print("Нет актуального каталога сессий, секции не обновлены.")
+        return
+    entries = {entry['session']: entry for entry in catalog['sessions']}
+
+    partitions = {}
+    for archive in archives:
+        entry = entries[archive['session']]
+        key = partition_key(entry, partition_by)
+        if partition_by == 'session' and key in partitions:
+            # Одинаковые имена вложенных архивов с разным содержимым
+            key = f"{key}_{len([name for name in partitions if name.startswith(key)]) + 1}"
+        partitions.setdefault(key, []).append({
+            'session': archive['session'],
+            'utc_offset': entry['utc_offset'],
+            'streams': archive['streams'],
+            'ranges': {file_type: [sensor['start'], sensor['end']] for file_type, sensor in entry['sensors'].items()},
+        })
+
+    old_layout = load_partitions(output_dir, check_source=False)
+    old_partitions = ({partition['key']: partition for partition in old_layout['partitions']}
+                      if old_layout and old_layout['partition_by'] == partition_by else {})
+    root = partitions_dir(output_dir)
+    os.makedirs(root, exist_ok=True)
+
+    layout = []
+    rewritten = 0
+    for key, sessions in partitions.items():
+        described = [{
+            'session': session['session'],
+            'utc_offset': session['utc_offset'],
+            'lines': {file_type: stream[2] for file_type, stream in session['streams'].items()},
+            'ranges': session['ranges'],
+        } for session in sessions]
+        layout.append({'key': key, 'sessions': described})
+        old = old_partitions.get(key)
+        if old is not None and old['sessions'] == described and \
+                all(os.path.exists(os.path.join(root, key, file_type + '.csv')) for file_type in file_types):
+            continue
+
+        path = os.path.join(root, key)
+        os.makedirs(path, exist_ok=True)
+        for file_type, csv_filename in file_types.items():
+            target = os.path.join(path, file_type + '.csv')
+            with open(os.path.join(output_dir, csv_filename), 'rb') as source, open(target + '.tmp', 'wb') as f:
+                f.write((file_headers[file_type] + "\n").encode('utf-8'))
+                for session in sessions:
+                    if file_type in session['streams']:
+                        offset, length, _ = session['streams'][file_type]
+                        merge_manifest.copy_range(source, f, offset, length)
+            os.replace(target + '.tmp', target)
+        rewritten += 1
+
+    for name in os.listdir(root):
+        if name != PARTITIONS_FILENAME and name not in partitions:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    path = os.path.join(root, PARTITIONS_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': PARTITIONS_VERSION, 'partition_by': partition_by,
+                   'sources': _source_sizes(output_dir, file_types), 'partitions': layout},
+                  f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+    print(f"      -> Обновлены секции {PARTITIONS_DIRNAME}/ (переписано {rewritten} из {len(layout)})")
+
+
+def _to_ns(value: str | None, default: int) -> int:
+    return pd.Timestamp(value).value if value else default
+
+
+def read_range(output_dir: str, file_type: str, columns: list[str], start=None, end=None,
+               utc: bool = False, usecols: list[str] | None = None) -> pd.DataFrame | None:
+    """
+    Читает строки одного типа со временем в [start, end] (границы — как в time_index.read_window),
+    открывая только секции, в которых есть сессии, пересекающиеся с окном. columns — имена столбцов
+    (по позициям), usecols — разбираемые столбцы значений (по умолчанию все). Время — по часам
+    устройства, при utc=True — в UTC с учетом смещения каждой сессии.
+    Строки идут в порядке секций. Возвращает None, если актуальной секционированной раскладки нет.
+    """
+    layout = load_partitions(output_dir)
+    if layout is None:
+        return None
+
+    parts = []
+    for partition in layout['partitions']:
+        sessions = partition['sessions']
+        offsets = np.array([session['utc_offset'] or 0 for session in sessions], dtype=np.int64)
+        lows = time_index.window_bounds(start, offsets, NAT + 1)
+        highs = time_index.window_bounds(end, offsets, np.iinfo(np.int64).max)
+        ranges = [session['ranges'].get(file_type) or [None, None] for session in sessions]
+        first = np.array([_to_ns(low, NAT) for low, _ in ranges], dtype=np.int64)
+        last = np.array([_to_ns(high, NAT) for _, high in ranges], dtype=np.int64)
+        if not np.any((first != NAT) & (last >= lows) & (first <= highs)):
+            continue
+
+        with open(os.path.join(partitions_dir(output_dir), partition['key'], file_type + '.csv'), 'rb') as f:
+            f.readline()
+            arrays = columnar_store.parse_stream(f.read(), columns, usecols)
+        # Строки каждой сессии идут подряд: границы окна и смещение повторяются на ее строки
+        lines = [session['lines'].get(file_type, 0) for session in sessions]
+        timestamps = arrays[columnar_store.TIMESTAMP_COLUMN]
+        if len(timestamps) != sum(lines):
+            raise ValueError(f"число строк секции {partition['key']} не совпадает с описанием")
+        keep = ((timestamps != NAT) & (timestamps >= np.repeat(lows, lines)) &
+                (timestamps <= np.repeat(highs, lines)))
+        if utc:
+            arrays[columnar_store.TIMESTAMP_COLUMN] = timestamps - np.repeat(offsets, lines) * 10 ** 9
+        parts.append(pd.DataFrame({column: values[keep] for column, values in arrays.items()}))
+
+    if not parts:
+        parts.append(columnar_store.empty_frame(columns, usecols))
+    df = pd.concat(parts, ignore_index=True)
+    timestamps = df[columnar_store.TIMESTAMP_COLUMN].to_numpy(dtype=np.int64).view('datetime64[ns]')
+    df[columnar_store.TIMESTAMP_COLUMN] = pd.DatetimeIndex(timestamps).tz_localize('UTC') if utc else timestamps
+    return df
+
+
+def load_window(csv_path: str, file_type: str, columns: list[str], start=None, end=None,
+                utc: bool = False, usecols: list[str] | None = None) -> pd.DataFrame | None:
+    """
+    Строки итогового файла csv_path со временем в [start, end], прочитанные без просмотра всей истории:
+    из секций (read_range), а без них — по индексу времени (time_index.read_window).
+    Возвращает None, если нет ни секций, ни актуального индекса.
+    """
+    df = read_range(os.path.dirname(csv_path), file_type, columns, start, end, utc, usecols)
+    if df is None:
+        df = time_index.read_window(csv_path, columns, start, end, utc, usecols)
+    return df
@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import compact_dtypes
+import merge_data
+import partitioned_output
+import sorted_runs
+import time_index
+
+TIMESTAMP_COLUMN = columnar_store.TIMESTAMP_COLUMN
+NAT = time_index.NAT
+# Способы сопоставления отсчетов в align: ближайший по времени или последний не позже
+ALIGN_DIRECTIONS = ('nearest', 'backward')
+
+
+def _select(df: pd.DataFrame, start, end, utc_offsets: np.ndarray, utc: bool) -> pd.DataFrame:
+    """
+    Строки со временем устройства в [start, end] — с теми же границами, что и в секциях
+    и по индексу (time_index.window_bounds): время без часового пояса — время устройства,
+    время с часовым поясом переводится по смещению сессии строки (utc_offsets, в секундах).
+    При utc=True время затем переводится в UTC по тем же смещениям.
+    """
+    timestamps = df[TIMESTAMP_COLUMN].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    keep = ((timestamps != NAT) & (timestamps >= time_index.window_bounds(start, utc_offsets, NAT + 1)) &
+            (timestamps <= time_index.window_bounds(end, utc_offsets, np.iinfo(np.int64).max)))
+    if not keep.all():
+        df, timestamps, utc_offsets = df[keep], timestamps[keep], utc_offsets[keep]
+    if utc:
+        # Копируется только столбец времени
+        utc_timestamps = (timestamps - utc_offsets * 10 ** 9).view('datetime64[ns]')
+        df = df.assign(**{TIMESTAMP_COLUMN: pd.DatetimeIndex(utc_timestamps).tz_localize('UTC')})
+    return df
+
+
+def _read_csv(csv_path: str, header: list[str], values: list[str]) -> pd.DataFrame | None:
+    try:
+        # Пустые строки не пропускаются, чтобы номера строк совпадали с колоночным хранилищем
+        df = pd.read_csv(csv_path, header=0, names=header, usecols=[TIMESTAMP_COLUMN] + values,
+                         skip_blank_lines=False, low_memory=False)
+    except FileNotFoundError:
+        print(f"Ошибка: Файл '{csv_path}' не найден.")
+        return None
+    df[TIMESTAMP_COLUMN] = columnar_store.parse_timestamps(df[TIMESTAMP_COLUMN])
+    for column in values:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df
+
+
+def load_window(sensor: str, start=None, end=None, columns: list[str] | None = None,
+                names: list[str] | None = None, output_dir: str = merge_data.OUTPUT_DIR,
+                utc: bool = False) -> pd.DataFrame | None:
+    """
+    Единая точка чтения итоговых данных merge_data одного датчика ('location', 'motion', 'acceleration')
+    со временем в [start, end] (границы — значения, понятные pd.Timestamp, или None — без ограничения).
+
+    Данные берутся из самого дешевого доступного источника: для интервала — из секций или по индексу
+    времени (читаются только байты интервала), иначе — из колоночного хранилища, а без него — из CSV.
+    Разбираются только время и столбцы columns (по умолчанию — все). Граница без часового пояса —
+    время устройства, с часовым поясом — переводится по смещению каждой сессии; результат не зависит
+    от источника. Исключение — только сам CSV без хранилища, секций и индекса: смещения сессий в нем
+    не записаны, поэтому время устройства считается временем UTC (и при utc=True, и для границ).
+
+    names — имена столбцов файла по позициям (по умолчанию — заголовок merge_data), columns задаются
+    в этих именах. Время — datetime64[ns] по часам устройства, при utc=True — в UTC с учетом смещения
+    каждой сессии; значения — compact_dtypes.value_dtype() (кроме координат). Строки без корректного
+    времени отбрасываются, остальные идут в порядке файла. При чтении всей истории индекс — номер строки
+    данных в файле (см. sorted_runs.runs_after_filter), при чтении интервала — порядковый.
+    Возвращает None, если итогового файла нет.
+    """
+    if sensor not in merge_data.FILE_TYPES:
+        raise ValueError(f"Неизвестный датчик: {sensor}")
+    header = merge_data.FILE_HEADERS[sensor].split(',')
+    names = list(names or header)
+    if len(names) != len(header):
+        raise ValueError(f"Ожидалось {len(header)} имен столбцов для {sensor}, получено {len(names)}")
+    unknown = [column for column in columns or () if column not in names]
+    if unknown:
+        raise ValueError(f"Нет столбцов {unknown} в данных {sensor}")
+    # Запрошенные столбцы значений в именах заголовка merge_data, в порядке файла
+    values = [column for column, name in zip(header[1:], names[1:]) if columns is None or name in columns]
+
+    csv_filename = merge_data.FILE_TYPES[sensor]
+    csv_path = os.path.join(output_dir, csv_filename)
+    windowed = start is not None or end is not None
+    df = partitioned_output.load_window(csv_path, sensor, header, start, end, utc, values) if windowed else None
+    if df is None:
+        df = columnar_store.load_columns(output_dir, csv_filename, sensor, values)
+        if df is not None:
+            # Номера строк хранилища (пустые строки уже отброшены) — позиции в смещениях сессий
+            utc_offsets = columnar_store.row_utc_offsets(columnar_store.load_schema(output_dir, sensor))
+            utc_offsets = utc_offsets[df.index.to_numpy()]
+        else:
+            df = _read_csv(csv_path, header, values)
+            if df is None:
+                return None
+            # В самом CSV смещений сессий нет: время устройства считается временем UTC
+            utc_offsets = np.zeros(len(df), dtype=np.int64)
+        df = _select(df, start, end, utc_offsets, utc)
+
+    df = df.rename(columns=dict(zip(header, names)))
+    return compact_dtypes.compact_columns(df, [name for column, name in zip(header, names) if column in values])
+
+
+def align(base: pd.DataFrame, other: pd.DataFrame, tolerance, direction: str = 'nearest') -> pd.DataFrame:
+    """
+    Присоединяет к каждой строке base (например, к каждому отсчету акселерометра) столбцы значений
+    other из ближайшей по времени строки (direction='nearest') или последней строки не позже нее
+    ('backward'), если она не дальше tolerance (pd.Timedelta или строка вида '10ms'); иначе — NaN.
+    Оба DataFrame — результат load_window с одинаковым представлением времени (по часам устройства
+    или оба с utc=True). Сопоставление идет
+    по отсортированному времени (pd.merge_asof), поэтому строк в результате столько же, сколько в base,
+    в порядке времени, с порядковым индексом.
+    """
+    if direction not in ALIGN_DIRECTIONS:
+        raise ValueError(f"Неизвестный способ сопоставления: {direction}")
+    base = sorted_runs.sort_frame(base, TIMESTAMP_COLUMN).reset_index(drop=True)
+    other = sorted_runs.sort_frame(other, TIMESTAMP_COLUMN)
+    return pd.merge_asof(base, other, on=TIMESTAMP_COLUMN, tolerance=pd.Timedelta(tolerance), direction=direction)
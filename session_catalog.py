@@ -0,0 +1,171 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import merge_manifest
+import timestamp_parser
+
+# Каталог сессий в выходной папке merge_data
+CATALOG_FILENAME = 'session_catalog.json'
+CATALOG_VERSION = 1
+
+NAT = timestamp_parser.NAT
+
+
+def _isoformat(value) -> str | None:
+    return None if value == NAT else pd.Timestamp(int(value)).isoformat()
+
+
+def describe_stream(arrays: dict[str, np.ndarray], offset: int, length: int, lines: int) -> dict:
+    """
+    Описание данных одного типа файла одной сессии: положение в итоговом файле, число строк,
+    временной диапазон (по часам устройства), средняя частота записи и минимум/максимум каждого столбца.
+    arrays — столбцы отрезка (см. columnar_store.parse_stream).
+    """
+    timestamps = np.asarray(arrays[columnar_store.TIMESTAMP_COLUMN])
+    valid = timestamps != NAT
+    rows = int(valid.sum())
+    first, last = (int(timestamps[valid].min()), int(timestamps[valid].max())) if rows else (NAT, NAT)
+    duration = (last - first) / 10 ** 9
+    columns = {}
+    for name, values in arrays.items():
+        if name == columnar_store.TIMESTAMP_COLUMN:
+            continue
+        values = np.asarray(values)[valid]
+        values = values[~np.isnan(values)]
+        columns[name] = [float(values.min()), float(values.max())] if len(values) else None
+    return {
+        'bytes': [offset, length],
+        'lines': lines,
+        'rows': rows,
+        'start': _isoformat(first),
+        'end': _isoformat(last),
+        'sample_rate_hz': (rows - 1) / duration if rows > 1 and duration > 0 else None,
+        'columns': columns,
+    }
+
+
+def load_catalog(output_dir: str, file_types: dict | None = None) -> dict | None:
+    """
+    Каталог сессий или None, если его нет, он другой версии или (если переданы file_types)
+    итоговые файлы изменились после его записи.
+    """
+    try:
+        with open(os.path.join(output_dir, CATALOG_FILENAME), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if catalog.get('version') != CATALOG_VERSION:
+        return None
+    if file_types is not None:
+        sizes = merge_manifest.output_sizes(output_dir, file_types)
+        if any(catalog['outputs'].get(file_type) != size for file_type, size in sizes.items()):
+            return None
+    return catalog
+
+
+def update_catalog(output_dir: str, file_types: dict, file_headers: dict, archives: list[dict]) -> dict:
+    """
+    Записывает каталог всех сессий tracking_data_* в итоговых файлах (в порядке archives):
+    время начала и конца, смещение от UTC и описание данных каждого типа (см. describe_stream).
+
+    Описания сессий из прежнего каталога переиспользуются (меняется только положение данных
+    в файле), для новых сессий столбцы берутся из колоночного хранилища, а без него —
+    из текста итоговых файлов. Возвращает новый каталог.
+    """
+    old_catalog = load_catalog(output_dir)
+    old_sessions = {entry['session']: entry for entry in old_catalog['sessions']} if old_catalog else {}
+    stored = {}
+
+    sessions = []
+    for archive in archives:
+        old = old_sessions.get(archive['session'], {'sensors': {}})
+        sensors = {}
+        for file_type, (offset, length, lines) in archive['streams'].items():
+            known = old['sensors'].get(file_type)
+            if known is not None and known['lines'] == lines and known['bytes'][1] == length:
+                sensors[file_type] = dict(known, bytes=[offset, length])
+                continue
+            if file_type not in stored:
+                stored[file_type] = columnar_store.session_columns(output_dir, file_types[file_type], file_type)
+            if stored[file_type] is not None and archive['session'] in stored[file_type]:
+                arrays = stored[file_type][archive['session']]
+            else:
+                with open(os.path.join(output_dir, file_types[file_type]), 'rb') as f:
+                    f.seek(offset)
+                    arrays = columnar_store.parse_stream(f.read(length), file_headers[file_type].split(','))
+            sensors[file_type] = describe_stream(arrays, offset, length, lines)
+
+        starts = [sensor['start'] for sensor in sensors.values() if sensor['start']]
+        ends = [sensor['end'] for sensor in sensors.values() if sensor['end']]
+        sessions.append({
+            'session': archive['session'],
+            'export': archive['export'],
+            'name': archive['name'],
+            'utc_offset': columnar_store.session_utc_offset(archive),
+            'start': min(starts, key=pd.Timestamp) if starts else None,
+            'end': max(ends, key=pd.Timestamp) if ends else None,
+            'sensors': sensors,
+        })
+    stored.clear()
+
+    catalog = {
+        'version': CATALOG_VERSION,
+        'outputs': merge_manifest.output_sizes(output_dir, file_types),
+        'sessions': sessions,
+    }
+    path = os.path.join(output_dir, CATALOG_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+    return catalog
+
+
+def time_ranges(catalog: dict, file_type: str) -> dict[str, list[str] | None]:
+    """
+    Минимальная и максимальная временные метки данных каждой сессии для одного типа файла.
+    """
+    return {entry['session']: [entry['sensors'][file_type]['start'], entry['sensors'][file_type]['end']]
+            if entry['sensors'][file_type]['start'] else None
+            for entry in catalog['sessions'] if file_type in entry['sensors']}
+
+
+def summarize(catalog: dict, file_type: str) -> tuple[int, int, pd.Timestamp | None, pd.Timestamp | None]:
+    """
+    Сводка по одному типу файла: (число сессий, число строк, первая и последняя временные метки).
+    """
+    sensors = [entry['sensors'][file_type] for entry in catalog['sessions'] if file_type in entry['sensors']]
+    starts = [pd.Timestamp(sensor['start']) for sensor in sensors if sensor['start']]
+    ends = [pd.Timestamp(sensor['end']) for sensor in sensors if sensor['end']]
+    return (len(sensors), sum(sensor['rows'] for sensor in sensors),
+            min(starts) if starts else None, max(ends) if ends else None)
+
+
+def main():
+    """
+    Печатает каталог сессий итоговых файлов merge_data, не читая сами данные.
+    """
+    import merge_data
+
+    catalog = load_catalog(merge_data.OUTPUT_DIR, merge_data.FILE_TYPES)
+    if catalog is None:
+        print(f"Актуальный каталог сессий не найден в '{merge_data.OUTPUT_DIR}'. Запустите merge_data.py.")
+        return
+
+    for entry in catalog['sessions']:
+        print(f"{entry['name']} ({entry['export']}): {entry['start']} - {entry['end']}")
+        for file_type, sensor in entry['sensors'].items():
+            rate = f"{sensor['sample_rate_hz']:.1f} Гц" if sensor['sample_rate_hz'] else "-"
+            print(f"  {file_type}: {sensor['rows']} строк, {rate}")
+
+    print("\nИтого:")
+    for file_type in merge_data.FILE_TYPES:
+        sessions, rows, start, end = summarize(catalog, file_type)
+        print(f"  {file_type}: {sessions} сессий, {rows} строк, {start} - {end}")
+
+
+if __name__ == "__main__":
+    main()
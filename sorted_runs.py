@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+import merge_data
+import merge_manifest
+
+
+def recorded_runs(file_type: str, output_dir: str = merge_data.OUTPUT_DIR) -> np.ndarray | None:
+    """
+    Номера первых строк данных (без учета заголовка) отсортированных участков итогового файла merge_data.
+    Каждый участок — данные одного CSV-файла сессии, которые уже упорядочены по времени.
+    Возвращает None, если манифеста нет или итоговые файлы изменились после его записи.
+    """
+    manifest = merge_manifest.load_manifest(output_dir)
+    if manifest is None or manifest['outputs'] != merge_manifest.output_sizes(output_dir, merge_data.FILE_TYPES):
+        return None
+    streams = sorted(archive['streams'][file_type] for archive in manifest['archives']
+                     if file_type in archive['streams'])
+    lines = np.array([stream[2] for stream in streams], dtype=np.int64)
+    return np.concatenate(([0], np.cumsum(lines)[:-1])) if len(lines) else np.zeros(0, dtype=np.int64)
+
+
+def runs_after_filter(runs: np.ndarray | None, labels, shift: int = 0) -> np.ndarray | None:
+    """
+    Переводит номера строк файла в позиции строк DataFrame после фильтрации.
+    labels — исходные номера оставшихся строк (индекс после read_csv и dropna),
+    shift — на сколько номера в labels больше номеров строк данных (1, если заголовок прочитан как строка).
+    """
+    if runs is None:
+        return None
+    return np.unique(np.searchsorted(np.asarray(labels), runs + shift))
+
+
+def _merge_pair(values: np.ndarray, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Устойчивое слияние двух наборов позиций, отсортированных по values.
+    При равных значениях элементы left идут раньше элементов right.
+    """
+    a, b = values[left], values[right]
+    merged = np.empty(len(left) + len(right), dtype=np.intp)
+    merged[np.arange(len(a)) + np.searchsorted(b, a, side='left')] = left
+    merged[np.arange(len(b)) + np.searchsorted(a, b, side='right')] = right
+    return merged
+
+
+def kway_merge(values: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """
+    Позиции элементов values[bounds[0]:bounds[-1]] в порядке устойчивой сортировки.
+    Отрезки между соседними bounds должны быть отсортированы; сливаются попарно, за log2(k) проходов.
+    """
+    runs = [np.arange(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+    while len(runs) > 1:
+        merged = [_merge_pair(values, runs[i], runs[i + 1]) for i in range(0, len(runs) - 1, 2)]
+        if len(runs) % 2:
+            merged.append(runs[-1])
+        runs = merged
+    return runs[0]
+
+
+def sort_order(values: np.ndarray, runs: np.ndarray | None = None) -> np.ndarray | None:
+    """
+    Перестановка, устойчиво сортирующая values, или None, если values уже отсортированы.
+
+    Сначала за один проход ищутся места, где порядок нарушается. Начало и конец массива, которые
+    уже стоят на своих местах, не трогаются; неупорядоченный участок сливается k-путевым слиянием
+    из отсортированных отрезков. Границы отрезков берутся из runs (см. recorded_runs)
+    и дополняются найденными нарушениями порядка, так что неточные runs не влияют на результат.
+    """
+    n = len(values)
+    descents = np.flatnonzero(values[1:] < values[:-1]) + 1
+    if len(descents) == 0:
+        return None
+
+    # До первого нарушения массив отсортирован: на месте остаются элементы не больше минимума остатка.
+    # После последнего — тоже: на месте остаются элементы не меньше максимума начала.
+    first, last = descents[0], descents[-1]
+    lo = int(np.searchsorted(values[:first], values[first:].min(), side='right'))
+    hi = int(last + np.searchsorted(values[last:], values[:last].max(), side='left'))
+
+    starts = descents if runs is None else np.union1d(np.asarray(runs), descents)
+    starts = starts[(starts > lo) & (starts < hi)]
+
+    order = np.arange(n)
+    order[lo:hi] = kway_merge(values, np.concatenate(([lo], starts, [hi])))
+    return order
+
+
+def sort_frame(df: pd.DataFrame, column: str | None = None, runs: np.ndarray | None = None) -> pd.DataFrame:
+    """
+    Устойчиво сортирует DataFrame по столбцу времени column (или по индексу, если column=None).
+    Уже отсортированный DataFrame возвращается без копирования; иначе переставляется
+    только неупорядоченный участок (см. sort_order). Результат совпадает с sort_values(kind='stable').
+    """
+    keys = df.index if column is None else df[column]
+    if keys.hasnans:
+        return df.sort_index(kind='stable') if column is None else df.sort_values(by=column, kind='stable')
+    # Целые наносекунды без перехода через to_numpy: для времени с часовым поясом там массив объектов
+    order = sort_order(pd.DatetimeIndex(keys).asi8, runs)
+    if order is None:
+        return df
+    return df.take(order)
@@ -0,0 +1,32 @@
+import pytest
+
+import merge_data
+
+
+@pytest.mark.parametrize('line, offset', [
+    (b'2025-07-04T12:00:00.123+0300,1,2\n', 3 * 3600),
+    (b'2025-07-04T12:00:00.123-0500,1,2\n', -5 * 3600),
+    (b'2025-07-04 12:00:00-05:30,1,2\n', -(5 * 3600 + 30 * 60)),
+    (b'2025-07-04T12:00:00.123-0000,1,2\n', 0),
+    (b'2025-07-04T12:00:00.123,1,2\n', None),
+])
+def test_parse_utc_offset(line, offset):
+    assert merge_data.parse_utc_offset(b'timestamp,x,y\n' + line) == offset
+
+
+@pytest.mark.parametrize('line', [
+    '2025-07-04T12:00:00.123+0300,1,2',
+    '2025-07-04T12:00:00.123-0500,1,2',
+    '2025-07-04 12:00:00-05:30,1,2',
+])
+def test_timezone_suffix_is_removed(line):
+    rewritten = merge_data.rewrite_lines(line.encode('utf-8') + b'\n')
+    assert rewritten.split(b',')[0] in (b'2025-07-04T12:00:00.123', b'2025-07-04 12:00:00')
+    assert rewritten.split(b',', 1)[1] == b'1,2\n'
+    assert merge_data.prepare_data([line + '\n']) == [rewritten.decode('utf-8').rstrip('\n')]
+
+
+def test_date_hyphens_are_kept():
+    block = b'2025-07-04,1\n2025-07-04 12:00,2\n'
+    assert merge_data.rewrite_lines(block) == block
+    assert merge_data.parse_utc_offset(block) is None
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import sensor_loader
+
+
+def _frames(tz=None):
+    base = pd.DataFrame({
+        'timestamp': pd.to_datetime(['2025-07-04 12:00:00.030', '2025-07-04 12:00:00.010',
+                                     '2025-07-04 12:00:00.020', '2025-07-04 12:00:05.000']),
+        'ax': [3.0, 1.0, 2.0, 4.0],
+    })
+    other = pd.DataFrame({
+        'timestamp': pd.to_datetime(['2025-07-04 12:00:00.012', '2025-07-04 12:00:00.004',
+                                     '2025-07-04 12:00:00.027']),
+        'x_motion': [20.0, 10.0, 30.0],
+    })
+    if tz is not None:
+        base['timestamp'] = base['timestamp'].dt.tz_localize(tz)
+        other['timestamp'] = other['timestamp'].dt.tz_localize(tz)
+    return base, other
+
+
+@pytest.mark.parametrize('tz', [None, 'UTC'])
+def test_align_nearest(tz):
+    base, other = _frames(tz)
+    aligned = sensor_loader.align(base, other, '10ms')
+    assert len(aligned) == len(base)
+    assert aligned['ax'].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert aligned['timestamp'].is_monotonic_increasing
+    assert str(aligned['timestamp'].dt.tz) == str(tz)
+    np.testing.assert_array_equal(aligned['x_motion'], [20.0, 30.0, 30.0, np.nan])
+
+
+@pytest.mark.parametrize('tz', [None, 'UTC'])
+def test_align_backward(tz):
+    base, other = _frames(tz)
+    aligned = sensor_loader.align(base, other, '10ms', 'backward')
+    np.testing.assert_array_equal(aligned['x_motion'], [10.0, 20.0, 30.0, np.nan])
+
+
+def test_align_rejects_unknown_direction():
+    base, other = _frames()
+    with pytest.raises(ValueError):
+        sensor_loader.align(base, other, '10ms', 'forward')
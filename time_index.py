@@ -0,0 +1,217 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import columnar_store
+import timestamp_parser
+
+# Разреженный индекс рядом с итоговым файлом: all_<тип>.csv -> all_<тип>.csv.index.npz
+INDEX_SUFFIX = '.index.npz'
+INDEX_VERSION = 1
+# Через сколько строк внутри сессии записывается точка индекса (время строки и ее смещение в байтах)
+INDEX_STRIDE = 1024
+
+NAT = timestamp_parser.NAT
+
+
+def index_path(csv_path: str) -> str:
+    return csv_path + INDEX_SUFFIX
+
+
+def _csv_signature(csv_path: str) -> np.ndarray | None:
+    try:
+        stat = os.stat(csv_path)
+    except FileNotFoundError:
+        return None
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def load_index(csv_path: str, check_source: bool = True) -> dict | None:
+    """
+    Индекс итогового файла или None, если его нет, он другой версии или (при check_source)
+    файл изменился после его записи.
+    """
+    try:
+        with np.load(index_path(csv_path)) as data:
+            index = {name: data[name] for name in data.files}
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+    if int(index['version']) != INDEX_VERSION:
+        return None
+    if check_source and not np.array_equal(index['source'], _csv_signature(csv_path)):
+        return None
+    return index
+
+
+def index_run(data: bytes, lines: int) -> dict:
+    """
+    Точки индекса одного отрезка итогового файла (данных одной сессии): время каждой INDEX_STRIDE-й
+    строки и смещение ее начала от начала отрезка. Строки без корректного времени пропускаются.
+    """
+    timestamps = timestamp_parser.parse_csv_timestamps(data)
+    if len(timestamps) != lines:
+        raise ValueError("число строк не совпадает с CSV")
+    line_starts = np.concatenate(([0], np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n')) + 1))
+    rows = np.arange(0, lines, INDEX_STRIDE)
+    rows = rows[timestamps[rows] != NAT]
+
+    valid = timestamps[timestamps != NAT]
+    return {
+        'times': timestamps[rows],
+        'offsets': line_starts[rows].astype(np.int64),
+        'min': valid.min() if len(valid) else NAT,
+        'max': valid.max() if len(valid) else NAT,
+        # Поиск по точкам возможен только внутри упорядоченной по времени сессии
+        'sorted': bool(np.all(valid[1:] >= valid[:-1])),
+    }
+
+
+def _old_runs(index: dict | None) -> dict:
+    if index is None:
+        return {}
+    runs = {}
+    for i, session in enumerate(index['sessions']):
+        bounds = slice(index['point_bounds'][i], index['point_bounds'][i + 1])
+        runs[str(session)] = (int(index['run_lengths'][i]), {
+            'times': index['point_times'][bounds],
+            'offsets': index['point_offsets'][bounds],
+            'min': index['run_min'][i],
+            'max': index['run_max'][i],
+            'sorted': bool(index['run_sorted'][i]),
+        })
+    return runs
+
+
+def update_index(output_dir: str, file_types: dict, archives: list[dict]) -> None:
+    """
+    Записывает рядом с каждым итоговым файлом разреженный индекс времени: для каждой сессии —
+    время каждой INDEX_STRIDE-й строки и ее смещение в байтах (см. read_window).
+    Точки сессий из прежнего индекса переиспользуются (смещения в них — от начала данных сессии),
+    поэтому при инкрементальном обновлении читаются только отрезки новых сессий.
+    """
+    for file_type, csv_filename in file_types.items():
+        csv_path = os.path.join(output_dir, csv_filename)
+        streams = sorted((archive['streams'][file_type], archive['session'],
+                          columnar_store.session_utc_offset(archive) or 0)
+                         for archive in archives if file_type in archive['streams'])
+        current = load_index(csv_path)
+        if (current is not None and current['sessions'].tolist() == [stream[1] for stream in streams] and
+                current['run_starts'].tolist() == [stream[0][0] for stream in streams]):
+            continue
+        # Файл уже переписан, но данные сессий внутри своих отрезков не меняются
+        old_runs = _old_runs(load_index(csv_path, check_source=False))
+
+        runs = []
+        try:
+            with open(csv_path, 'rb') as csv_file:
+                for (offset, length, lines), session, utc_offset in streams:
+                    old = old_runs.get(session)
+                    if old is not None and old[0] == length:
+                        run = old[1]
+                    else:
+                        csv_file.seek(offset)
+                        run = index_run(csv_file.read(length), lines)
+                    runs.append((session, offset, length, utc_offset, run))
+        except Exception as e:
+            print(f"Не удалось построить индекс времени для {csv_filename}: {e}")
+            if os.path.exists(index_path(csv_path)):
+                os.remove(index_path(csv_path))
+            continue
+
+        tmp_path = index_path(csv_path) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                version=np.int64(INDEX_VERSION),
+                source=_csv_signature(csv_path),
+                sessions=np.array([run[0] for run in runs], dtype=str),
+                run_starts=np.array([run[1] for run in runs], dtype=np.int64),
+                run_lengths=np.array([run[2] for run in runs], dtype=np.int64),
+                run_utc_offsets=np.array([run[3] for run in runs], dtype=np.int64),
+                run_min=np.array([run[4]['min'] for run in runs], dtype=np.int64),
+                run_max=np.array([run[4]['max'] for run in runs], dtype=np.int64),
+                run_sorted=np.array([run[4]['sorted'] for run in runs], dtype=bool),
+                point_bounds=np.cumsum([0] + [len(run[4]['times']) for run in runs], dtype=np.int64),
+                point_times=np.concatenate([run[4]['times'] for run in runs] + [np.zeros(0, dtype=np.int64)]),
+                point_offsets=np.concatenate([run[4]['offsets'] for run in runs] + [np.zeros(0, dtype=np.int64)]),
+            )
+        os.replace(tmp_path, index_path(csv_path))
+
+
+def window_bounds(value, utc_offsets: np.ndarray, default: int) -> np.ndarray:
+    """
+    Граница окна для каждой сессии в наносекундах по часам устройства. Время с часовым поясом
+    переводится по смещению сессии, время без часового пояса считается временем устройства.
+    """
+    if value is None:
+        return np.full(len(utc_offsets), default, dtype=np.int64)
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        return np.full(len(utc_offsets), value.value, dtype=np.int64)
+    return value.value + utc_offsets * 10 ** 9
+
+
+def window_ranges(index: dict, start=None, end=None) -> list[tuple[int, int, int, int, int]]:
+    """
+    Отрезки итогового файла, которые содержат все строки со временем в [start, end]:
+    (смещение, длина, смещение сессии от UTC, границы окна по часам сессии).
+    Сессии, не пересекающиеся с окном, отбрасываются по их минимальному и максимальному времени;
+    внутри упорядоченной сессии отрезок сужается по точкам индекса до INDEX_STRIDE строк
+    с каждой стороны, поэтому объем чтения не зависит от длины истории.
+    """
+    utc_offsets = index['run_utc_offsets']
+    lows = window_bounds(start, utc_offsets, NAT + 1)
+    highs = window_bounds(end, utc_offsets, np.iinfo(np.int64).max)
+    selected = (index['run_min'] != NAT) & (index['run_max'] >= lows) & (index['run_min'] <= highs)
+
+    ranges = []
+    for i in np.flatnonzero(selected):
+        begin, stop = 0, int(index['run_lengths'][i])
+        if index['run_sorted'][i]:
+            bounds = slice(index['point_bounds'][i], index['point_bounds'][i + 1])
+            times, offsets = index['point_times'][bounds], index['point_offsets'][bounds]
+            # Последняя точка раньше начала окна и первая точка позже его конца
+            first = np.searchsorted(times, lows[i], side='left') - 1
+            last = np.searchsorted(times, highs[i], side='right')
+            if first >= 0:
+                begin = int(offsets[first])
+            if last < len(offsets):
+                stop = int(offsets[last])
+        ranges.append((int(index['run_starts'][i]) + begin, stop - begin, int(utc_offsets[i]),
+                       int(lows[i]), int(highs[i])))
+    return ranges
+
+
+def read_window(csv_path: str, columns: list[str], start=None, end=None, utc: bool = False,
+                usecols: list[str] | None = None) -> pd.DataFrame | None:
+    """
+    Читает из итогового файла merge_data только строки со временем в [start, end] (границы — значения,
+    понятные pd.Timestamp, или None), находя нужные байты по индексу. columns — имена столбцов файла,
+    usecols — разбираемые столбцы значений (по умолчанию все, см. columnar_store.parse_stream).
+    Время возвращается по часам устройства, при utc=True — в UTC с учетом смещения каждой сессии.
+    Строки без корректного времени отбрасываются. Возвращает None, если актуального индекса нет.
+    """
+    index = load_index(csv_path)
+    if index is None:
+        return None
+
+    parts = []
+    with open(csv_path, 'rb') as csv_file:
+        for offset, length, utc_offset, low, high in window_ranges(index, start, end):
+            if length == 0:
+                continue
+            csv_file.seek(offset)
+            arrays = columnar_store.parse_stream(csv_file.read(length), columns, usecols)
+            timestamps = arrays[columnar_store.TIMESTAMP_COLUMN]
+            keep = (timestamps != NAT) & (timestamps >= low) & (timestamps <= high)
+            if utc:
+                arrays[columnar_store.TIMESTAMP_COLUMN] = timestamps - utc_offset * 10 ** 9
+            parts.append(pd.DataFrame({column: values[keep] for column, values in arrays.items()}))
+
+    if not parts:
+        parts.append(columnar_store.empty_frame(columns, usecols))
+    df = pd.concat(parts, ignore_index=True)
+    timestamps = df[columnar_store.TIMESTAMP_COLUMN].to_numpy(dtype=np.int64).view('datetime64[ns]')
+    df[columnar_store.TIMESTAMP_COLUMN] = pd.DatetimeIndex(timestamps).tz_localize('UTC') if utc else timestamps
+    return df
@@ -0,0 +1,173 @@
+import numpy as np
+
+# Формат временных меток устройства: YYYY-MM-DDTHH:MM:SS.ffff[+HHMM | +HH:MM]
+# Разделители на фиксированных позициях, на остальных позициях до дробной части — цифры
+SEPARATORS = {4: '-', 7: '-', 10: 'T', 13: ':', 16: ':', 19: '.'}
+FRACTION_START = 20
+# Знаков дробной части сверх наносекунд отбрасываются
+NANOSECOND_DIGITS = 9
+# Самый длинный допустимый суффикс (+HH:MM)
+SUFFIX_WIDTH = 6
+
+# Строки разбираются блоками, которые помещаются в кэш процессора: каждая позиция символа
+# просматривается несколькими проходами, и они не должны каждый раз читать основную память
+CHUNK_ROWS = 1 << 14
+# Сколько байтов строки CSV просматривается при разборе первого поля
+CSV_FIELD_WIDTH = 48
+# Байты, которыми заканчивается первое поле строки CSV
+CSV_FIELD_TERMINATORS = b',\n\r'
+
+NAT = np.iinfo(np.int64).min
+# Границы datetime64[ns]: секунды и наносекунды крайних представимых моментов
+MAX_SECONDS, MAX_SECONDS_NS = divmod(int(np.iinfo(np.int64).max), 10 ** 9)
+MIN_SECONDS, MIN_SECONDS_NS = divmod(int(NAT) + 1, 10 ** 9)
+
+DAYS_BEFORE_MONTH = np.array([0, 0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334], dtype=np.int64)
+DAYS_IN_MONTH = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.int64)
+
+
+def _char_rows(strings: np.ndarray) -> np.ndarray:
+    """
+    Символы строк как матрица байтов (позиция, строка): каждая позиция — непрерывный массив,
+    поэтому все проверки ниже — поэлементные операции над сплошной памятью.
+    Символы вне ASCII заменяются на 0xFF и не совпадают ни с цифрой, ни с разделителем.
+    Конец строки — нулевой байт.
+    """
+    codes = np.minimum(strings.view(np.uint32), 0xFF).astype(np.uint8).reshape(len(strings), -1)
+    width = max(codes.shape[1], FRACTION_START + 1) + SUFFIX_WIDTH + 1
+    rows = np.zeros((width, len(strings)), dtype=np.uint8)
+    rows[:codes.shape[1]] = codes.T
+    return rows
+
+
+def _field_rows(windows: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    Первые CSV_FIELD_WIDTH байтов строк CSV, начинающихся с позиций starts, в том же виде,
+    что и _char_rows: конец первого поля заменяется нулевым байтом.
+    windows — окна буфера CSV шириной CSV_FIELD_WIDTH (sliding_window_view).
+    """
+    rows = np.ascontiguousarray(windows[starts].T)
+    terminator = np.zeros(rows.shape, dtype=bool)
+    for byte in CSV_FIELD_TERMINATORS:
+        terminator |= rows == byte
+    rows[terminator] = 0
+    return rows
+
+
+def _number(digits: np.ndarray, start: int, length: int) -> np.ndarray:
+    value = digits[start].astype(np.int64)
+    for position in range(start + 1, start + length):
+        value = value * 10 + digits[position]
+    return value
+
+
+def _suffix_ends(rows: np.ndarray, is_digit: np.ndarray, position: int) -> np.ndarray:
+    """
+    С позиции position начинается конец строки или суффикс часового пояса и за ним конец строки.
+    """
+    sign = rows[position]
+    signed = (sign == ord('+')) | (sign == ord('-'))
+    hhmm = is_digit[position + 1] & is_digit[position + 2] & is_digit[position + 3] & is_digit[position + 4]
+    hh_mm = (is_digit[position + 1] & is_digit[position + 2] & (rows[position + 3] == ord(':')) &
+             is_digit[position + 4] & is_digit[position + 5])
+    return (sign == 0) | (signed & ((hhmm & (rows[position + 5] == 0)) | (hh_mm & (rows[position + 6] == 0))))
+
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """
+    Число дней от 1970-01-01 (пролептический григорианский календарь).
+    """
+    previous = year - 1
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    day_of_year = DAYS_BEFORE_MONTH[month] + day - 1 + (leap & (month > 2))
+    # 719162 — число дней от 0001-01-01 до 1970-01-01
+    return previous * 365 + previous // 4 - previous // 100 + previous // 400 + day_of_year - 719162
+
+
+def _parse_rows(rows: np.ndarray) -> np.ndarray:
+    """
+    Разбирает временные метки из матрицы байтов (позиция, строка) — см. _char_rows.
+    """
+    count = rows.shape[1]
+    # Байты меньше '0' при вычитании переполняются и тоже оказываются больше 9
+    digits = rows - np.uint8(ord('0'))
+    is_digit = digits < 10
+
+    valid = np.ones(count, dtype=bool)
+    for position in range(FRACTION_START):
+        if position in SEPARATORS:
+            valid &= rows[position] == ord(SEPARATORS[position])
+        else:
+            valid &= is_digit[position]
+
+    # Дробная часть: не меньше одного знака, учитываются первые NANOSECOND_DIGITS
+    fraction = np.zeros(count, dtype=np.int64)
+    run = np.ones(count, dtype=bool)
+    tail_ok = np.zeros(count, dtype=bool)
+    for position in range(FRACTION_START, rows.shape[0] - SUFFIX_WIDTH - 1):
+        run &= is_digit[position]
+        if position < FRACTION_START + NANOSECOND_DIGITS:
+            fraction += np.where(run, digits[position].astype(np.int64) * 10 ** (FRACTION_START + 8 - position), 0)
+        # Дробная часть закончилась перед position + 1
+        tail_ok |= run & _suffix_ends(rows, is_digit, position + 1)
+        if not run.any():
+            break
+    valid &= tail_ok
+
+    year = _number(digits, 0, 4)
+    month = _number(digits, 5, 2)
+    day = _number(digits, 8, 2)
+    hour = _number(digits, 11, 2)
+    minute = _number(digits, 14, 2)
+    # Секунда 60 переходит в следующую минуту, как у pd.to_datetime
+    second = _number(digits, 17, 2)
+
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60) & (second <= 60)
+    # Для некорректных строк подставляем безопасные значения, результат для них все равно NaT
+    year, month = np.where(valid, year, 1970), np.where(valid, month, 1)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    valid &= (day >= 1) & (day <= DAYS_IN_MONTH[month] + (leap & (month == 2)))
+
+    seconds = _days_from_civil(year, month, np.where(valid, day, 1)) * 86400 + hour * 3600 + minute * 60 + second
+    valid &= (((seconds > MIN_SECONDS) | ((seconds == MIN_SECONDS) & (fraction >= MIN_SECONDS_NS))) &
+              ((seconds < MAX_SECONDS) | ((seconds == MAX_SECONDS) & (fraction <= MAX_SECONDS_NS))))
+    return np.where(valid, np.where(valid, seconds, 0) * 10 ** 9 + fraction, NAT)
+
+
+def parse_iso_timestamps(values) -> np.ndarray:
+    """
+    Векторный разбор временных меток устройства вида YYYY-MM-DDTHH:MM:SS.ffff[+HHMM]
+    арифметикой над кодами символов на фиксированных позициях, без регулярных выражений
+    и построчного Python-кода. Дробная часть — не меньше одного знака (знаки сверх наносекунд
+    отбрасываются), суффикс часового пояса (+HHMM, +HH:MM или со знаком минус) необязателен
+    и отбрасывается.
+
+    Возвращает int64 — наносекунды от эпохи; некорректные значения (в том числе вне диапазона
+    datetime64[ns]) дают NaT, как pd.to_datetime(..., errors='coerce').
+    """
+    values = np.asarray(values, dtype=object)
+    result = np.empty(len(values), dtype=np.int64)
+    for start in range(0, len(values), CHUNK_ROWS):
+        chunk = values[start:start + CHUNK_ROWS]
+        result[start:start + len(chunk)] = _parse_rows(_char_rows(chunk.astype(str)))
+    return result
+
+
+def parse_csv_timestamps(data: bytes) -> np.ndarray:
+    """
+    Разбирает временные метки из первого поля каждой строки CSV прямо в байтах, не создавая
+    строк Python. Каждой строке (в том числе пустой) соответствует один элемент результата,
+    как при чтении pd.read_csv(..., skip_blank_lines=False). Формат и результат —
+    как у parse_iso_timestamps.
+    """
+    # Нули в конце, чтобы окно последней строки не выходило за границу буфера
+    buffer = np.frombuffer(data + bytes(CSV_FIELD_WIDTH), dtype=np.uint8)
+    starts = np.flatnonzero(buffer[:len(data)] == ord('\n')) + 1
+    starts = np.concatenate(([0], starts[:-1] if data.endswith(b'\n') else starts)) if data else starts
+    windows = np.lib.stride_tricks.sliding_window_view(buffer, CSV_FIELD_WIDTH)
+
+    result = np.empty(len(starts), dtype=np.int64)
+    for start in range(0, len(starts), CHUNK_ROWS):
+        chunk = starts[start:start + CHUNK_ROWS]
+        result[start:start + len(chunk)] = _parse_rows(_field_rows(windows, chunk))
+    return result
@@ -0,0 +1,255 @@
+import os
+import io
+import json
+import time
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+
+import aggregate_data
+import clean_null_values
+import columnar_store
+import interpolate_improved
+import merge_data
+import merge_manifest
+import session_catalog
+
+# --- НАСТРОЙКИ ---
+# Интервал опроса папки с архивами (в секундах)
+POLL_INTERVAL = 2.0
+# Архив считается полностью записанным, если его размер и время изменения
+# не менялись столько опросов подряд и он открывается как ZIP-архив
+SETTLE_POLLS = 2
+
+# Временные диапазоны данных каждого вложенного архива в итоговых файлах merge_data
+RANGES_FILENAME = 'watch_ranges.json'
+
+AGGREGATE_OUTPUT = os.path.join('extracted_data', 'final_merged_data.csv')
+INTERPOLATED_OUTPUT = os.path.join(interpolate_improved.OUTPUT_DIR, interpolate_improved.OUTPUT_FILENAME)
+DOWNSTREAM_OUTPUTS = [AGGREGATE_OUTPUT, INTERPOLATED_OUTPUT, clean_null_values.OUTPUT_FILE]
+
+
+def archive_key(archive: dict) -> str:
+    # Ключ сессии зависит только от содержимого вложенного архива (см. nested_archive.session_key)
+    return archive['session']
+
+
+def poll_exports(observed: dict) -> tuple[list[str], list[str]]:
+    """
+    Обновляет наблюдения за архивами в INPUT_DIR.
+    Возвращает (все найденные архивы, архивы, которые полностью записаны и открываются как ZIP).
+    """
+    try:
+        names = sorted(f for f in os.listdir(merge_data.INPUT_DIR) if f.startswith('export_') and f.endswith('.zip'))
+    except FileNotFoundError:
+        names = []
+    for name in list(observed):
+        if name not in names:
+            del observed[name]
+
+    ready = []
+    for name in names:
+        path = os.path.join(merge_data.INPUT_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature = (stat.st_size, stat.st_mtime_ns)
+        state = observed.get(name)
+        if state is None or state['signature'] != signature:
+            observed[name] = {'signature': signature, 'stable': 0, 'valid': None}
+            continue
+        state['stable'] += 1
+        if state['stable'] < SETTLE_POLLS:
+            continue
+        if state['valid'] is None:
+            state['valid'] = zipfile.is_zipfile(path)
+            if not state['valid']:
+                print(f"Архив '{name}' не является ZIP-архивом. Ждем, пока он изменится.")
+        if state['valid']:
+            ready.append(name)
+    return names, ready
+
+
+def stream_range(path: str, offset: int, length: int) -> list[str] | None:
+    """
+    Минимальная и максимальная временные метки в отрезке итогового файла.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(length)
+    if not data.strip():
+        return None
+    timestamps = pd.read_csv(io.BytesIO(data), header=None, usecols=[0], dtype=str)[0]
+    timestamps = columnar_store.parse_timestamps(timestamps).dropna()
+    if timestamps.empty:
+        return None
+    return [timestamps.min().isoformat(), timestamps.max().isoformat()]
+
+
+def load_ranges() -> dict:
+    path = os.path.join(merge_data.OUTPUT_DIR, RANGES_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_ranges(ranges: dict) -> None:
+    path = os.path.join(merge_data.OUTPUT_DIR, RANGES_FILENAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(ranges, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def update_ranges(archives: list[dict], ranges: dict) -> dict:
+    """
+    Дополняет временные диапазоны для архивов, которых еще нет в ranges.
+    Диапазон вложенного архива не зависит от его положения в итоговых файлах,
+    поэтому после вставки новых архивов пересчитываются только их диапазоны.
+    Диапазоны берутся из каталога сессий, а без него — из текста итоговых файлов.
+    """
+    catalog = session_catalog.load_catalog(merge_data.OUTPUT_DIR, merge_data.FILE_TYPES)
+    cataloged = {}
+    result = {}
+    for archive in archives:
+        key = archive_key(archive)
+        if key not in ranges:
+            ranges[key] = {}
+            for file_type, (offset, length, _) in archive['streams'].items():
+                filename = merge_data.FILE_TYPES[file_type]
+                if catalog is not None and file_type not in cataloged:
+                    cataloged[file_type] = session_catalog.time_ranges(catalog, file_type)
+                if archive['session'] in cataloged.get(file_type, {}):
+                    ranges[key][file_type] = cataloged[file_type][archive['session']]
+                else:
+                    ranges[key][file_type] = stream_range(os.path.join(merge_data.OUTPUT_DIR, filename),
+                                                          offset, length)
+        result[key] = ranges[key]
+    return result
+
+
+def read_streams(file_type: str, archives: list[dict], ranges: dict, start) -> io.BytesIO:
+    """
+    CSV с заголовком, составленный только из данных тех вложенных архивов,
+    в которых есть строки не раньше start (start=None — все данные). Порядок строк сохраняется.
+    """
+    path = os.path.join(merge_data.OUTPUT_DIR, merge_data.FILE_TYPES[file_type])
+    chunks = [(merge_data.FILE_HEADERS[file_type] + '\n').encode('utf-8')]
+    selected = [archive['streams'][file_type] for archive in archives if file_type in archive['streams']
+                and ranges[archive_key(archive)].get(file_type)
+                and (start is None or pd.Timestamp(ranges[archive_key(archive)][file_type][1]) >= start)]
+    with open(path, 'rb') as f:
+        for offset, length, _ in sorted(selected):
+            f.seek(offset)
+            chunks.append(f.read(length))
+    source = io.BytesIO(b''.join(chunks))
+    source.name = f"{path} (с {start})" if start is not None else path
+    return source
+
+
+def recompute_all() -> None:
+    """
+    Полный пересчет всех следующих за merge_data этапов (как в prepare.sh).
+    """
+    aggregate_data.main()
+    interpolate_improved.main()
+    clean_null_values.clean_null_values()
+
+
+def recompute_since(since, archives: list[dict], ranges: dict) -> None:
+    """
+    Пересчет следующих за merge_data этапов только для данных не раньше since.
+    """
+    location_path = os.path.join(merge_data.OUTPUT_DIR, merge_data.FILE_TYPES['location'])
+
+    print(f"\n[агрегация] Пересчет интервалов начиная с {since}")
+    aggregate_data.update_merged_data(
+        AGGREGATE_OUTPUT, location_path,
+        lambda start: (read_streams('motion', archives, ranges, start),
+                       read_streams('acceleration', archives, ranges, start)),
+        since)
+
+    print(f"\n[интерполяция] Пересчет начиная с {since}")
+    start = interpolate_improved.update_interpolation(
+        INTERPOLATED_OUTPUT, location_path,
+        lambda start: read_streams('acceleration', archives, ranges, start),
+        since)
+    if start is False:
+        return
+
+    print("\n[очистка] Обновление итогового файла")
+    if start is None:
+        clean_null_values.clean_null_values()
+    else:
+        clean_null_values.update_cleaned_values(start)
+
+
+def process_exports(top_level_zips: list[str], ranges: dict) -> dict:
+    """
+    Загружает новые архивы и пересчитывает результаты для затронутого ими диапазона времени.
+    Возвращает обновленные временные диапазоны архивов.
+    """
+    started = time.monotonic()
+    manifest = merge_manifest.load_manifest(merge_data.OUTPUT_DIR)
+    known = {archive_key(archive) for archive in manifest['archives']} if manifest else set()
+
+    archives, rebuilt = merge_data.update_outputs(top_level_zips)
+    ranges = update_ranges(archives, ranges)
+    save_ranges(ranges)
+    new_archives = [archive for archive in archives if archive_key(archive) not in known]
+
+    if rebuilt or any(not os.path.exists(path) for path in DOWNSTREAM_OUTPUTS):
+        print("\nПолный пересчет результатов.")
+        os.makedirs(os.path.dirname(AGGREGATE_OUTPUT), exist_ok=True)
+        recompute_all()
+    elif new_archives:
+        starts = [pd.Timestamp(time_range[0]) for archive in new_archives
+                  for time_range in ranges[archive_key(archive)].values() if time_range]
+        if starts:
+            recompute_since(min(starts), archives, ranges)
+    else:
+        return ranges
+
+    print(f"\nРезультаты обновлены за {time.monotonic() - started:.1f} с.")
+    return ranges
+
+
+def main():
+    """
+    Режим наблюдения: следит за папкой INPUT_DIR и по мере появления новых архивов
+    дописывает их в итоговые файлы и обновляет результаты следующих этапов.
+    """
+    print("=== РЕЖИМ НАБЛЮДЕНИЯ ЗА ПАПКОЙ С АРХИВАМИ ===")
+    print(f"Время запуска: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Папка: '{merge_data.INPUT_DIR}', интервал опроса: {POLL_INTERVAL} с. Остановка — Ctrl+C.")
+
+    os.makedirs(merge_data.OUTPUT_DIR, exist_ok=True)
+    observed = {}
+    ranges = load_ranges()
+    last_attempt = None
+
+    try:
+        while True:
+            names, ready = poll_exports(observed)
+            settled = all(observed[name]['stable'] >= SETTLE_POLLS for name in names if name in observed)
+            attempt = frozenset((name, observed[name]['signature']) for name in ready)
+            if ready and settled and attempt != last_attempt:
+                manifest = merge_manifest.load_manifest(merge_data.OUTPUT_DIR)
+                known_exports = set(manifest['exports']) if manifest else set()
+                # При первом проходе результаты сверяются с манифестом, дальше — только при изменениях
+                if last_attempt is None or set(ready) != known_exports:
+                    try:
+                        ranges = process_exports(ready, ranges)
+                    except Exception as e:
+                        print(f"Произошла непредвиденная ошибка при обновлении: {e}")
+                last_attempt = attempt
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        print("\nРежим наблюдения остановлен.")
+
+
+if __name__ == "__main__":
+    main()